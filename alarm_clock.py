@@ -1,31 +1,104 @@
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
-import pygame
 import threading
+import itertools
 import random
 from datetime import datetime, timedelta
 import time
 import math
-import uuid
-import json
 import os
-try:
-    import pyttsx3
-    TTS_AVAILABLE = True
-except ImportError:
-    TTS_AVAILABLE = False
+import hashlib
+import queue
+import importlib.util
+from contextlib import contextmanager
+from collections import deque
+
+from alarm_engine import Alarm, AlarmEngine, Recurrence, import_pygame
+from pose_detector import POSE_AVAILABLE, PoseHoldSession, PoseHoldState, PoseResourcePool
+
+# pyttsx3 import khá lâu nên chỉ được import khi cần lần đầu
+# (xem AlarmClock.create_tts_engine) để cửa sổ hiện nhanh hơn
+TTS_AVAILABLE = importlib.util.find_spec('pyttsx3') is not None
+
+class StartupProfiler:
+    """Đo thời gian khởi động theo từng giai đoạn
+
+    Các giai đoạn có thể chạy ở thread nền (khởi tạo âm thanh, TTS) nên thời
+    điểm bắt đầu được tính từ lúc tạo profiler.
+    """
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.phases = []  # [(tên, bắt đầu (ms), thời lượng (ms))]
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def phase(self, name):
+        """Đo một giai đoạn: with profiler.phase('setup_ui'): ..."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._add(name, started, time.perf_counter())
+
+    def mark(self, name):
+        """Ghi lại một mốc (ví dụ khung hình đầu tiên)"""
+        now = time.perf_counter()
+        self._add(name, now, now)
+
+    def _add(self, name, started, finished):
+        with self._lock:
+            self.phases.append((name, (started - self.start) * 1000, (finished - started) * 1000))
+
+    def report(self):
+        """Bảng thời gian khởi động, mỗi giai đoạn một dòng"""
+        with self._lock:
+            phases = sorted(self.phases, key=lambda phase: phase[1])
+        lines = ["Thời gian khởi động:", f"  {'giai đoạn':<16} {'bắt đầu':>10} {'thời lượng':>10}"]
+        for name, started, duration in phases:
+            lines.append(f"  {name:<16} {started:8.1f}ms {duration:8.1f}ms")
+        return "\n".join(lines)
 
 class AnalogClock:
-    def __init__(self, parent, size=200):
-        self.size = size
-        self.center_x = size // 2
-        self.center_y = size // 2
-        self.radius = size // 2 - 20
+    # Kéo kim: chỉ vẽ tối đa một lần mỗi khung hình (~60 FPS)
+    DRAG_FRAME_MS = 16
+    
+    # Kích thước thiết kế: các khoảng cách, độ dày nét và font được viết cho
+    # đồng hồ rộng DESIGN_SIZE px ở 96 DPI rồi nhân theo tỉ lệ thực tế
+    DESIGN_SIZE = 200
+    BASE_DPI = 96
+    
+    # Vector đơn vị (cos, sin) tính sẵn một lần, 12 giờ ở trên
+    # Vạch phút / kim phút: 60 vị trí, mỗi vị trí 6 độ
+    MINUTE_VECTORS = tuple(
+        (math.cos(math.radians(i * 6 - 90)), math.sin(math.radians(i * 6 - 90)))
+        for i in range(60)
+    )
+    # Kim giờ: 12 * 60 vị trí (giờ * 60 + phút), mỗi vị trí 0.5 độ
+    HOUR_VECTORS = tuple(
+        (math.cos(math.radians(i * 0.5 - 90)), math.sin(math.radians(i * 0.5 - 90)))
+        for i in range(720)
+    )
+    
+    def __init__(self, parent, size=200, snap_minutes=1, max_size=None):
+        """
+        Args:
+            size: Kích thước nhỏ nhất (px ở 96 DPI), được nhân theo DPI màn hình
+            snap_minutes: Làm tròn kim phút khi kéo (ví dụ 5 phút)
+            max_size: Kích thước lớn nhất khi giãn theo khung chứa (mặc định 2 * size)
+        """
+        self.snap_minutes = snap_minutes
         
-        # Canvas để vẽ đồng hồ
+        # Canvas để vẽ đồng hồ, giãn theo chiều ngang của khung chứa
         self.canvas = tk.Canvas(parent, width=size, height=size, 
                                 bg="white", highlightthickness=0)
-        self.canvas.pack()
+        self.canvas.pack(fill=tk.X, expand=True)
+        
+        # Quy đổi kích thước theo DPI màn hình
+        dpi_scale = self.canvas.winfo_fpixels('1i') / self.BASE_DPI
+        self.min_size = round(size * dpi_scale)
+        self.max_size = round((max_size or 2 * size) * dpi_scale)
+        self.canvas.configure(width=self.min_size, height=self.min_size)
+        self.set_geometry(self.min_size, self.min_size)
         
         # Giờ và phút hiện tại (12h format)
         self.hour_12 = 7
@@ -35,87 +108,147 @@ class AnalogClock:
         # Trạng thái kéo kim
         self.dragging = False
         self.drag_type = None  # 'hour' hoặc 'minute'
+        self._drag_pointer = None  # Vị trí chuột mới nhất chưa được vẽ
+        self._drag_job = None  # after() của khung hình kế tiếp
+        self._last_frame = 0.0  # time.monotonic() của lần vẽ gần nhất
+        
+        # Cache vẽ: hình học của mặt số đang hiển thị và trạng thái kim đã vẽ
+        self._dial_geometry = None
+        self._hands_state = None
         
         # Bind events
         self.canvas.bind("<Button-1>", self.on_click)
         self.canvas.bind("<B1-Motion>", self.on_drag)
         self.canvas.bind("<ButtonRelease-1>", self.on_release)
+        self.canvas.bind("<Configure>", self.on_resize)
         
         self.draw_clock()
+    
+    def set_geometry(self, width, size):
+        """Tính lại tâm, bán kính và tỉ lệ cho đồng hồ cạnh size trên canvas rộng width"""
+        self.size = size
+        self.scale = size / self.DESIGN_SIZE
+        self.center_x = width / 2
+        self.center_y = size / 2
+        self.radius = size / 2 - 20 * self.scale
+    
+    def scaled(self, value):
+        """Độ dài/độ dày theo kích thước thiết kế -> px thực tế (ít nhất 1)"""
+        return max(1, round(value * self.scale))
+    
+    def font(self, points):
+        """Font Arial đậm, cỡ chữ tính bằng px để co giãn theo đồng hồ"""
+        return ("Arial", -self.scaled(points * self.BASE_DPI / 72), "bold")
+    
+    def on_resize(self, event):
+        """Co giãn đồng hồ theo chiều rộng canvas (chỉ tính lại khi kích thước đổi)"""
+        size = max(self.min_size, min(event.width, self.max_size))
+        if (event.width / 2, size) == (self.center_x, self.size):
+            return
+        self.set_geometry(event.width, size)
+        if event.height != size:
+            self.canvas.configure(height=size)
+        self.draw_clock()
         
     def draw_clock(self):
+        """Vẽ đồng hồ
+
+        Mặt số (vòng tròn, số giờ, vạch phút) chỉ được vẽ lại khi kích thước
+        thay đổi; kim và dòng giờ dạng số được cập nhật tại chỗ bằng
+        coords/itemconfig nên mỗi lần kéo kim chỉ tốn vài thao tác trên canvas.
+        Tọa độ kim lấy từ bảng vector đơn vị, không cần tính lượng giác.
+        """
+        geometry = (self.center_x, self.size)
+        if self._dial_geometry != geometry:
+            self.draw_dial()
+            self._dial_geometry = geometry
+        
+        state = (self.hour_12, self.minute, self.is_am)
+        if state == self._hands_state:
+            return
+        self._hands_state = state
+        
+        # Kim giờ
+        hour_cos, hour_sin = self.HOUR_VECTORS[(self.hour_12 % 12) * 60 + self.minute]
+        hour_length = self.radius * 0.5
+        self.canvas.coords(
+            self.hour_hand, self.center_x, self.center_y,
+            self.center_x + hour_length * hour_cos, self.center_y + hour_length * hour_sin
+        )
+        
+        # Kim phút
+        minute_cos, minute_sin = self.MINUTE_VECTORS[self.minute]
+        minute_length = self.radius * 0.7
+        self.canvas.coords(
+            self.minute_hand, self.center_x, self.center_y,
+            self.center_x + minute_length * minute_cos, self.center_y + minute_length * minute_sin
+        )
+        
+        # Thời gian dạng số với AM/PM
+        am_pm = "AM" if self.is_am else "PM"
+        self.canvas.itemconfig(self.time_text, text=f"{self.hour_12}:{self.minute:02d} {am_pm}")
+    
+    def draw_dial(self):
+        """Vẽ lại toàn bộ canvas: mặt số tĩnh và các item của kim (chưa có tọa độ)"""
         self.canvas.delete("all")
+        self._hands_state = None
+        cx, cy, radius, scaled = self.center_x, self.center_y, self.radius, self.scaled
         
         # Vẽ vòng tròn ngoài
         self.canvas.create_oval(
-            self.center_x - self.radius,
-            self.center_y - self.radius,
-            self.center_x + self.radius,
-            self.center_y + self.radius,
-            outline="#333", width=3, fill="#f8f8f8"
+            cx - radius, cy - radius, cx + radius, cy + radius,
+            outline="#333", width=scaled(3), fill="#f8f8f8", tags="dial"
         )
         
         # Vẽ các số giờ
+        numeral_radius = radius - 25 * self.scale
+        numeral_font = self.font(14)
         for i in range(1, 13):
-            angle = math.radians(i * 30 - 90)  # 12 giờ ở trên
-            x = self.center_x + (self.radius - 25) * math.cos(angle)
-            y = self.center_y + (self.radius - 25) * math.sin(angle)
-            self.canvas.create_text(x, y, text=str(i), 
-                                   font=("Arial", 14, "bold"), fill="#333")
+            cos, sin = self.MINUTE_VECTORS[i * 5 % 60]
+            self.canvas.create_text(cx + numeral_radius * cos, cy + numeral_radius * sin,
+                                    text=str(i), font=numeral_font, fill="#333", tags="dial")
         
         # Vẽ các vạch phút
-        for i in range(60):
-            angle = math.radians(i * 6 - 90)
+        for i, (cos, sin) in enumerate(self.MINUTE_VECTORS):
             if i % 5 == 0:
                 # Vạch lớn cho giờ
-                start_radius = self.radius - 10
-                end_radius = self.radius - 5
+                start_radius = radius - 10 * self.scale
+                end_radius = radius - 5 * self.scale
             else:
                 # Vạch nhỏ cho phút
-                start_radius = self.radius - 5
-                end_radius = self.radius - 2
-            
-            x1 = self.center_x + start_radius * math.cos(angle)
-            y1 = self.center_y + start_radius * math.sin(angle)
-            x2 = self.center_x + end_radius * math.cos(angle)
-            y2 = self.center_y + end_radius * math.sin(angle)
-            self.canvas.create_line(x1, y1, x2, y2, fill="#666", width=1)
-        
-        # Vẽ kim giờ
-        hour_angle = math.radians(self.hour_12 * 30 + self.minute * 0.5 - 90)
-        hour_length = self.radius * 0.5
-        hour_x = self.center_x + hour_length * math.cos(hour_angle)
-        hour_y = self.center_y + hour_length * math.sin(hour_angle)
-        self.canvas.create_line(
-            self.center_x, self.center_y, hour_x, hour_y,
-            fill="#333", width=4, arrow=tk.LAST, arrowshape=(10, 12, 3),
+                start_radius = radius - 5 * self.scale
+                end_radius = radius - 2 * self.scale
+            self.canvas.create_line(
+                cx + start_radius * cos, cy + start_radius * sin,
+                cx + end_radius * cos, cy + end_radius * sin,
+                fill="#666", width=scaled(1), tags="dial"
+            )
+        
+        # Kim giờ và kim phút (tọa độ được đặt trong draw_clock)
+        self.hour_hand = self.canvas.create_line(
+            0, 0, 0, 0,
+            fill="#333", width=scaled(4), arrow=tk.LAST,
+            arrowshape=(scaled(10), scaled(12), scaled(3)),
             tags="hour_hand"
         )
-        
-        # Vẽ kim phút
-        minute_angle = math.radians(self.minute * 6 - 90)
-        minute_length = self.radius * 0.7
-        minute_x = self.center_x + minute_length * math.cos(minute_angle)
-        minute_y = self.center_y + minute_length * math.sin(minute_angle)
-        self.canvas.create_line(
-            self.center_x, self.center_y, minute_x, minute_y,
-            fill="#d32f2f", width=3, arrow=tk.LAST, arrowshape=(12, 15, 3),
+        self.minute_hand = self.canvas.create_line(
+            0, 0, 0, 0,
+            fill="#d32f2f", width=scaled(3), arrow=tk.LAST,
+            arrowshape=(scaled(12), scaled(15), scaled(3)),
             tags="minute_hand"
         )
         
-        # Vẽ tâm đồng hồ
+        # Vẽ tâm đồng hồ (nằm trên các kim)
+        dot = 8 * self.scale
         self.canvas.create_oval(
-            self.center_x - 8, self.center_y - 8,
-            self.center_x + 8, self.center_y + 8,
-            fill="#333", outline="#333"
+            cx - dot, cy - dot, cx + dot, cy + dot,
+            fill="#333", outline="#333", tags="dial"
         )
         
-        # Hiển thị thời gian dạng số với AM/PM
-        am_pm = "AM" if self.is_am else "PM"
-        time_str = f"{self.hour_12}:{self.minute:02d} {am_pm}"
-        self.canvas.create_text(
-            self.center_x, self.center_y + self.radius + 20,
-            text=time_str, font=("Arial", 14, "bold"), fill="#333"
+        # Thời gian dạng số
+        self.time_text = self.canvas.create_text(
+            cx, cy + radius + 20 * self.scale,
+            font=self.font(14), fill="#333"
         )
         
     def on_click(self, event):
@@ -123,7 +256,7 @@ class AnalogClock:
         dy = event.y - self.center_y
         distance = math.sqrt(dx*dx + dy*dy)
         
-        if distance < 10:  # Click vào tâm
+        if distance < 10 * self.scale:  # Click vào tâm
             return
             
         angle = math.degrees(math.atan2(dy, dx)) + 90
@@ -151,17 +284,44 @@ class AnalogClock:
             self.drag_type = 'hour'
             
     def on_drag(self, event):
+        """Ghi nhận vị trí chuột; việc vẽ được gộp lại theo từng khung hình
+
+        Chuột/touchpad tần số cao có thể sinh ra nhiều sự kiện hơn Tk vẽ kịp,
+        nên chỉ giữ vị trí mới nhất và vẽ tối đa một lần mỗi DRAG_FRAME_MS.
+        """
         if not self.dragging:
             return
-            
-        dx = event.x - self.center_x
-        dy = event.y - self.center_y
+        
+        self._drag_pointer = (event.x, event.y)
+        if self._drag_job is None:
+            elapsed_ms = (time.monotonic() - self._last_frame) * 1000
+            if elapsed_ms >= self.DRAG_FRAME_MS:
+                # Đã qua một khung hình: vẽ ngay khi Tk rảnh
+                self._drag_job = self.canvas.after_idle(self.flush_drag)
+            else:
+                self._drag_job = self.canvas.after(
+                    int(self.DRAG_FRAME_MS - elapsed_ms) + 1, self.flush_drag)
+    
+    def flush_drag(self):
+        """Cập nhật kim theo vị trí chuột mới nhất"""
+        self._drag_job = None
+        if self._drag_pointer is None:
+            return
+        x, y = self._drag_pointer
+        self._drag_pointer = None
+        self._last_frame = time.monotonic()
+        
+        dx = x - self.center_x
+        dy = y - self.center_y
         angle = math.degrees(math.atan2(dy, dx)) + 90
         if angle < 0:
             angle += 360
             
         if self.drag_type == 'minute':
-            self.minute = int(angle / 6) % 60
+            if self.snap_minutes > 1:
+                self.minute = int(round(angle / 6 / self.snap_minutes)) * self.snap_minutes % 60
+            else:
+                self.minute = int(angle / 6) % 60
         elif self.drag_type == 'hour':
             self.hour_12 = int(angle / 30) % 12
             if self.hour_12 == 0:
@@ -170,6 +330,10 @@ class AnalogClock:
         self.draw_clock()
         
     def on_release(self, event):
+        # Vẽ nốt vị trí cuối cùng trước khi thả kim
+        if self._drag_job is not None:
+            self.canvas.after_cancel(self._drag_job)
+        self.flush_drag()
         self.dragging = False
         self.drag_type = None
         
@@ -203,49 +367,250 @@ class AnalogClock:
         self.is_am = not self.is_am
         self.draw_clock()
 
-class AlarmClock:
+class TimeSpeaker:
+    """Đọc giờ bằng giọng nói trên một thread worker duy nhất
+
+    pyttsx3 engine được tạo (engine_factory) và chỉ được dùng từ thread worker nên các lần bấm liên tục
+    không tranh nhau engine; yêu cầu cũ chưa kịp đọc sẽ bị thay bằng yêu cầu
+    mới nhất. Các cụm từ cố định ("Bây giờ là", "N giờ", "N phút", "N giây")
+    được tổng hợp trước ra file WAV trong cache_dir và giải mã vào bộ nhớ;
+    khi đủ cache, câu đọc giờ được ghép từ các cụm này và phát ngay qua
+    mixer. Trong lúc cache đang được tạo, câu được đọc trực tiếp bằng engine.
+    """
+    PREFIX = "Bây giờ là"
+
+    def __init__(self, engine_factory, audio_fn, cache_dir, on_error=None):
+        self.engine_factory = engine_factory
+        self.audio_fn = audio_fn  # Trả về AudioEngine (khởi tạo mixer nếu cần)
+        self.cache_dir = cache_dir
+        self.on_error = on_error
+        self.engine = None
+        self.error = None  # Lỗi khi tạo engine (TTS không dùng được)
+        self._ready = threading.Event()
+        self._sounds = {}  # {cụm từ: pygame.mixer.Sound}
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    @classmethod
+    def fragments(cls, now):
+        """Các cụm từ tạo nên câu đọc giờ"""
+        return [cls.PREFIX, f"{now.hour} giờ", f"{now.minute} phút", f"{now.second} giây"]
+
+    @classmethod
+    def all_fragments(cls):
+        return ([cls.PREFIX]
+                + [f"{hour} giờ" for hour in range(24)]
+                + [f"{minute} phút" for minute in range(60)]
+                + [f"{second} giây" for second in range(60)])
+
+    def speak_time(self, now=None):
+        """Đọc giờ (mặc định là giờ hiện tại), không chặn thread gọi"""
+        fragments = self.fragments(now or datetime.now())
+        sounds = [self._sounds.get(fragment) for fragment in fragments]
+        if all(sounds):
+            # Ghép dữ liệu PCM (cùng định dạng mixer) thành một Sound và phát ngay
+            raw = b"".join(sound.get_raw() for sound in sounds)
+            self.audio_fn().play_voice(import_pygame().mixer.Sound(buffer=raw))
+            return
+
+        # Chỉ giữ yêu cầu mới nhất
+        while True:
+            try:
+                self._queue.get_nowait()
+            except queue.Empty:
+                break
+        self._queue.put(" ".join(fragments))
+
+    def close(self):
+        self._queue.put(None)
+
+    def wait_ready(self, timeout=None):
+        """Chờ đến khi engine đã được tạo (hoặc tạo thất bại)"""
+        return self._ready.wait(timeout)
+
+    def _cache_path(self, text):
+        voice = self.engine.getProperty('voice')
+        rate = self.engine.getProperty('rate')
+        key = hashlib.sha1(f"{voice}|{rate}|{text}".encode('utf-8')).hexdigest()
+        return os.path.join(self.cache_dir, f"{key[:16]}.wav")
+
+    def _render(self, text):
+        """Tổng hợp cụm từ ra file WAV (nếu chưa có) rồi giải mã vào bộ nhớ"""
+        path = self._cache_path(text)
+        if not os.path.exists(path):
+            os.makedirs(self.cache_dir, exist_ok=True)
+            tmp_path = f"{path[:-len('.wav')]}.tmp.wav"
+            self.engine.save_to_file(text, tmp_path)
+            self.engine.runAndWait()
+            os.replace(tmp_path, path)
+        self.audio_fn()  # Sound cần mixer đã được khởi tạo
+        self._sounds[text] = import_pygame().mixer.Sound(path)
+
+    def _run(self):
+        try:
+            self.engine = self.engine_factory()
+        except Exception as e:
+            print(f"Không thể khởi tạo TTS engine: {e}")
+            self.error = e
+        self._ready.set()
+        pending = deque(self.all_fragments() if self.engine else ())
+        while True:
+            # Tạo cache từng cụm một khi rảnh, ưu tiên yêu cầu đọc giờ
+            try:
+                text = self._queue.get(block=not pending)
+            except queue.Empty:
+                try:
+                    self._render(pending.popleft())
+                except Exception as e:
+                    print(f"Không thể tạo cache giọng nói, đọc trực tiếp bằng engine: {e}")
+                    pending.clear()
+                continue
+
+            if text is None:
+                return
+            try:
+                if self.error:
+                    raise self.error
+                self.engine.say(text)
+                self.engine.runAndWait()
+            except Exception as e:
+                print(f"Không thể đọc thời gian: {e}")
+                if self.on_error:
+                    self.on_error(e)
+
+class ClockService:
+    """Nguồn tick duy nhất cho mọi phần hiển thị giờ
+
+    Mỗi tick được hẹn ngay sau ranh giới giây thực tế (tính lại từ đồng hồ
+    hệ thống ở mỗi tick) thay vì cộng dồn after(1000), nên thời gian chạy
+    callback không làm giây hiển thị bị trôi, nhảy hay lặp lại. Khi cửa sổ
+    bị thu nhỏ hoặc ẩn, các subscriber giao diện không được gọi; lần hiện
+    lại sẽ vẽ ngay giờ hiện tại.
+    """
+    # Hẹn tick trễ hơn ranh giới giây một chút để chắc chắn đã sang giây mới
+    BOUNDARY_MARGIN_MS = 5
+
     def __init__(self, root):
         self.root = root
+        self._subscribers = {}  # {token: (callback, visual)}
+        self._counter = itertools.count()
+        self._job = None
+        self._last_second = None  # Giây đã được hiển thị gần nhất
+
+    def subscribe(self, callback, visual=True):
+        """Gọi callback(now) mỗi giây, trả về token để hủy đăng ký
+
+        visual=False nếu callback vẫn cần chạy khi cửa sổ bị ẩn.
+        """
+        token = next(self._counter)
+        self._subscribers[token] = (callback, visual)
+        return token
+
+    def unsubscribe(self, token):
+        self._subscribers.pop(token, None)
+
+    def start(self):
+        self.root.bind("<Map>", self._on_map, add="+")
+        self._tick()
+
+    def stop(self):
+        if self._job is not None:
+            self.root.after_cancel(self._job)
+            self._job = None
+
+    def is_visible(self):
+        """Cửa sổ có đang hiển thị không (không bị thu nhỏ/ẩn)"""
+        return self.root.state() not in ('iconic', 'withdrawn')
+
+    def _on_map(self, event):
+        # Cửa sổ vừa hiện lại: vẽ ngay thay vì chờ tick kế tiếp
+        if event.widget is self.root:
+            self.stop()
+            self._last_second = None
+            self._tick()
+
+    def _tick(self):
+        self._job = None
+        now = datetime.now()
+        second = now.replace(microsecond=0)
+        # Tick đến sớm (vẫn trong giây đã hiển thị) thì chỉ hẹn lại
+        if second != self._last_second:
+            visible = self.is_visible()
+            if visible:
+                self._last_second = second
+            for callback, visual in list(self._subscribers.values()):
+                if visual and not visible:
+                    continue
+                try:
+                    callback(now)
+                except Exception as e:
+                    print(f"Lỗi trong tick đồng hồ: {e}")
+
+        # Thời gian còn lại đến ranh giới giây tiếp theo
+        delay = 1000 - now.microsecond // 1000 + self.BOUNDARY_MARGIN_MS
+        self._job = self.root.after(delay, self._tick)
+
+class AlarmClock:
+    # Danh sách ảo hóa: chỉ giữ widget cho các dòng đang hiển thị
+    VIRTUAL_LIST_THRESHOLD = 200  # Bật chế độ ảo hóa khi vượt quá số báo thức này
+    VIRTUAL_ROW_HEIGHT = 130  # Chiều cao cố định của mỗi dòng (px)
+    VIRTUAL_OVERSCAN = 3  # Số dòng dự phòng phía trên/dưới vùng nhìn thấy
+    
+    # Các kiểu lặp lại trong form: (key, nhãn hiển thị)
+    REPEAT_MODES = (
+        ('daily', "Hằng ngày"),
+        ('weekly', "Các ngày trong tuần"),
+        ('days', "Mỗi N ngày"),
+        ('hours', "Mỗi N giờ"),
+        ('rrule', "Tùy chỉnh (RRULE)"),
+    )
+    
+    # Tắt báo thức bằng cách ngồi thẳng trước camera
+    POSE_CAMERA_ID = 0
+    POSE_WARMUP_LEAD = 30  # Mở camera và tải model bao nhiêu giây trước khi kêu
+    POSE_IDLE_TIMEOUT = 60  # Giải phóng camera nếu không dùng sau chừng này giây (tính thêm lead)
+    POSE_POOL_IDLE_TIMEOUT = 30  # Giữ model/camera đã trả lại để session sau dùng ngay
+    
+    def __init__(self, root, startup=None):
+        self.root = root
+        self.startup = startup or StartupProfiler()
         self.root.title("Báo Thức Python")
         self.root.geometry("700x600")
         self.root.minsize(600, 500)
         self.root.resizable(True, True)
         
-        # Khởi tạo pygame mixer
-        pygame.mixer.init()
-        
-        # Khởi tạo text-to-speech engine
-        self.tts_engine = None
-        if TTS_AVAILABLE:
-            try:
-                self.tts_engine = pyttsx3.init()
-                # Thiết lập tốc độ đọc
-                self.tts_engine.setProperty('rate', 150)
-                # Tự động chọn voice phù hợp (ưu tiên tiếng Việt nếu có)
-                voices = self.tts_engine.getProperty('voices')
-                if voices:
-                    # Tìm voice tiếng Việt hoặc dùng voice đầu tiên
-                    for voice in voices:
-                        if 'vietnamese' in voice.languages or 'vi' in str(voice.languages).lower():
-                            self.tts_engine.setProperty('voice', voice.id)
-                            break
-                    else:
-                        # Nếu không tìm thấy, dùng voice đầu tiên
-                        self.tts_engine.setProperty('voice', voices[0].id)
-            except Exception as e:
-                print(f"Không thể khởi tạo TTS engine: {e}")
-                self.tts_engine = None
-        
-        # Quản lý nhiều báo thức
-        self.alarms = {}  # {alarm_id: alarm_data}
+        # pygame mixer và TTS engine được khởi tạo ở thread nền sau khung hình
+        # đầu tiên (hoặc ngay khi cần dùng lần đầu), xem background_init
+        self.speaker = None  # TimeSpeaker, tạo khi TTS được dùng lần đầu
+        self._speaker_lock = threading.Lock()
+        self._first_frame_done = False
         
-        # File lưu trữ dữ liệu
+        # Lõi báo thức (dữ liệu, lưu trữ, lập lịch, phát nhạc); callback từ
+        # thread kiểm tra được chuyển sang Tk thread bằng root.after
         self.data_file = "alarms_data.json"
-        
-        # Trạng thái báo thức đang kêu
-        self.active_alarm_id = None
-        self.is_alarm_playing = False
-        self.alarm_thread = None
+        self.engine = AlarmEngine(
+            self.data_file,
+            dispatch=lambda fn, *args: self.root.after(0, fn, *args),
+            on_warmup=self.on_alarm_warmup if POSE_AVAILABLE else None,
+            warmup_lead=self.POSE_WARMUP_LEAD,
+            on_fire=self.on_alarm_fired,
+            on_dismiss=self.on_alarm_dismissed,
+            on_change=self.on_alarm_changed,
+            on_error=lambda message: messagebox.showerror("Lỗi", message)
+        )
+        self.alarms = self.engine.alarms  # {alarm_id: Alarm}, chỉ đọc
+        self.active_alarms = self.engine.active_alarms  # Các báo thức đang kêu
+        
+        # Thử thách toán học của các báo thức đang kêu
+        self.challenge_queue = deque()  # alarm_id chờ hiển thị thử thách toán học
+        self.challenge_alarm_id = None  # Báo thức của cửa sổ giải toán đang mở
+        self.challenge_window = None
+        # Nhận diện tư thế chạy ở thread của PoseHoldSession, chỉ tiến độ
+        # được chuyển về Tk thread (xem on_pose_progress)
+        self.pose_session = None
+        self.pose_pool = PoseResourcePool(idle_timeout=self.POSE_POOL_IDLE_TIMEOUT)
+        self.pose_widgets = None  # Widget của cửa sổ ngồi thẳng đang mở
         
         # Trạng thái view hiện tại
         self.current_view = 'list'  # 'list' hoặc 'detail'
@@ -253,15 +618,96 @@ class AlarmClock:
         self.sleep_cycle_result = None  # Kết quả tính toán chu kỳ ngủ
         
         # Load dữ liệu từ file
-        self.load_alarms()
-        
-        self.setup_ui()
-        self.update_time()
-        self.start_alarm_checker()
+        with self.startup.phase('load_alarms'):
+            self.engine.load()
+        
+        with self.startup.phase('setup_ui'):
+            self.setup_ui()
+        self.root.bind("<Map>", self.on_first_map, add="+")
+        
+        # Đồng hồ hiển thị: một nguồn tick căn theo ranh giới giây
+        self.clock = ClockService(self.root)
+        self.clock.subscribe(self.update_time)
+        self.clock.start()
+        with self.startup.phase('schedule'):
+            self.engine.start()
+        # Nhãn báo thức tiếp theo đọc từ scheduler nên chỉ cập nhật sau khi đã lên lịch
+        self.update_next_alarm_label()
         
         # Lưu dữ liệu khi đóng ứng dụng
         self.root.protocol("WM_DELETE_WINDOW", self.on_closing)
     
+    @property
+    def audio(self):
+        """AudioEngine của lõi báo thức (khởi tạo pygame mixer ở lần dùng đầu tiên)"""
+        return self.engine.audio
+    
+    def create_tts_engine(self):
+        """Tạo và cấu hình pyttsx3 engine (chạy trên thread worker của TimeSpeaker)"""
+        with self.startup.phase('tts'):
+            import pyttsx3
+            engine = pyttsx3.init()
+            # Thiết lập tốc độ đọc
+            engine.setProperty('rate', 150)
+            # Tự động chọn voice phù hợp (ưu tiên tiếng Việt nếu có)
+            voices = engine.getProperty('voices')
+            if voices:
+                # Tìm voice tiếng Việt hoặc dùng voice đầu tiên
+                for voice in voices:
+                    if 'vietnamese' in voice.languages or 'vi' in str(voice.languages).lower():
+                        engine.setProperty('voice', voice.id)
+                        break
+                else:
+                    # Nếu không tìm thấy, dùng voice đầu tiên
+                    engine.setProperty('voice', voices[0].id)
+        return engine
+    
+    def get_speaker(self):
+        """TimeSpeaker (tạo ở lần dùng đầu tiên), None nếu chưa cài pyttsx3"""
+        if not TTS_AVAILABLE:
+            return None
+        with self._speaker_lock:
+            if self.speaker is None:
+                # Worker đọc giờ dùng riêng engine, cache giọng nói đặt cạnh file dữ liệu
+                self.speaker = TimeSpeaker(
+                    self.create_tts_engine, lambda: self.audio, cache_dir="tts_cache",
+                    on_error=lambda e: self.root.after(
+                        0, lambda: messagebox.showerror("Lỗi", f"Không thể đọc thời gian: {e}"))
+                )
+        return self.speaker
+    
+    def on_first_map(self, event):
+        """Cửa sổ hiện lần đầu: ghi nhận khung hình đầu tiên rồi khởi tạo phần còn lại"""
+        if event.widget is not self.root or self._first_frame_done:
+            return
+        self._first_frame_done = True
+        # after_idle chạy sau khi Tk đã vẽ xong các widget đang chờ
+        self.root.after_idle(self.on_first_frame)
+    
+    def on_first_frame(self):
+        self.startup.mark('first_frame')
+        if os.environ.get('ALARM_STARTUP_BENCH'):
+            # Dòng đánh dấu cho bench_startup.py đo thời gian đến khung hình đầu tiên
+            print(f"FIRST_FRAME {self.startup.phases[-1][1]:.1f}", flush=True)
+        threading.Thread(target=self.background_init, daemon=True).start()
+    
+    def background_init(self):
+        """Khởi tạo âm thanh và TTS ở thread nền để không làm chậm cửa sổ"""
+        try:
+            with self.startup.phase('audio'):
+                self.audio
+        except Exception as e:
+            print(f"Không thể khởi tạo âm thanh: {e}")
+        speaker = self.get_speaker()
+        if speaker:
+            speaker.wait_ready()
+        bench = os.environ.get('ALARM_STARTUP_BENCH')
+        if bench or os.environ.get('ALARM_STARTUP_REPORT'):
+            print(self.startup.report(), flush=True)
+        if bench:
+            # Chế độ đo khởi động: thoát ngay sau khi khởi tạo xong
+            self.root.after(0, self.on_closing)
+    
     def setup_ui(self):
         # Frame container chính
         self.main_container = ttk.Frame(self.root)
@@ -288,6 +734,11 @@ class AlarmClock:
                                     font=("Arial", 28, "bold"))
         self.time_label.pack(pady=10)
         
+        # Báo thức sắp kêu tiếp theo
+        self.next_alarm_label = ttk.Label(self.list_view_frame, text="", 
+                                          font=("Arial", 10), foreground="blue")
+        self.next_alarm_label.pack()
+        
         # Frame chứa các nút
         button_frame = ttk.Frame(self.list_view_frame)
         button_frame.pack(pady=10)
@@ -297,8 +748,8 @@ class AlarmClock:
                                command=self.add_new_alarm)
         add_button.pack(side=tk.LEFT, padx=5)
         
-        # Nút đọc thời gian (chỉ hiển thị nếu TTS khả dụng)
-        if self.tts_engine:
+        # Nút đọc thời gian (chỉ hiển thị nếu đã cài pyttsx3)
+        if TTS_AVAILABLE:
             speak_button = ttk.Button(button_frame, text="🔊 Đọc Thời Gian", 
                                      command=self.read_current_time)
             speak_button.pack(side=tk.LEFT, padx=5)
@@ -313,16 +764,28 @@ class AlarmClock:
         self.list_scrollable_frame = ttk.Frame(self.list_canvas)
         
         def configure_list_scroll(event=None):
+            if self.virtual_mode:
+                return
             self.list_canvas.configure(scrollregion=self.list_canvas.bbox("all"))
         
         self.list_scrollable_frame.bind("<Configure>", configure_list_scroll)
         
         self.list_canvas_window = self.list_canvas.create_window((0, 0), window=self.list_scrollable_frame, anchor="nw")
-        self.list_canvas.configure(yscrollcommand=list_scrollbar.set)
+        
+        def on_list_yscroll(first, last):
+            list_scrollbar.set(first, last)
+            if self.virtual_mode:
+                self.schedule_virtual_render()
+        self.list_canvas.configure(yscrollcommand=on_list_yscroll)
         
         def configure_list_canvas_width(event):
             canvas_width = event.width
             self.list_canvas.itemconfig(self.list_canvas_window, width=canvas_width)
+            if self.virtual_mode:
+                self.update_virtual_scrollregion()
+                for row in self.virtual_pool:
+                    self.list_canvas.itemconfig(row['window'], width=canvas_width - 10)
+                self.schedule_virtual_render()
         self.list_canvas.bind('<Configure>', configure_list_canvas_width)
         
         self.list_canvas.pack(side="left", fill="both", expand=True)
@@ -341,6 +804,16 @@ class AlarmClock:
         
         # Container để chứa các item báo thức
         self.alarms_container = self.list_scrollable_frame
+        self.alarm_rows = {}  # {alarm_id: widget của dòng báo thức}
+        self.no_alarm_label = None
+        
+        # Trạng thái chế độ danh sách ảo hóa
+        self.virtual_mode = False
+        self.virtual_order = []  # Thứ tự hiển thị các alarm_id
+        self.virtual_members = set()  # Các alarm_id đang có trong danh sách
+        self.virtual_order_stale = False  # virtual_order còn chứa báo thức đã xóa
+        self.virtual_pool = []  # Các dòng được tái sử dụng khi cuộn
+        self.virtual_render_pending = False
     
     def setup_detail_view(self):
         """Thiết lập giao diện chi tiết báo thức"""
@@ -458,7 +931,7 @@ class AlarmClock:
         
         # Tạo đồng hồ analog
         clock_container = ttk.Frame(time_frame)
-        clock_container.pack(pady=5)
+        clock_container.pack(pady=5, fill=tk.X)
         self.analog_clock = AnalogClock(clock_container, size=200)
         
         # Nút chuyển đổi AM/PM
@@ -482,6 +955,45 @@ class AlarmClock:
         )
         instruction_label.pack(pady=5)
         
+        # Lặp lại
+        repeat_frame = ttk.LabelFrame(main_detail_frame, text="🔁 Lặp lại", padding="15")
+        repeat_frame.pack(fill=tk.X, pady=5)
+        
+        repeat_mode_frame = ttk.Frame(repeat_frame)
+        repeat_mode_frame.pack(fill=tk.X, pady=3)
+        ttk.Label(repeat_mode_frame, text="Kiểu lặp:", font=("Arial", 10)).pack(side=tk.LEFT, padx=5)
+        self.repeat_mode_var = tk.StringVar(value=self.REPEAT_MODES[0][1])
+        repeat_combobox = ttk.Combobox(repeat_mode_frame, textvariable=self.repeat_mode_var,
+                                       values=[label for _, label in self.REPEAT_MODES],
+                                       state="readonly", width=22)
+        repeat_combobox.pack(side=tk.LEFT, padx=5)
+        repeat_combobox.bind("<<ComboboxSelected>>", lambda e: self.update_repeat_ui())
+        
+        # Khoảng lặp (mỗi N ngày/giờ)
+        self.repeat_interval_frame = ttk.Frame(repeat_frame)
+        ttk.Label(self.repeat_interval_frame, text="N =", font=("Arial", 10)).pack(side=tk.LEFT, padx=5)
+        self.repeat_interval_var = tk.IntVar(value=2)
+        ttk.Spinbox(self.repeat_interval_frame, from_=1, to=365, width=5,
+                    textvariable=self.repeat_interval_var).pack(side=tk.LEFT, padx=5)
+        
+        # Các ngày trong tuần
+        self.repeat_weekdays_frame = ttk.Frame(repeat_frame)
+        self.repeat_weekday_vars = []
+        for day_name in Recurrence.WEEKDAY_NAMES:
+            day_var = tk.BooleanVar(value=False)
+            ttk.Checkbutton(self.repeat_weekdays_frame, text=day_name,
+                            variable=day_var).pack(side=tk.LEFT, padx=3)
+            self.repeat_weekday_vars.append(day_var)
+        
+        # Quy tắc RRULE tùy chỉnh
+        self.repeat_rrule_frame = ttk.Frame(repeat_frame)
+        ttk.Label(self.repeat_rrule_frame, text="RRULE:", font=("Arial", 10)).pack(side=tk.LEFT, padx=5)
+        self.repeat_rrule_var = tk.StringVar(value="FREQ=DAILY")
+        ttk.Entry(self.repeat_rrule_frame, textvariable=self.repeat_rrule_var,
+                  width=36).pack(side=tk.LEFT, padx=5)
+        ttk.Label(self.repeat_rrule_frame, text="(FREQ=DAILY/WEEKLY/HOURLY, INTERVAL, BYDAY)",
+                  font=("Arial", 9), foreground="gray").pack(side=tk.LEFT, padx=5)
+        
         # Chọn file nhạc
         music_frame = ttk.LabelFrame(main_detail_frame, text="Chọn nhạc chuông", padding="15")
         music_frame.pack(fill=tk.X, pady=5)
@@ -510,6 +1022,29 @@ class AlarmClock:
         ttk.Label(math_setting_frame, text="(Phải giải đúng tất cả mới tắt được báo thức)", 
                  font=("Arial", 9), foreground="gray").pack(side=tk.LEFT, padx=5)
         
+        # Cách tắt báo thức
+        dismiss_frame = ttk.LabelFrame(main_detail_frame, text="🔓 Cách tắt báo thức", padding="15")
+        dismiss_frame.pack(fill=tk.X, pady=5)
+        
+        self.dismiss_mode_var = tk.StringVar(value=Alarm.DISMISS_MATH)
+        ttk.Radiobutton(dismiss_frame, text="Giải toán", variable=self.dismiss_mode_var,
+                        value=Alarm.DISMISS_MATH).pack(anchor=tk.W, pady=2)
+        
+        pose_mode_frame = ttk.Frame(dismiss_frame)
+        pose_mode_frame.pack(fill=tk.X, pady=2)
+        pose_radio = ttk.Radiobutton(pose_mode_frame, text="Ngồi thẳng trước camera trong",
+                                     variable=self.dismiss_mode_var, value=Alarm.DISMISS_POSE)
+        pose_radio.pack(side=tk.LEFT)
+        self.pose_seconds_var = tk.IntVar(value=3)
+        ttk.Spinbox(pose_mode_frame, from_=1, to=60, width=5,
+                    textvariable=self.pose_seconds_var).pack(side=tk.LEFT, padx=5)
+        ttk.Label(pose_mode_frame, text="giây").pack(side=tk.LEFT)
+        
+        if not POSE_AVAILABLE:
+            pose_radio.state(['disabled'])
+            ttk.Label(dismiss_frame, text="(Cần cài opencv-python và mediapipe: pip install -r requirements_test.txt)",
+                     font=("Arial", 9), foreground="gray").pack(anchor=tk.W, pady=2)
+        
         # Nút lưu và hủy
         button_frame = ttk.Frame(main_detail_frame)
         button_frame.pack(pady=15)
@@ -524,20 +1059,23 @@ class AlarmClock:
         
         # Lưu reference để có thể truy cập sau
         self.detail_alarm_file = None
+        self.checking_music_file = None  # File đang được kiểm tra ở thread nền
     
     def show_list_view(self):
         """Hiển thị view danh sách"""
         self.current_view = 'list'
         self.detail_view_frame.pack_forget()
         self.list_view_frame.pack(fill=tk.BOTH, expand=True)
+        self.update_time()
         self.refresh_alarm_list()
     
-    def show_detail_view(self, alarm_id=None, alarm_data=None):
+    def show_detail_view(self, alarm_id=None, alarm=None):
         """Hiển thị view chi tiết"""
         self.current_view = 'detail'
         self.editing_alarm_id = alarm_id
         self.list_view_frame.pack_forget()
         self.detail_view_frame.pack(fill=tk.BOTH, expand=True)
+        self.update_time()
         
         # Cập nhật tiêu đề
         if alarm_id:
@@ -550,9 +1088,13 @@ class AlarmClock:
         self.analog_clock.set_time(7, 0)
         self.analog_clock.is_am = True
         self.analog_clock.draw_clock()
-        self.music_label.config(text="Chưa chọn file nhạc", foreground="gray")
         self.detail_alarm_file = None
+        self.checking_music_file = None
+        self.update_music_label()
         self.math_count_var.set(1)  # Mặc định 1 bài toán
+        self.dismiss_mode_var.set(Alarm.DISMISS_MATH)
+        self.pose_seconds_var.set(3)
+        self.set_recurrence_to_form(Recurrence())
         self.update_am_pm_button()
         
         # Reset tính toán chu kỳ ngủ
@@ -563,34 +1105,88 @@ class AlarmClock:
         self.sleep_cycle_result = None
         
         # Load dữ liệu nếu đang chỉnh sửa
-        if alarm_data:
-            self.load_alarm_data_to_form(alarm_data)
+        if alarm:
+            self.load_alarm_data_to_form(alarm)
     
-    def load_alarm_data_to_form(self, alarm_data):
+    def load_alarm_data_to_form(self, alarm):
         """Load dữ liệu báo thức vào form"""
         # Load tên
-        if 'name' in alarm_data and alarm_data['name']:
-            self.name_var.set(alarm_data['name'])
+        if alarm.name:
+            self.name_var.set(alarm.name)
         
         # Load thời gian
-        if 'time' in alarm_data:
-            hour, minute = alarm_data['time']
-            self.analog_clock.set_time(hour, minute)
+        self.analog_clock.set_time(alarm.hour, alarm.minute)
         
         # Load file nhạc
-        if 'file' in alarm_data and alarm_data['file']:
-            self.detail_alarm_file = alarm_data['file']
-            filename = self.detail_alarm_file.split("/")[-1] if "/" in self.detail_alarm_file else self.detail_alarm_file.split("\\")[-1]
-            self.music_label.config(text=f"✓ {filename}", foreground="green")
-        
-        # Load số lượng bài toán
-        if 'math_count' in alarm_data:
-            self.math_count_var.set(alarm_data['math_count'])
-        else:
-            self.math_count_var.set(1)  # Mặc định 1 nếu không có
+        if alarm.file:
+            self.detail_alarm_file = alarm.file
+            self.update_music_label()
+        
+        # Load số lượng bài toán và cách tắt báo thức
+        self.math_count_var.set(alarm.math_count)
+        self.dismiss_mode_var.set(alarm.dismiss_mode)
+        self.pose_seconds_var.set(alarm.pose_seconds)
+        
+        # Load kiểu lặp lại
+        self.set_recurrence_to_form(alarm.recurrence)
         
         self.update_am_pm_button()
     
+    def update_repeat_ui(self):
+        """Hiển thị các ô nhập tương ứng với kiểu lặp đang chọn"""
+        mode = self.get_repeat_mode()
+        for frame in (self.repeat_interval_frame, self.repeat_weekdays_frame, self.repeat_rrule_frame):
+            frame.pack_forget()
+        if mode in ('days', 'hours'):
+            self.repeat_interval_frame.pack(fill=tk.X, pady=3)
+        elif mode == 'weekly':
+            self.repeat_weekdays_frame.pack(fill=tk.X, pady=3)
+        elif mode == 'rrule':
+            self.repeat_rrule_frame.pack(fill=tk.X, pady=3)
+    
+    def get_repeat_mode(self):
+        label = self.repeat_mode_var.get()
+        for mode, mode_label in self.REPEAT_MODES:
+            if mode_label == label:
+                return mode
+        return 'daily'
+    
+    def set_recurrence_to_form(self, recurrence):
+        """Hiển thị quy tắc lặp lại lên form"""
+        if recurrence.freq == 'DAILY' and recurrence.interval == 1:
+            mode = 'daily'
+        elif recurrence.freq == 'WEEKLY' and recurrence.interval == 1:
+            mode = 'weekly'
+        elif recurrence.freq == 'DAILY':
+            mode = 'days'
+        elif recurrence.freq == 'HOURLY':
+            mode = 'hours'
+        else:
+            mode = 'rrule'
+        
+        self.repeat_mode_var.set(dict(self.REPEAT_MODES)[mode])
+        self.repeat_interval_var.set(recurrence.interval if mode in ('days', 'hours') else 2)
+        for day, day_var in enumerate(self.repeat_weekday_vars):
+            day_var.set(day in recurrence.weekdays)
+        self.repeat_rrule_var.set(recurrence.to_rrule())
+        self.update_repeat_ui()
+    
+    def get_recurrence_from_form(self):
+        """Tạo Recurrence từ form (ném ValueError nếu không hợp lệ)"""
+        mode = self.get_repeat_mode()
+        if mode == 'weekly':
+            weekdays = [day for day, day_var in enumerate(self.repeat_weekday_vars) if day_var.get()]
+            return Recurrence('WEEKLY', 1, weekdays)
+        if mode in ('days', 'hours'):
+            try:
+                interval = self.repeat_interval_var.get()
+            except tk.TclError:
+                raise ValueError("N phải là số nguyên")
+            return Recurrence('DAILY' if mode == 'days' else 'HOURLY', interval)
+        if mode == 'rrule':
+            return Recurrence.parse(self.repeat_rrule_var.get())
+        return Recurrence()
+    
     def toggle_am_pm(self):
         self.analog_clock.toggle_am_pm()
         self.update_am_pm_button()
@@ -764,12 +1360,39 @@ class AlarmClock:
             ]
         )
         if file_path:
+            # Kiểm tra file ngay khi chọn thay vì lúc báo thức kêu. Việc giải mã
+            # chạy ở thread tải trước của AudioEngine, kết quả được chuyển về Tk thread
+            self.checking_music_file = file_path
+            self.music_label.config(text="⏳ Đang kiểm tra file nhạc...", foreground="gray")
+            self.audio.preload(
+                file_path,
+                on_done=lambda error: self.root.after(0, self.on_music_file_checked, file_path, error)
+            )
+    
+    def on_music_file_checked(self, file_path, error):
+        """Kết quả kiểm tra file nhạc (chạy trên Tk thread)"""
+        if file_path != self.checking_music_file:
+            return  # Người dùng đã chọn file khác hoặc đã rời form
+        self.checking_music_file = None
+        if error is None:
             self.detail_alarm_file = file_path
-            filename = file_path.split("/")[-1] if "/" in file_path else file_path.split("\\")[-1]
-            self.music_label.config(text=f"✓ {filename}", foreground="green")
+        self.update_music_label()
+        if error is not None:
+            messagebox.showerror("Lỗi", f"Không thể phát file nhạc này: {error}")
+    
+    def update_music_label(self):
+        """Hiển thị file nhạc đã chọn trong form"""
+        if self.detail_alarm_file is None:
+            self.music_label.config(text="Chưa chọn file nhạc", foreground="gray")
+            return
+        filename = os.path.basename(self.detail_alarm_file.replace("\\", "/"))
+        self.music_label.config(text=f"✓ {filename}", foreground="green")
     
     def save_alarm(self):
         """Lưu báo thức"""
+        if self.checking_music_file is not None:
+            messagebox.showwarning("Cảnh báo", "Đang kiểm tra file nhạc, vui lòng chờ!")
+            return
         if self.detail_alarm_file is None:
             messagebox.showwarning("Cảnh báo", "Vui lòng chọn file nhạc trước!")
             return
@@ -780,31 +1403,35 @@ class AlarmClock:
             if hour < 0 or hour > 23 or minute < 0 or minute > 59:
                 raise ValueError("Giờ hoặc phút không hợp lệ")
             
-            # Tính thời gian báo thức
-            now = datetime.now()
-            alarm_time = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+            try:
+                recurrence = self.get_recurrence_from_form()
+            except ValueError as e:
+                messagebox.showerror("Lỗi", f"Kiểu lặp lại không hợp lệ: {e}")
+                return
             
-            # Nếu thời gian đã qua trong ngày hôm nay, set cho ngày mai
-            if alarm_time <= now:
-                alarm_time += timedelta(days=1)
+            # Tính thời gian báo thức (lần kêu đầu tiên theo kiểu lặp lại)
+            alarm_time = recurrence.next_after(datetime.now(), hour, minute)
             
             # Tạo dữ liệu báo thức
-            alarm_data = {
-                'name': self.name_var.get().strip() or None,
-                'time': (hour, minute),
-                'file': self.detail_alarm_file,
-                'alarm_time': alarm_time,
-                'enabled': True if not self.editing_alarm_id else self.alarms[self.editing_alarm_id].get('enabled', True),
-                'math_count': self.math_count_var.get()  # Số lượng bài toán cần giải
-            }
+            alarm = Alarm(
+                hour, minute,
+                name=self.name_var.get().strip() or None,
+                file=self.detail_alarm_file,
+                alarm_time=alarm_time,
+                enabled=True if not self.editing_alarm_id else self.alarms[self.editing_alarm_id].enabled,
+                math_count=self.math_count_var.get(),  # Số lượng bài toán cần giải
+                recurrence=recurrence,
+                dismiss_mode=self.dismiss_mode_var.get(),
+                pose_seconds=self.pose_seconds_var.get()
+            )
             
             # Lưu vào danh sách
             if self.editing_alarm_id:
                 # Cập nhật báo thức hiện có
-                self.update_alarm(self.editing_alarm_id, alarm_data)
+                self.update_alarm(self.editing_alarm_id, alarm)
             else:
                 # Tạo báo thức mới
-                self.add_alarm(alarm_data)
+                self.add_alarm(alarm)
             
             # Quay về list view
             self.show_list_view()
@@ -816,107 +1443,55 @@ class AlarmClock:
         """Mở view thêm báo thức mới"""
         self.show_detail_view()
     
-    def load_alarms(self):
-        """Load dữ liệu báo thức từ file JSON"""
-        if not os.path.exists(self.data_file):
-            return
-        
-        try:
-            with open(self.data_file, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-                
-            # Chuyển đổi dữ liệu từ JSON về dict với datetime
-            now = datetime.now()
-            for alarm_id, alarm_data in data.items():
-                # Chuyển đổi alarm_time từ string về datetime
-                if 'alarm_time' in alarm_data and alarm_data['alarm_time']:
-                    alarm_data['alarm_time'] = datetime.fromisoformat(alarm_data['alarm_time'])
-                    # Nếu alarm_time đã qua, tính lại cho ngày tiếp theo
-                    if alarm_data['alarm_time'] <= now:
-                        hour, minute = alarm_data.get('time', (0, 0))
-                        if isinstance(hour, list):
-                            hour, minute = tuple(hour)
-                        new_alarm_time = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
-                        if new_alarm_time <= now:
-                            new_alarm_time += timedelta(days=1)
-                        alarm_data['alarm_time'] = new_alarm_time
-                # Chuyển đổi time từ list về tuple
-                if 'time' in alarm_data and isinstance(alarm_data['time'], list):
-                    alarm_data['time'] = tuple(alarm_data['time'])
-                
-                self.alarms[alarm_id] = alarm_data
-            
-            # Lưu lại nếu có thay đổi alarm_time
-            if data:
-                self.save_alarms()
-                
-        except json.JSONDecodeError:
-            print(f"Lỗi: File {self.data_file} bị lỗi định dạng JSON")
-        except Exception as e:
-            print(f"Lỗi khi load dữ liệu: {e}")
-    
-    def save_alarms(self):
-        """Lưu dữ liệu báo thức vào file JSON"""
-        try:
-            # Chuyển đổi dữ liệu để có thể serialize thành JSON
-            data_to_save = {}
-            for alarm_id, alarm_data in self.alarms.items():
-                alarm_copy = alarm_data.copy()
-                
-                # Chuyển đổi datetime thành string
-                if 'alarm_time' in alarm_copy and isinstance(alarm_copy['alarm_time'], datetime):
-                    alarm_copy['alarm_time'] = alarm_copy['alarm_time'].isoformat()
-                
-                # Chuyển đổi time từ tuple về list (JSON không hỗ trợ tuple)
-                if 'time' in alarm_copy and isinstance(alarm_copy['time'], tuple):
-                    alarm_copy['time'] = list(alarm_copy['time'])
-                
-                data_to_save[alarm_id] = alarm_copy
-            
-            # Lưu vào file
-            with open(self.data_file, 'w', encoding='utf-8') as f:
-                json.dump(data_to_save, f, ensure_ascii=False, indent=2)
-                
-        except Exception as e:
-            print(f"Lỗi khi lưu dữ liệu: {e}")
-            messagebox.showerror("Lỗi", f"Không thể lưu dữ liệu: {e}")
-    
     def on_closing(self):
         """Xử lý khi đóng ứng dụng"""
-        self.save_alarms()
+        self.clock.stop()
+        if self.speaker:
+            self.speaker.close()
+        if self.pose_session:
+            self.pose_session.close()
+        self.pose_pool.close()
+        # Ghi nốt các thay đổi chưa lưu trước khi thoát
+        self.engine.close()
         self.root.destroy()
     
-    def add_alarm(self, alarm_data):
+    def add_alarm(self, alarm):
         """Thêm báo thức mới vào danh sách"""
-        alarm_id = str(uuid.uuid4())
-        self.alarms[alarm_id] = alarm_data
-        self.refresh_alarm_list()
-        self.save_alarms()  # Lưu sau khi thêm
-        return alarm_id
+        return self.engine.add_alarm(alarm)
     
-    def update_alarm(self, alarm_id, alarm_data):
+    def update_alarm(self, alarm_id, alarm):
         """Cập nhật báo thức"""
-        if alarm_id in self.alarms:
-            self.alarms[alarm_id] = alarm_data
-            self.refresh_alarm_list()
-            self.save_alarms()  # Lưu sau khi cập nhật
+        self.engine.update_alarm(alarm_id, alarm)
     
     def delete_alarm(self, alarm_id):
         """Xóa báo thức"""
-        if alarm_id in self.alarms:
-            # Nếu đang kêu, dừng lại
-            if self.active_alarm_id == alarm_id:
-                self.stop_alarm()
-            del self.alarms[alarm_id]
-            self.refresh_alarm_list()
-            self.save_alarms()  # Lưu sau khi xóa
+        self.engine.delete_alarm(alarm_id)
     
     def toggle_alarm_enabled(self, alarm_id):
         """Bật/tắt báo thức"""
-        if alarm_id in self.alarms:
-            self.alarms[alarm_id]['enabled'] = not self.alarms[alarm_id].get('enabled', True)
-            self.refresh_alarm_list()
-            self.save_alarms()  # Lưu sau khi toggle
+        self.engine.toggle_enabled(alarm_id)
+    
+    def on_alarm_changed(self, alarm_id):
+        """Dữ liệu/lịch của báo thức thay đổi: vẽ lại dòng và báo thức tiếp theo"""
+        self.render_alarm_row(alarm_id)
+        self.update_next_alarm_label()
+    
+    def get_upcoming_alarms(self, count):
+        """count lần kêu sắp tới của tất cả báo thức (kể cả lặp lại): [(datetime, alarm_id)]"""
+        return self.engine.upcoming(count)
+    
+    def update_next_alarm_label(self):
+        """Hiển thị báo thức sắp kêu tiếp theo"""
+        upcoming = self.get_upcoming_alarms(1)
+        if not upcoming:
+            self.next_alarm_label.config(text="Không có báo thức nào đang bật")
+            return
+        when, alarm_id = upcoming[0]
+        name = self.alarms[alarm_id].name if alarm_id in self.alarms else None
+        text = f"Báo thức tiếp theo: {when.strftime('%H:%M - %d/%m/%Y')}"
+        if name:
+            text += f" ({name})"
+        self.next_alarm_label.config(text=text)
     
     def edit_alarm(self, alarm_id):
         """Mở view chỉnh sửa báo thức"""
@@ -924,167 +1499,358 @@ class AlarmClock:
             self.show_detail_view(alarm_id, self.alarms[alarm_id])
     
     def refresh_alarm_list(self):
-        """Làm mới danh sách báo thức"""
-        # Xóa tất cả widget cũ
-        for widget in self.alarms_container.winfo_children():
-            widget.destroy()
+        """Đồng bộ toàn bộ danh sách báo thức với cache các dòng đã vẽ"""
+        self.set_virtual_mode(self.should_virtualize())
+        if self.virtual_mode:
+            self.virtual_order = list(self.alarms)
+            self.virtual_members = set(self.virtual_order)
+            self.virtual_order_stale = False
+            self.update_virtual_scrollregion()
+            self.schedule_virtual_render()
+            return
+        
+        # Xóa các dòng không còn báo thức tương ứng
+        for alarm_id in [a for a in self.alarm_rows if a not in self.alarms]:
+            self.remove_alarm_row(alarm_id)
+        
+        # Vẽ mới hoặc cập nhật các dòng còn lại (dòng không đổi sẽ được bỏ qua)
+        for alarm_id in self.alarms:
+            self.render_alarm_row(alarm_id)
+        
+        self.update_empty_list_label()
+    
+    def update_empty_list_label(self):
+        """Hiển thị/ẩn thông báo khi không có báo thức nào"""
+        if self.alarms:
+            if self.no_alarm_label is not None:
+                self.no_alarm_label.destroy()
+                self.no_alarm_label = None
+            return
         
-        if not self.alarms:
+        if self.no_alarm_label is None:
             # Hiển thị thông báo không có báo thức
-            no_alarm_label = ttk.Label(
+            self.no_alarm_label = ttk.Label(
                 self.alarms_container, 
                 text="Chưa có báo thức nào.\nNhấn 'Thêm Báo Thức Mới' để tạo báo thức đầu tiên.",
                 font=("Arial", 12),
                 foreground="gray",
                 justify=tk.CENTER
             )
-            no_alarm_label.pack(pady=50)
+            self.no_alarm_label.pack(pady=50)
+    
+    def render_alarm_row(self, alarm_id):
+        """Vẽ mới hoặc cập nhật dòng của một báo thức"""
+        alarm = self.alarms.get(alarm_id)
+        if alarm is None:
+            self.remove_alarm_row(alarm_id)
+            return
+        
+        if self.should_virtualize() != self.virtual_mode:
+            self.refresh_alarm_list()
+            return
+        
+        if self.virtual_mode:
+            if alarm_id not in self.virtual_members:
+                self.virtual_order.append(alarm_id)
+                self.virtual_members.add(alarm_id)
+                self.update_virtual_scrollregion()
+                self.schedule_virtual_render()
+            else:
+                for row in self.virtual_pool:
+                    if row['alarm_id'] == alarm_id:
+                        self.fill_alarm_row(row, alarm_id, alarm)
+            return
+        
+        row = self.alarm_rows.get(alarm_id)
+        if row is None:
+            self.create_alarm_item(alarm_id, alarm)
+            self.update_empty_list_label()
+        else:
+            self.fill_alarm_row(row, alarm_id, alarm)
+    
+    def remove_alarm_row(self, alarm_id):
+        """Xóa dòng của một báo thức khỏi danh sách"""
+        if self.virtual_mode:
+            if alarm_id in self.virtual_members:
+                # virtual_order được dọn một lần khi vẽ lại, nên xóa nhiều
+                # báo thức liên tiếp không phải duyệt lại danh sách mỗi lần
+                self.virtual_members.discard(alarm_id)
+                self.virtual_order_stale = True
+                self.update_virtual_scrollregion()
+                self.schedule_virtual_render()
+            if self.should_virtualize() != self.virtual_mode:
+                self.refresh_alarm_list()
             return
         
-        # Hiển thị từng báo thức
-        for alarm_id, alarm_data in self.alarms.items():
-            self.create_alarm_item(alarm_id, alarm_data)
+        row = self.alarm_rows.pop(alarm_id, None)
+        if row is not None:
+            row['item_frame'].destroy()
+        self.update_empty_list_label()
+    
+    def should_virtualize(self):
+        """Có nên dùng danh sách ảo hóa không (có khoảng trễ để tránh bật/tắt liên tục)"""
+        if self.virtual_mode:
+            return len(self.alarms) > self.VIRTUAL_LIST_THRESHOLD // 2
+        return len(self.alarms) > self.VIRTUAL_LIST_THRESHOLD
+    
+    def set_virtual_mode(self, enabled):
+        """Chuyển giữa danh sách thường và danh sách ảo hóa"""
+        if enabled == self.virtual_mode:
+            return
+        
+        if enabled:
+            # Bỏ các dòng của danh sách thường
+            for row in self.alarm_rows.values():
+                row['item_frame'].destroy()
+            self.alarm_rows = {}
+            if self.no_alarm_label is not None:
+                self.no_alarm_label.destroy()
+                self.no_alarm_label = None
+            self.list_canvas.itemconfig(self.list_canvas_window, state='hidden')
+            self.virtual_mode = True
+        else:
+            # Bỏ các dòng ảo hóa
+            for row in self.virtual_pool:
+                self.list_canvas.delete(row['window'])
+                row['item_frame'].destroy()
+            self.virtual_pool = []
+            self.virtual_order = []
+            self.virtual_members = set()
+            self.virtual_order_stale = False
+            self.virtual_mode = False
+            self.list_canvas.itemconfig(self.list_canvas_window, state='normal')
+            self.list_canvas.configure(scrollregion=self.list_canvas.bbox(self.list_canvas_window))
+        self.list_canvas.yview_moveto(0)
+    
+    def update_virtual_scrollregion(self):
+        """Cập nhật vùng cuộn theo tổng số dòng"""
+        width = self.list_canvas.winfo_width()
+        height = len(self.virtual_members) * self.VIRTUAL_ROW_HEIGHT
+        self.list_canvas.configure(scrollregion=(0, 0, width, height))
     
-    def create_alarm_item(self, alarm_id, alarm_data):
+    def schedule_virtual_render(self):
+        """Gộp nhiều sự kiện cuộn thành một lần vẽ"""
+        if not self.virtual_render_pending:
+            self.virtual_render_pending = True
+            self.root.after_idle(self.render_virtual_rows)
+    
+    def render_virtual_rows(self):
+        """Gán các dòng trong pool cho những báo thức đang nằm trong vùng nhìn thấy"""
+        self.virtual_render_pending = False
+        if not self.virtual_mode:
+            return
+        
+        if self.virtual_order_stale:
+            # Bỏ các báo thức đã xóa (và mục trùng nếu báo thức được thêm lại)
+            self.virtual_order = [alarm_id for alarm_id in dict.fromkeys(self.virtual_order)
+                                  if alarm_id in self.virtual_members]
+            self.virtual_order_stale = False
+        
+        canvas = self.list_canvas
+        row_height = self.VIRTUAL_ROW_HEIGHT
+        total = len(self.virtual_order)
+        first = max(int(canvas.canvasy(0) // row_height) - self.VIRTUAL_OVERSCAN, 0)
+        count = canvas.winfo_height() // row_height + 1 + 2 * self.VIRTUAL_OVERSCAN
+        last = min(first + count, total)
+        
+        # Tạo thêm dòng nếu vùng nhìn thấy lớn hơn pool hiện tại
+        while len(self.virtual_pool) < count:
+            row = self.create_alarm_row(canvas)
+            row['index'] = None
+            row['window'] = canvas.create_window(
+                5, 0, window=row['item_frame'], anchor="nw",
+                width=canvas.winfo_width() - 10, height=row_height - 10,
+                state='hidden'
+            )
+            self.virtual_pool.append(row)
+        
+        # Giữ nguyên các dòng vẫn còn trong vùng nhìn thấy, tái sử dụng các dòng còn lại
+        kept = {}
+        free_rows = []
+        for row in self.virtual_pool:
+            index = row['index']
+            if (index is not None and first <= index < last
+                    and row['alarm_id'] == self.virtual_order[index]):
+                kept[index] = row
+            else:
+                free_rows.append(row)
+        
+        for index in range(first, last):
+            alarm_id = self.virtual_order[index]
+            row = kept.get(index)
+            if row is None:
+                row = free_rows.pop()
+                row['index'] = index
+                canvas.coords(row['window'], 5, index * row_height + 5)
+                canvas.itemconfig(row['window'], state='normal')
+            self.fill_alarm_row(row, alarm_id, self.alarms[alarm_id])
+        
+        for row in free_rows:
+            if row['index'] is not None:
+                row['index'] = None
+                canvas.itemconfig(row['window'], state='hidden')
+    
+    def create_alarm_item(self, alarm_id, alarm):
         """Tạo một item báo thức trong danh sách"""
+        row = self.create_alarm_row(self.alarms_container)
+        row['item_frame'].pack(fill=tk.X, pady=5, padx=5)
+        self.alarm_rows[alarm_id] = row
+        self.fill_alarm_row(row, alarm_id, alarm)
+        return row
+    
+    def create_alarm_row(self, parent):
+        """Tạo các widget của một dòng báo thức (chưa có dữ liệu)"""
+        row = {'alarm_id': None, 'state': None}
+        
         # Frame chứa item
-        item_frame = ttk.Frame(self.alarms_container, relief=tk.RAISED, borderwidth=1)
-        item_frame.pack(fill=tk.X, pady=5, padx=5)
+        row['item_frame'] = ttk.Frame(parent, relief=tk.RAISED, borderwidth=1)
         
         # Frame nội dung
-        content_frame = ttk.Frame(item_frame, padding="10")
+        content_frame = ttk.Frame(row['item_frame'], padding="10")
         content_frame.pack(fill=tk.X)
         
         # Thông tin báo thức
         info_frame = ttk.Frame(content_frame)
         info_frame.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
         
-        # Tên báo thức hoặc thời gian
-        name = alarm_data.get('name')
-        hour, minute = alarm_data.get('time', (0, 0))
-        time_str = f"{hour:02d}:{minute:02d}"
-        
-        if name:
-            name_label = ttk.Label(info_frame, text=name, font=("Arial", 12, "bold"))
-            name_label.pack(anchor=tk.W)
-            time_label = ttk.Label(info_frame, text=f"⏰ {time_str}", font=("Arial", 10))
-            time_label.pack(anchor=tk.W)
-        else:
-            time_label = ttk.Label(info_frame, text=f"⏰ {time_str}", font=("Arial", 14, "bold"))
-            time_label.pack(anchor=tk.W)
+        # Tên báo thức (chỉ hiển thị khi có tên) và thời gian
+        row['name_label'] = ttk.Label(info_frame, font=("Arial", 12, "bold"))
+        row['time_label'] = ttk.Label(info_frame)
+        row['time_label'].pack(anchor=tk.W)
         
         # Trạng thái
-        enabled = alarm_data.get('enabled', True)
-        status_text = "🟢 BẬT" if enabled else "🔴 TẮT"
-        status_color = "green" if enabled else "red"
-        status_label = ttk.Label(info_frame, text=status_text, 
-                                font=("Arial", 10), foreground=status_color)
-        status_label.pack(anchor=tk.W, pady=(5, 0))
+        row['status_label'] = ttk.Label(info_frame, font=("Arial", 10))
+        row['status_label'].pack(anchor=tk.W, pady=(5, 0))
         
         # Thời gian báo thức sẽ kêu
-        if 'alarm_time' in alarm_data:
-            alarm_time = alarm_data['alarm_time']
-            if isinstance(alarm_time, datetime):
-                next_time_str = alarm_time.strftime('%H:%M - %d/%m/%Y')
-                next_label = ttk.Label(info_frame, text=f"Kêu lúc: {next_time_str}", 
-                                      font=("Arial", 9), foreground="blue")
-                next_label.pack(anchor=tk.W)
+        row['next_label'] = ttk.Label(info_frame, font=("Arial", 9), foreground="blue")
         
         # Frame nút điều khiển
         button_frame = ttk.Frame(content_frame)
         button_frame.pack(side=tk.RIGHT, padx=5)
         
+        # Các nút đọc alarm_id từ row để có thể tái sử dụng dòng
         # Nút bật/tắt
-        toggle_text = "Tắt" if enabled else "Bật"
-        toggle_button = ttk.Button(button_frame, text=toggle_text, width=8,
-                                   command=lambda: self.toggle_alarm_enabled(alarm_id))
-        toggle_button.pack(pady=2)
+        row['toggle_button'] = ttk.Button(button_frame, width=8,
+                                          command=lambda: self.toggle_alarm_enabled(row['alarm_id']))
+        row['toggle_button'].pack(pady=2)
         
         # Nút chỉnh sửa
         edit_button = ttk.Button(button_frame, text="✏️ Sửa", width=8,
-                                command=lambda: self.edit_alarm(alarm_id))
+                                command=lambda: self.edit_alarm(row['alarm_id']))
         edit_button.pack(pady=2)
         
         # Nút xóa
         delete_button = ttk.Button(button_frame, text="🗑️ Xóa", width=8,
-                                  command=lambda: self.confirm_delete_alarm(alarm_id))
+                                  command=lambda: self.confirm_delete_alarm(row['alarm_id']))
         delete_button.pack(pady=2)
+        
+        return row
+    
+    def fill_alarm_row(self, row, alarm_id, alarm):
+        """Cập nhật nội dung một dòng theo dữ liệu báo thức"""
+        name = alarm.name
+        hour, minute = alarm.time
+        enabled = alarm.enabled
+        alarm_time = alarm.alarm_time
+        recurrence = alarm.recurrence
+        
+        # Bỏ qua nếu dòng đã hiển thị đúng dữ liệu này
+        state = (alarm_id, name, hour, minute, enabled, alarm_time, recurrence)
+        if row['state'] == state:
+            return
+        old_state = row['state']
+        row['alarm_id'] = alarm_id
+        row['state'] = state
+        
+        # Tên báo thức hoặc thời gian
+        time_str = f"{hour:02d}:{minute:02d} · {recurrence.describe()}"
+        if name:
+            row['name_label'].config(text=name)
+            if old_state is None or not old_state[1]:
+                row['name_label'].pack(anchor=tk.W, before=row['time_label'])
+            row['time_label'].config(text=f"⏰ {time_str}", font=("Arial", 10))
+        else:
+            row['name_label'].pack_forget()
+            row['time_label'].config(text=f"⏰ {time_str}", font=("Arial", 14, "bold"))
+        
+        # Trạng thái
+        status_text = "🟢 BẬT" if enabled else "🔴 TẮT"
+        status_color = "green" if enabled else "red"
+        row['status_label'].config(text=status_text, foreground=status_color)
+        row['toggle_button'].config(text="Tắt" if enabled else "Bật")
+        
+        # Thời gian báo thức sẽ kêu
+        if alarm_time is not None:
+            next_time_str = alarm_time.strftime('%H:%M - %d/%m/%Y')
+            row['next_label'].config(text=f"Kêu lúc: {next_time_str}")
+            row['next_label'].pack(anchor=tk.W)
+        else:
+            row['next_label'].pack_forget()
     
     def confirm_delete_alarm(self, alarm_id):
         """Xác nhận xóa báo thức"""
         if alarm_id in self.alarms:
-            name = self.alarms[alarm_id].get('name', 'Báo thức này')
+            name = self.alarms[alarm_id].name or 'Báo thức này'
             if messagebox.askyesno("Xác nhận", f"Bạn có chắc muốn xóa '{name}'?"):
                 self.delete_alarm(alarm_id)
     
-    def start_alarm_checker(self):
-        """Bắt đầu thread kiểm tra báo thức"""
-        if self.alarm_thread is None or not self.alarm_thread.is_alive():
-            self.alarm_thread = threading.Thread(target=self.check_alarms, daemon=True)
-            self.alarm_thread.start()
+    def on_alarm_warmup(self, alarm_id, alarm):
+        """Báo thức sắp kêu: mở sẵn camera và model nếu cần ngồi thẳng để tắt"""
+        if alarm.dismiss_mode == Alarm.DISMISS_POSE:
+            self.get_pose_session().warm_up()
     
-    def check_alarms(self):
-        """Kiểm tra tất cả báo thức đang bật"""
-        while True:
-            if not self.is_alarm_playing:
-                now = datetime.now()
-                for alarm_id, alarm_data in self.alarms.items():
-                    if not alarm_data.get('enabled', True):
-                        continue
-                    
-                    alarm_time = alarm_data.get('alarm_time')
-                    if alarm_time and isinstance(alarm_time, datetime):
-                        if now >= alarm_time:
-                            self.start_alarm(alarm_id, alarm_data)
-                            break
-            
-            time.sleep(1)
+    def get_pose_session(self):
+        """PoseHoldSession dùng chung cho mọi báo thức (mỗi lúc chỉ một session giữ camera)"""
+        if self.pose_session is None:
+            self.pose_session = PoseHoldSession(
+                self.POSE_CAMERA_ID,
+                on_progress=lambda state: self.root.after(0, self.on_pose_progress, state),
+                idle_timeout=self.POSE_WARMUP_LEAD + self.POSE_IDLE_TIMEOUT,
+                pool=self.pose_pool
+            )
+        return self.pose_session
     
-    def start_alarm(self, alarm_id, alarm_data):
-        """Bắt đầu báo thức"""
-        if self.is_alarm_playing:
-            return
-        
-        self.active_alarm_id = alarm_id
-        self.is_alarm_playing = True
-        
-        # Phát nhạc trong thread riêng
-        sound_thread = threading.Thread(
-            target=self.play_alarm_sound, 
-            args=(alarm_data.get('file'),), 
-            daemon=True
-        )
-        sound_thread.start()
-        
-        # Hiển thị cửa sổ giải toán
-        math_count = alarm_data.get('math_count', 1)  # Mặc định 1 nếu không có
-        self.show_math_challenge(math_count)
-        
-        # Cập nhật UI
-        self.refresh_alarm_list()
+    def on_alarm_fired(self, alarm_id, alarm):
+        """Báo thức bắt đầu kêu (nhiều báo thức có thể kêu cùng lúc)"""
+        # Xếp hàng cửa sổ giải toán (mỗi lúc chỉ hiện một cửa sổ)
+        self.challenge_queue.append(alarm_id)
+        self.show_next_challenge()
     
-    def play_alarm_sound(self, file_path):
-        """Phát nhạc báo thức"""
-        try:
-            pygame.mixer.music.load(file_path)
-            pygame.mixer.music.play(-1)  # -1 để loop vô hạn
-        except Exception as e:
-            messagebox.showerror("Lỗi", f"Không thể phát nhạc: {e}")
-            self.is_alarm_playing = False
+    def show_next_challenge(self):
+        """Hiển thị thử thách toán học của báo thức tiếp theo trong hàng đợi"""
+        if self.challenge_alarm_id is not None:
+            return
+        while self.challenge_queue:
+            alarm_id = self.challenge_queue.popleft()
+            if alarm_id in self.active_alarms:
+                self.challenge_alarm_id = alarm_id
+                alarm = self.active_alarms[alarm_id]
+                if alarm.dismiss_mode == Alarm.DISMISS_POSE and POSE_AVAILABLE:
+                    self.show_pose_challenge(alarm_id, alarm.pose_seconds)
+                else:
+                    self.show_math_challenge(alarm_id, alarm.math_count)
+                return
     
-    def show_math_challenge(self, total_count=1, current_count=0, correct_count=0):
+    def show_math_challenge(self, alarm_id, total_count=1, current_count=0, correct_count=0):
         """Hiển thị cửa sổ giải toán
         
         Args:
+            alarm_id: Báo thức sẽ được tắt khi giải xong
             total_count: Tổng số bài toán cần giải đúng
             current_count: Số bài toán hiện tại (đã giải)
             correct_count: Số bài toán đã giải đúng
         """
+        # Báo thức đã được tắt (ví dụ bị xóa) trong lúc chờ hiện lại cửa sổ
+        if alarm_id not in self.active_alarms:
+            return
+        
         # Tạo cửa sổ mới để giải toán
         challenge_window = tk.Toplevel(self.root)
         challenge_window.title("Tắt Báo Thức - Phải giải đúng mới tắt được!")
         challenge_window.geometry("400x400")
         challenge_window.resizable(False, False)
+        self.challenge_window = challenge_window
         
         # Đặt cửa sổ lên trên cùng
         challenge_window.attributes('-topmost', True)
@@ -1094,7 +1860,7 @@ class AlarmClock:
         def on_closing():
             challenge_window.destroy()
             # Tự động hiện lại cửa sổ giải toán mới
-            self.root.after(100, lambda: self.show_math_challenge(total_count, current_count, correct_count))
+            self.root.after(100, lambda: self.show_math_challenge(alarm_id, total_count, current_count, correct_count))
         
         challenge_window.protocol("WM_DELETE_WINDOW", on_closing)
         
@@ -1165,8 +1931,8 @@ class AlarmClock:
                     
                     if new_correct_count >= total_count:
                         # Đã giải đủ số bài toán yêu cầu - tắt báo thức
-                        self.stop_alarm()
                         challenge_window.destroy()
+                        self.stop_alarm(alarm_id)
                         messagebox.showinfo("Thành công", 
                                           f"Bạn đã giải đúng {total_count} bài toán!\nBáo thức đã được tắt!")
                     else:
@@ -1174,13 +1940,13 @@ class AlarmClock:
                         challenge_window.destroy()
                         messagebox.showinfo("Đúng rồi!", 
                                           f"Bạn đã giải đúng {new_correct_count}/{total_count} bài.\nTiếp tục với bài toán tiếp theo!")
-                        self.root.after(100, lambda: self.show_math_challenge(total_count, new_current_count, new_correct_count))
+                        self.root.after(100, lambda: self.show_math_challenge(alarm_id, total_count, new_current_count, new_correct_count))
                 else:
                     # Đáp án sai - tạo bài toán mới
                     messagebox.showwarning("Sai rồi!", "Hãy thử lại!")
                     challenge_window.destroy()
                     # Tiếp tục với cùng số bài đã giải đúng
-                    self.root.after(100, lambda: self.show_math_challenge(total_count, current_count + 1, correct_count))
+                    self.root.after(100, lambda: self.show_math_challenge(alarm_id, total_count, current_count + 1, correct_count))
             except ValueError:
                 messagebox.showwarning("Lỗi", "Vui lòng nhập số!")
         
@@ -1192,68 +1958,143 @@ class AlarmClock:
         # Cho phép Enter để submit
         answer_entry.bind('<Return>', lambda e: check_answer())
     
-    def stop_alarm(self):
-        """Dừng báo thức"""
-        pygame.mixer.music.stop()
-        self.is_alarm_playing = False
+    def show_pose_challenge(self, alarm_id, hold_seconds):
+        """Hiển thị cửa sổ ngồi thẳng, nhận diện tư thế chạy ở thread của PoseHoldSession
         
-        # Cập nhật lại thời gian báo thức cho lần sau
-        if self.active_alarm_id and self.active_alarm_id in self.alarms:
-            alarm_data = self.alarms[self.active_alarm_id]
-            hour, minute = alarm_data.get('time', (0, 0))
-            now = datetime.now()
-            alarm_time = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
-            if alarm_time <= now:
-                alarm_time += timedelta(days=1)
-            alarm_data['alarm_time'] = alarm_time
-            self.save_alarms()  # Lưu sau khi cập nhật alarm_time
+        Args:
+            alarm_id: Báo thức sẽ được tắt khi giữ đủ tư thế
+            hold_seconds: Số giây cần ngồi thẳng liên tục
+        """
+        if alarm_id not in self.active_alarms:
+            return
         
-        self.active_alarm_id = None
-        self.refresh_alarm_list()
+        challenge_window = tk.Toplevel(self.root)
+        challenge_window.title("Tắt Báo Thức - Hãy ngồi thẳng!")
+        challenge_window.geometry("400x300")
+        challenge_window.resizable(False, False)
+        self.challenge_window = challenge_window
+        
+        # Đặt cửa sổ lên trên cùng
+        challenge_window.attributes('-topmost', True)
+        challenge_window.grab_set()  # Modal window
+        # Không cho đóng cửa sổ khi chưa giữ đủ tư thế
+        challenge_window.protocol("WM_DELETE_WINDOW", lambda: None)
+        
+        main_frame = ttk.Frame(challenge_window, padding="20")
+        main_frame.pack(fill=tk.BOTH, expand=True)
+        
+        ttk.Label(main_frame, text=f"⚠️ Ngồi thẳng trước camera {hold_seconds} giây để tắt báo thức!",
+                 font=("Arial", 10, "bold"), foreground="red", wraplength=340).pack(pady=5)
+        
+        status_label = ttk.Label(main_frame, text="Đang mở camera...", font=("Arial", 14, "bold"))
+        status_label.pack(pady=20)
+        
+        progress = ttk.Progressbar(main_frame, maximum=hold_seconds, length=300)
+        progress.pack(pady=10)
+        
+        # Dự phòng khi camera không nhận ra người (thiếu sáng, bị che...)
+        ttk.Button(main_frame, text="Dùng thử thách toán học",
+                  command=lambda: self.switch_to_math_challenge(alarm_id)).pack(pady=10)
+        
+        self.pose_widgets = {'window': challenge_window, 'status': status_label, 'progress': progress}
+        session = self.get_pose_session()
+        if session.ready:
+            status_label.config(text="Hãy ngồi thẳng!")
+        session.start(hold_seconds)
+    
+    def on_pose_progress(self, state):
+        """Cập nhật cửa sổ ngồi thẳng theo trạng thái từ PoseHoldSession (Tk thread)"""
+        if state.status == PoseHoldState.ERROR:
+            # Session đã dừng: lần sau tạo session mới
+            if self.pose_session:
+                self.pose_session.close()
+            self.pose_session = None
+        
+        widgets = self.pose_widgets
+        if widgets is None or not widgets['window'].winfo_exists():
+            return  # Không có cửa sổ ngồi thẳng đang mở (đang chuẩn bị trước giờ kêu)
+        alarm_id = self.challenge_alarm_id
+        
+        if state.status == PoseHoldState.ERROR:
+            messagebox.showwarning("Cảnh báo", f"Không dùng được camera: {state.message}\n"
+                                              "Chuyển sang thử thách toán học.")
+            self.switch_to_math_challenge(alarm_id)
+        elif state.status == PoseHoldState.DONE:
+            widgets['window'].destroy()
+            self.pose_widgets = None
+            self.stop_alarm(alarm_id)
+            messagebox.showinfo("Thành công",
+                                f"Bạn đã ngồi thẳng {state.required} giây!\nBáo thức đã được tắt!")
+        elif state.status == PoseHoldState.READY:
+            widgets['status'].config(text="Hãy ngồi thẳng!", foreground="")
+        elif state.status == PoseHoldState.TRACKING:
+            widgets['progress'].config(value=state.elapsed)
+            if state.is_straight:
+                widgets['status'].config(text=f"Giữ nguyên... {state.required - state.elapsed:.1f}s",
+                                         foreground="green")
+            else:
+                widgets['status'].config(text="Hãy ngồi thẳng!", foreground="red")
+    
+    def switch_to_math_challenge(self, alarm_id):
+        """Bỏ cửa sổ ngồi thẳng, tắt báo thức bằng thử thách toán học"""
+        if self.pose_session:
+            self.pose_session.cancel()
+        if self.pose_widgets is not None:
+            self.pose_widgets['window'].destroy()
+            self.pose_widgets = None
+        if alarm_id in self.active_alarms:
+            self.show_math_challenge(alarm_id, self.active_alarms[alarm_id].math_count)
+    
+    def stop_alarm(self, alarm_id):
+        """Dừng một báo thức đang kêu"""
+        self.engine.dismiss(alarm_id)
+    
+    def on_alarm_dismissed(self, alarm_id):
+        """Báo thức đã được tắt: chuyển sang thử thách của báo thức tiếp theo"""
+        if self.challenge_alarm_id == alarm_id:
+            if self.pose_widgets is not None:
+                # Báo thức được tắt khi đang ngồi thẳng (ví dụ bị xóa): dừng đếm
+                if self.pose_session:
+                    self.pose_session.cancel()
+                self.pose_widgets = None
+            if self.challenge_window is not None and self.challenge_window.winfo_exists():
+                self.challenge_window.destroy()
+            self.challenge_window = None
+            self.challenge_alarm_id = None
+            self.root.after(100, self.show_next_challenge)
+        
+        # Không còn báo thức nào cần ngồi thẳng: đóng camera ngay thay vì chờ hết hạn
+        if self.pose_session and not any(alarm.dismiss_mode == Alarm.DISMISS_POSE
+                                         for alarm in self.active_alarms.values()):
+            self.pose_session.stop()
     
     def read_current_time(self):
         """Đọc thời gian hiện tại bằng giọng nói"""
-        if not self.tts_engine:
+        speaker = self.get_speaker()
+        if not speaker or speaker.error:
             messagebox.showwarning("Cảnh báo", 
                                   "Tính năng text-to-speech không khả dụng.\n"
                                   "Vui lòng cài đặt pyttsx3: pip install pyttsx3")
             return
         
-        def speak_in_thread():
-            try:
-                now = datetime.now()
-                hour = now.hour
-                minute = now.minute
-                second = now.second
-                
-                # Tạo văn bản tiếng Việt
-                time_text = f"Bây giờ là {hour} giờ {minute} phút {second} giây"
-                
-                # Đọc trong thread riêng để không block UI
-                self.tts_engine.say(time_text)
-                self.tts_engine.runAndWait()
-            except Exception as e:
-                # Hiển thị lỗi trong main thread
-                self.root.after(0, lambda: messagebox.showerror("Lỗi", f"Không thể đọc thời gian: {e}"))
-        
-        # Chạy trong thread riêng để không block UI
-        speak_thread = threading.Thread(target=speak_in_thread, daemon=True)
-        speak_thread.start()
+        # Phát ngay từ cache giọng nói, hoặc chuyển cho thread worker đọc
+        speaker.speak_time()
     
-    def update_time(self):
-        """Cập nhật thời gian hiện tại"""
-        current_time = datetime.now().strftime("%H:%M:%S")
-        self.time_label.config(text=current_time)
+    def update_time(self, now=None):
+        """Cập nhật thời gian hiện tại (được ClockService gọi mỗi giây)"""
+        current_time = (now or datetime.now()).strftime("%H:%M:%S")
         
-        # Cập nhật đồng hồ realtime trong detail view nếu đang ở detail view
-        if hasattr(self, 'detail_time_label') and self.current_view == 'detail':
+        # Chỉ cập nhật đồng hồ của view đang hiển thị
+        if self.current_view == 'detail':
             self.detail_time_label.config(text=current_time)
-        
-        self.root.after(1000, self.update_time)
+        else:
+            self.time_label.config(text=current_time)
 
 def main():
-    root = tk.Tk()
-    app = AlarmClock(root)
+    startup = StartupProfiler()
+    with startup.phase('tk'):
+        root = tk.Tk()
+    app = AlarmClock(root, startup)
     root.mainloop()
 
 if __name__ == "__main__":
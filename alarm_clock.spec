@@ -1,5 +1,11 @@
 # -*- mode: python ; coding: utf-8 -*-
+import os
 
+# Tắt báo thức bằng tư thế (pose_detector.py) cần opencv/mediapipe, làm file
+# one-file nặng thêm hàng trăm MB và giải nén chậm hơn khi khởi động. Mặc
+# định không đóng gói (chỉ có thử thách toán học); build với
+# ALARM_BUILD_POSE=1 để kèm chúng nếu đã được cài.
+pose_excludes = [] if os.environ.get('ALARM_BUILD_POSE') == '1' else ['numpy', 'cv2', 'mediapipe']
 
 a = Analysis(
     ['alarm_clock.py'],
@@ -10,7 +16,7 @@ a = Analysis(
     hookspath=[],
     hooksconfig={},
     runtime_hooks=[],
-    excludes=[],
+    excludes=pose_excludes,
     noarchive=False,
     optimize=0,
 )
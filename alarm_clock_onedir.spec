@@ -0,0 +1,54 @@
+# -*- mode: python ; coding: utf-8 -*-
+# Bản one-dir: không phải giải nén vào thư mục tạm mỗi lần chạy nên khởi động
+# nhanh hơn bản one-file (alarm_clock.spec). Không dùng UPX để tránh giải nén
+# thư viện khi nạp, và bỏ các module không dùng đến.
+# Tạo bằng: pyinstaller alarm_clock_onedir.spec  ->  dist/alarm_clock_onedir/
+
+
+a = Analysis(
+    ['alarm_clock.py'],
+    pathex=[],
+    binaries=[],
+    datas=[],
+    hiddenimports=[],
+    hookspath=[],
+    hooksconfig={},
+    runtime_hooks=[],
+    excludes=[
+        # Tắt báo thức bằng tư thế (pose_detector.py) cần opencv/mediapipe và làm
+        # bản build nặng hơn nhiều; bản này bỏ chúng nên chỉ có thử thách toán học
+        'numpy', 'cv2', 'mediapipe',
+        'pygame.examples', 'pygame.tests', 'pygame.docs',
+        'unittest', 'doctest', 'pydoc', 'pdb', 'lib2to3',
+    ],
+    noarchive=False,
+    optimize=0,
+)
+pyz = PYZ(a.pure)
+
+exe = EXE(
+    pyz,
+    a.scripts,
+    [],
+    exclude_binaries=True,
+    name='alarm_clock_onedir',
+    debug=False,
+    bootloader_ignore_signals=False,
+    strip=False,
+    upx=False,
+    console=True,
+    disable_windowed_traceback=False,
+    argv_emulation=False,
+    target_arch=None,
+    codesign_identity=None,
+    entitlements_file=None,
+)
+coll = COLLECT(
+    exe,
+    a.binaries,
+    a.datas,
+    strip=False,
+    upx=False,
+    upx_exclude=[],
+    name='alarm_clock_onedir',
+)
@@ -0,0 +1,47 @@
+# -*- mode: python ; coding: utf-8 -*-
+# Bản one-file như alarm_clock.spec nhưng không dùng UPX và bỏ các module
+# không dùng đến, để so sánh thời gian khởi động (xem bench_startup.py).
+# Tạo bằng: pyinstaller alarm_clock_slim.spec  ->  dist/alarm_clock_slim
+
+
+a = Analysis(
+    ['alarm_clock.py'],
+    pathex=[],
+    binaries=[],
+    datas=[],
+    hiddenimports=[],
+    hookspath=[],
+    hooksconfig={},
+    runtime_hooks=[],
+    excludes=[
+        # Tắt báo thức bằng tư thế (pose_detector.py) cần opencv/mediapipe và làm
+        # bản build nặng hơn nhiều; bản này bỏ chúng nên chỉ có thử thách toán học
+        'numpy', 'cv2', 'mediapipe',
+        'pygame.examples', 'pygame.tests', 'pygame.docs',
+        'unittest', 'doctest', 'pydoc', 'pdb', 'lib2to3',
+    ],
+    noarchive=False,
+    optimize=0,
+)
+pyz = PYZ(a.pure)
+
+exe = EXE(
+    pyz,
+    a.scripts,
+    a.binaries,
+    a.datas,
+    [],
+    name='alarm_clock_slim',
+    debug=False,
+    bootloader_ignore_signals=False,
+    strip=False,
+    upx=False,
+    upx_exclude=[],
+    runtime_tmpdir=None,
+    console=True,
+    disable_windowed_traceback=False,
+    argv_emulation=False,
+    target_arch=None,
+    codesign_identity=None,
+    entitlements_file=None,
+)
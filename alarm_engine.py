@@ -0,0 +1,1546 @@
+"""Lõi báo thức không phụ thuộc giao diện (không import tkinter)
+
+Gồm dữ liệu báo thức (Alarm, Recurrence, AlarmStore), lưu trữ (JSON,
+journal, SQLite, AlarmWriter), lập lịch (AlarmScheduler), phát nhạc
+(AudioEngine) và AlarmEngine ghép tất cả lại. alarm_clock.py là giao diện Tk
+dùng AlarmEngine; chạy trực tiếp file này để dùng chế độ nền không giao diện:
+
+    python alarm_engine.py
+    python alarm_engine.py --upcoming 10
+"""
+import argparse
+import threading
+import heapq
+import itertools
+from datetime import datetime, timedelta
+import time
+import uuid
+import json
+import os
+import queue
+import sqlite3
+from collections import OrderedDict
+from collections.abc import Mapping
+from types import MappingProxyType
+
+# pygame import khá lâu nên chỉ được import khi cần lần đầu (xem import_pygame)
+pygame = None
+
+def import_pygame():
+    """Import pygame ở lần dùng đầu tiên"""
+    global pygame
+    if pygame is None:
+        import pygame as module
+        pygame = module
+    return pygame
+
+class Recurrence:
+    """Quy tắc lặp lại của báo thức (một tập con của RRULE trong RFC 5545)
+
+    Hỗ trợ FREQ=DAILY|WEEKLY|HOURLY, INTERVAL=n và BYDAY=MO,TU,...
+    Giờ/phút kêu lấy từ báo thức; với INTERVAL > 1, lần kêu trước làm mốc.
+    """
+    __slots__ = ('freq', 'interval', 'weekdays')
+
+    # Recurrence là bất biến nên các báo thức cùng quy tắc dùng chung một đối tượng
+    _parsed = {}
+    MAX_PARSED = 256
+
+    FREQUENCIES = ('DAILY', 'WEEKLY', 'HOURLY')
+    WEEKDAY_CODES = ('MO', 'TU', 'WE', 'TH', 'FR', 'SA', 'SU')
+    WEEKDAY_NAMES = ('T2', 'T3', 'T4', 'T5', 'T6', 'T7', 'CN')
+
+    def __init__(self, freq='DAILY', interval=1, weekdays=()):
+        if freq not in self.FREQUENCIES:
+            raise ValueError(f"Không hỗ trợ FREQ={freq}")
+        interval = int(interval)
+        if interval < 1:
+            raise ValueError("INTERVAL phải lớn hơn 0")
+        weekdays = tuple(sorted(set(weekdays)))  # 0 = Thứ 2, 6 = Chủ nhật
+        if freq == 'WEEKLY' and not weekdays:
+            raise ValueError("Cần chọn ít nhất một ngày trong tuần")
+        self.freq = freq
+        self.interval = interval
+        self.weekdays = weekdays if freq == 'WEEKLY' else ()
+
+    @classmethod
+    def parse(cls, rule):
+        """Tạo Recurrence từ chuỗi RRULE, ví dụ FREQ=WEEKLY;BYDAY=MO,WE,FR"""
+        cached = cls._parsed.get(rule)
+        if cached is not None:
+            return cached
+        recurrence = cls._parse(rule)
+        if len(cls._parsed) < cls.MAX_PARSED:
+            cls._parsed[rule] = recurrence
+        return recurrence
+
+    @classmethod
+    def _parse(cls, rule):
+        rule = rule.strip()
+        if rule.upper().startswith('RRULE:'):
+            rule = rule[len('RRULE:'):]
+        parts = {}
+        for part in filter(None, rule.upper().split(';')):
+            key, sep, value = part.partition('=')
+            if not sep:
+                raise ValueError(f"RRULE không hợp lệ: {part}")
+            parts[key.strip()] = value.strip()
+
+        unsupported = set(parts) - {'FREQ', 'INTERVAL', 'BYDAY'}
+        if unsupported:
+            raise ValueError(f"Không hỗ trợ: {', '.join(sorted(unsupported))}")
+
+        freq = parts.get('FREQ', 'DAILY')
+        try:
+            interval = int(parts.get('INTERVAL', 1))
+        except ValueError:
+            raise ValueError(f"INTERVAL không hợp lệ: {parts['INTERVAL']}")
+        weekdays = []
+        for code in filter(None, parts.get('BYDAY', '').split(',')):
+            if code not in cls.WEEKDAY_CODES:
+                raise ValueError(f"BYDAY không hợp lệ: {code}")
+            weekdays.append(cls.WEEKDAY_CODES.index(code))
+
+        # FREQ=DAILY;BYDAY=... tương đương với hằng tuần vào các ngày đó
+        if weekdays and freq == 'DAILY' and interval == 1:
+            freq = 'WEEKLY'
+        elif weekdays and freq != 'WEEKLY':
+            raise ValueError(f"BYDAY không dùng được với FREQ={freq}")
+        return cls(freq, interval, weekdays)
+
+    def to_rrule(self):
+        parts = [f"FREQ={self.freq}"]
+        if self.interval != 1:
+            parts.append(f"INTERVAL={self.interval}")
+        if self.weekdays:
+            parts.append("BYDAY=" + ",".join(self.WEEKDAY_CODES[day] for day in self.weekdays))
+        return ";".join(parts)
+
+    def describe(self):
+        """Mô tả ngắn gọn bằng tiếng Việt"""
+        if self.freq == 'HOURLY':
+            return f"Mỗi {self.interval} giờ"
+        if self.freq == 'DAILY':
+            return "Hằng ngày" if self.interval == 1 else f"Mỗi {self.interval} ngày"
+        days = ", ".join(self.WEEKDAY_NAMES[day] for day in self.weekdays)
+        return days if self.interval == 1 else f"{days} (mỗi {self.interval} tuần)"
+
+    def __eq__(self, other):
+        return isinstance(other, Recurrence) and self.to_rrule() == other.to_rrule()
+
+    def __hash__(self):
+        return hash(self.to_rrule())
+
+    def next_after(self, now, hour, minute, last=None):
+        """Lần kêu đầu tiên sau now
+
+        Args:
+            now: Thời điểm hiện tại
+            hour, minute: Giờ kêu của báo thức
+            last: Lần kêu trước (mốc cho INTERVAL), None nếu là báo thức mới
+        """
+        if self.freq == 'WEEKLY':
+            return self._next_weekly(now, hour, minute, last)
+
+        step = timedelta(days=self.interval) if self.freq == 'DAILY' else timedelta(hours=self.interval)
+        if last is None:
+            candidate = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+            if self.freq == 'DAILY':
+                # Báo thức mới: hôm nay nếu chưa qua giờ, không thì ngày mai
+                return candidate if candidate > now else candidate + timedelta(days=1)
+        else:
+            candidate = last
+        if candidate <= now:
+            candidate += step * ((now - candidate) // step + 1)
+        return candidate
+
+    def _next_weekly(self, now, hour, minute, last):
+        anchor = (last or now).date()
+        anchor_monday = anchor - timedelta(days=anchor.weekday())
+        candidate = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+        for _ in range(7 * self.interval + 7):
+            monday = candidate.date() - timedelta(days=candidate.weekday())
+            if (candidate > now and candidate.weekday() in self.weekdays
+                    and ((monday - anchor_monday).days // 7) % self.interval == 0):
+                return candidate
+            candidate += timedelta(days=1)
+        raise ValueError("Không tìm được lần kêu tiếp theo")
+
+class Alarm:
+    """Dữ liệu một báo thức
+
+    Dùng __slots__ để mỗi báo thức chiếm ít bộ nhớ hơn dict. Đối tượng được
+    coi là bất biến (AlarmStore chia sẻ nó giữa các thread): muốn thay đổi
+    thì tạo bản mới bằng replace().
+
+    alarm_time có thể được truyền dưới dạng chuỗi ISO (khi load) và chỉ được
+    chuyển sang datetime ở lần truy cập đầu tiên.
+    """
+    # Cách tắt báo thức
+    DISMISS_MATH = 'math'  # Giải đúng math_count bài toán
+    DISMISS_POSE = 'pose'  # Ngồi thẳng trước camera pose_seconds giây
+
+    FIELDS = ('name', 'hour', 'minute', 'file', 'alarm_time', 'enabled',
+              'math_count', 'recurrence', 'dismiss_mode', 'pose_seconds')
+    __slots__ = ('name', 'hour', 'minute', 'file', '_alarm_time', 'enabled',
+                 'math_count', 'recurrence', 'dismiss_mode', 'pose_seconds')
+
+    def __init__(self, hour, minute, file=None, name=None, alarm_time=None,
+                 enabled=True, math_count=1, recurrence=None,
+                 dismiss_mode=DISMISS_MATH, pose_seconds=3):
+        self.name = name
+        self.hour = hour
+        self.minute = minute
+        self.file = file
+        self._alarm_time = alarm_time  # Lần kêu tiếp theo (datetime hoặc chuỗi ISO)
+        self.enabled = enabled
+        self.math_count = math_count  # Số bài toán cần giải đúng
+        self.recurrence = recurrence or Recurrence()  # Mặc định: hằng ngày
+        self.dismiss_mode = dismiss_mode
+        self.pose_seconds = pose_seconds  # Số giây cần ngồi thẳng (dismiss_mode == 'pose')
+
+    @property
+    def time(self):
+        """(giờ, phút) theo định dạng 24h"""
+        return (self.hour, self.minute)
+
+    @property
+    def alarm_time(self):
+        """datetime lần kêu tiếp theo (None nếu chưa đặt)"""
+        value = self._alarm_time
+        if isinstance(value, str):
+            # Kết quả luôn như nhau nên ghi đè từ nhiều thread cũng không sao
+            value = datetime.fromisoformat(value)
+            self._alarm_time = value
+        return value
+
+    @property
+    def raw_alarm_time(self):
+        """alarm_time như đang lưu (datetime hoặc chuỗi ISO), không chuyển đổi"""
+        return self._alarm_time
+
+    def is_due(self, now):
+        """alarm_time đã qua (<= now) chưa
+
+        Chuỗi ISO không có múi giờ so sánh được trực tiếp với nhau nên không
+        cần chuyển sang datetime.
+        """
+        value = self._alarm_time
+        if value is None:
+            return False
+        if isinstance(value, str) and len(value) in (19, 26):
+            return value <= now.isoformat()
+        return self.alarm_time <= now
+
+    def next_fire(self, now, after_fire=True):
+        """Lần kêu tiếp theo sau now
+
+        after_fire=False khi vừa đặt/sửa giờ: không dùng alarm_time cũ làm mốc.
+        """
+        last = self.alarm_time if after_fire else None
+        return self.recurrence.next_after(now, self.hour, self.minute, last)
+
+    def replace(self, **changes):
+        """Tạo bản sao với một số trường được thay đổi"""
+        fields = {field: getattr(self, field) for field in self.FIELDS if field != 'alarm_time'}
+        fields['alarm_time'] = self._alarm_time
+        fields.update(changes)
+        return Alarm(**fields)
+
+    def to_json(self):
+        """Bản ghi JSON (định dạng của alarms_data.json)"""
+        alarm_time = self._alarm_time
+        if isinstance(alarm_time, datetime):
+            alarm_time = alarm_time.isoformat()
+        return {
+            'name': self.name,
+            'time': [self.hour, self.minute],
+            'file': self.file,
+            'alarm_time': alarm_time,
+            'enabled': self.enabled,
+            'math_count': self.math_count,
+            'recurrence': self.recurrence.to_rrule(),
+            'dismiss_mode': self.dismiss_mode,
+            'pose_seconds': self.pose_seconds,
+        }
+
+    @classmethod
+    def from_json(cls, record):
+        """Tạo Alarm từ bản ghi JSON (alarm_time được giữ dạng chuỗi cho đến khi cần)"""
+        # 'time' trong JSON là list [giờ, phút]
+        hour, minute = record.get('time', (0, 0))
+        return cls(
+            hour, minute,
+            file=record.get('file'),
+            name=record.get('name'),
+            alarm_time=record.get('alarm_time') or None,
+            enabled=record.get('enabled', True),
+            math_count=record.get('math_count', 1),
+            recurrence=Recurrence.parse(record.get('recurrence') or 'FREQ=DAILY'),
+            dismiss_mode=record.get('dismiss_mode', cls.DISMISS_MATH),
+            pose_seconds=record.get('pose_seconds', 3),
+        )
+
+class AlarmStore(Mapping):
+    """Kho báo thức dùng chung giữa Tk thread và các thread nền (copy-on-write)
+
+    Người đọc dùng snapshot(): một view chỉ đọc không bao giờ thay đổi nên
+    không cần khóa. Người ghi sao chép dict, áp dụng thay đổi rồi thay thế
+    phiên bản cũ. Dữ liệu từng báo thức được coi là bất biến: muốn sửa thì
+    put đối tượng mới (hoặc dùng update).
+    """
+    def __init__(self, alarms=None):
+        self._write_lock = threading.Lock()
+        self._snapshot = MappingProxyType(dict(alarms or {}))
+
+    def snapshot(self):
+        """View chỉ đọc của phiên bản hiện tại"""
+        return self._snapshot
+
+    def __getitem__(self, alarm_id):
+        return self._snapshot[alarm_id]
+
+    def __iter__(self):
+        return iter(self._snapshot)
+
+    def __len__(self):
+        return len(self._snapshot)
+
+    def _swap(self, mutate):
+        with self._write_lock:
+            alarms = dict(self._snapshot)
+            mutate(alarms)
+            self._snapshot = MappingProxyType(alarms)
+
+    def put(self, alarm_id, alarm):
+        """Thêm hoặc thay thế một báo thức"""
+        self._swap(lambda alarms: alarms.__setitem__(alarm_id, alarm))
+
+    def update(self, alarm_id, **changes):
+        """Thay một số trường của báo thức bằng đối tượng mới"""
+        def mutate(alarms):
+            alarms[alarm_id] = alarms[alarm_id].replace(**changes)
+        self._swap(mutate)
+
+    def delete(self, alarm_id):
+        """Xóa báo thức (nếu có)"""
+        self._swap(lambda alarms: alarms.pop(alarm_id, None))
+
+    def replace_all(self, alarms):
+        """Thay toàn bộ dữ liệu (dùng khi load)"""
+        self._swap(lambda current: (current.clear(), current.update(alarms)))
+
+class AlarmScheduler:
+    """Lập lịch báo thức bằng min-heap theo alarm_time
+
+    Thread kiểm tra chỉ ngủ đúng đến thời điểm báo thức gần nhất và được
+    đánh thức khi danh sách báo thức thay đổi. Các mục cũ trong heap
+    (đã hủy hoặc đã lên lịch lại) bị bỏ qua khi lấy ra.
+
+    Nếu lead_time > 0, mỗi báo thức còn có thêm sự kiện PREPARE trước giờ
+    kêu lead_time giây để chuẩn bị trước (giải mã nhạc chuông...). Tương tự,
+    warmup_time > 0 thêm sự kiện WARMUP (mở camera, tải model...).
+
+    reset() nhận cả alarm_time dạng chuỗi ISO: các chuỗi được xếp vào một
+    heap riêng (so sánh chuỗi, không cần parse) và chỉ được chuyển sang
+    datetime khi báo thức có thể là báo thức kế tiếp.
+    """
+    FIRE = 'fire'
+    PREPARE = 'prepare'
+    WARMUP = 'warmup'
+
+    # Giới hạn thời gian ngủ để đồng bộ lại khi đồng hồ hệ thống thay đổi
+    # (sleep/hibernate, chỉnh giờ)
+    MAX_WAIT = 60.0
+
+    def __init__(self, lead_time=0, warmup_time=0):
+        self.lead_time = lead_time
+        self.warmup_time = warmup_time
+        self._heap = []  # [(timestamp, seq, loại sự kiện, alarm_id)]
+        self._pending = []  # [(chuỗi ISO, seq, alarm_id)] chưa parse, chưa có trong _heap
+        self._entries = {}  # {alarm_id: seq của mục còn hiệu lực}
+        self._counter = itertools.count()
+        self._cond = threading.Condition()
+
+    def _make_items(self, alarm_id, alarm_time, seq=None):
+        if seq is None:
+            seq = next(self._counter)
+            self._entries[alarm_id] = seq
+        deadline = alarm_time.timestamp()
+        items = [(deadline, seq, self.FIRE, alarm_id)]
+        if self.lead_time > 0:
+            items.append((deadline - self.lead_time, seq, self.PREPARE, alarm_id))
+        if self.warmup_time > 0:
+            items.append((deadline - self.warmup_time, seq, self.WARMUP, alarm_id))
+        return items
+
+    def schedule(self, alarm_id, alarm_time):
+        """Lên lịch (hoặc lên lịch lại) báo thức tại alarm_time"""
+        with self._cond:
+            for item in self._make_items(alarm_id, alarm_time):
+                heapq.heappush(self._heap, item)
+            self._compact()
+            self._cond.notify()
+
+    def cancel(self, alarm_id):
+        """Hủy lịch của báo thức"""
+        with self._cond:
+            if self._entries.pop(alarm_id, None) is not None:
+                self._compact()
+                self._cond.notify()
+
+    def reset(self, schedule_items):
+        """Thay toàn bộ lịch bằng danh sách (alarm_id, alarm_time)
+
+        alarm_time là datetime hoặc chuỗi ISO không có múi giờ.
+        """
+        with self._cond:
+            self._entries = {}
+            self._heap = []
+            self._pending = []
+            for alarm_id, alarm_time in schedule_items:
+                if isinstance(alarm_time, str) and len(alarm_time) in (19, 26):
+                    # Chuỗi ISO không múi giờ so sánh được trực tiếp với nhau
+                    seq = next(self._counter)
+                    self._entries[alarm_id] = seq
+                    self._pending.append((alarm_time, seq, alarm_id))
+                else:
+                    if isinstance(alarm_time, str):
+                        alarm_time = datetime.fromisoformat(alarm_time)
+                    self._heap.extend(self._make_items(alarm_id, alarm_time))
+            heapq.heapify(self._heap)
+            heapq.heapify(self._pending)
+            self._cond.notify()
+
+    def _promote_pending(self):
+        """Parse và đưa vào heap các báo thức chưa parse có thể đến lượt trước gốc heap"""
+        lead = max(self.lead_time, self.warmup_time, 0)
+        while self._pending:
+            alarm_time, seq, alarm_id = self._pending[0]
+            if self._entries.get(alarm_id) != seq:
+                heapq.heappop(self._pending)  # Đã hủy hoặc đã lên lịch lại
+                continue
+            alarm_time = datetime.fromisoformat(alarm_time)
+            if self._heap and alarm_time.timestamp() - lead > self._heap[0][0]:
+                return
+            heapq.heappop(self._pending)
+            for item in self._make_items(alarm_id, alarm_time, seq):
+                heapq.heappush(self._heap, item)
+
+    def _pending_item(self, index):
+        # Mục FIRE tương ứng với _pending[index]
+        alarm_time, seq, alarm_id = self._pending[index]
+        return (datetime.fromisoformat(alarm_time).timestamp(), seq, self.FIRE, alarm_id)
+
+    def wait_next(self):
+        """Chặn cho đến khi có sự kiện đến hạn, trả về (loại sự kiện, alarm_id)"""
+        with self._cond:
+            while True:
+                self._discard_stale()
+                self._promote_pending()
+                if not self._heap:
+                    self._cond.wait()
+                    continue
+
+                deadline, seq, kind, alarm_id = self._heap[0]
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    heapq.heappop(self._heap)
+                    if kind == self.FIRE:
+                        del self._entries[alarm_id]
+                    return kind, alarm_id
+
+                self._cond.wait(min(remaining, self.MAX_WAIT))
+
+    def upcoming(self, count, next_fn=None):
+        """count lần kêu sớm nhất theo thứ tự: [(datetime, alarm_id)]
+
+        Duyệt cây heap từ gốc theo thứ tự tăng dần nên chỉ chạm vào
+        O(count) nút thay vì sắp xếp toàn bộ lịch. next_fn(alarm_id, when)
+        trả về lần kêu sau when (hoặc None) để liệt kê cả các lần lặp lại.
+        """
+        with self._cond:
+            heap, pending = self._heap, self._pending
+            # Chỉ số >= 0: nút trong _heap; -1: lần lặp lại; <= -2: nút -index - 2 trong _pending
+            frontier = []
+            if heap:
+                frontier.append((heap[0], 0))
+            if pending:
+                frontier.append((self._pending_item(0), -2))
+            heapq.heapify(frontier)
+            results = []
+            while frontier and len(results) < count:
+                item, index = heapq.heappop(frontier)
+                if index != -1:
+                    if index >= 0:
+                        children = [(heap[child], child)
+                                    for child in (2 * index + 1, 2 * index + 2) if child < len(heap)]
+                    else:
+                        position = -index - 2
+                        children = [(self._pending_item(child), -child - 2)
+                                    for child in (2 * position + 1, 2 * position + 2)
+                                    if child < len(pending)]
+                    for child in children:
+                        heapq.heappush(frontier, child)
+                    if item[2] != self.FIRE or not self._is_current(item):
+                        continue
+
+                deadline, seq, kind, alarm_id = item
+                when = datetime.fromtimestamp(deadline)
+                results.append((when, alarm_id))
+                next_time = next_fn(alarm_id, when) if next_fn else None
+                if next_time is not None:
+                    # Lần lặp tiếp theo không nằm trong heap (index = -1)
+                    heapq.heappush(frontier, ((next_time.timestamp(), seq, kind, alarm_id), -1))
+            return results
+
+    def _is_current(self, item):
+        return self._entries.get(item[3]) == item[1]
+
+    def _discard_stale(self):
+        while self._heap and not self._is_current(self._heap[0]):
+            heapq.heappop(self._heap)
+
+    def _compact(self):
+        # Dựng lại heap khi số mục cũ vượt quá số mục còn hiệu lực
+        if len(self._heap) + len(self._pending) > 4 * len(self._entries) + 64:
+            self._heap = [item for item in self._heap if self._is_current(item)]
+            heapq.heapify(self._heap)
+            self._pending = [item for item in self._pending
+                             if self._entries.get(item[2]) == item[1]]
+            heapq.heapify(self._pending)
+
+class AudioEngine:
+    """Giải mã trước nhạc chuông vào bộ nhớ để phát ngay khi báo thức kêu
+
+    Các pygame.mixer.Sound đã giải mã được giữ trong cache LRU giới hạn theo
+    tổng số byte. File giải mã ra lớn hơn cả cache được phát dạng stream
+    bằng pygame.mixer.music như trước (chỉ một file stream tại một thời điểm).
+
+    Mỗi báo thức đang kêu được cấp một channel từ pool có kích thước cố
+    định; khi hết channel, các báo thức còn lại chờ đến lượt. Lỗi khi phát
+    nhạc cho báo thức đang chờ được báo qua on_error(key, exception).
+    """
+    def __init__(self, max_bytes=128 * 1024 * 1024, max_channels=8, on_error=None):
+        import_pygame()
+        if not pygame.mixer.get_init():
+            pygame.mixer.init()
+        self.max_bytes = max_bytes
+        self._cache = OrderedDict()  # {path: (mtime, Sound, số byte)}
+        self._total_bytes = 0
+        self._stream_only = {}  # {path: mtime} các file quá lớn để cache
+        self._lock = threading.Lock()
+        self._preload_queue = queue.Queue()
+        self._preload_thread = None
+
+        # Pool channel cho các báo thức đang kêu, thêm một channel riêng cho giọng nói
+        pygame.mixer.set_num_channels(max_channels + 1)
+        self._free_channels = [pygame.mixer.Channel(i) for i in range(max_channels)]
+        self._voice_channel = pygame.mixer.Channel(max_channels)
+        self._playing = {}  # {key: Channel, hoặc None nếu đang phát bằng mixer.music}
+        self._waiting = OrderedDict()  # {key: (path, loops)} chờ channel trống
+        self._play_lock = threading.RLock()
+        self.on_error = on_error
+
+    @staticmethod
+    def _sound_bytes(sound):
+        frequency, sample_format, channels = pygame.mixer.get_init()
+        return int(sound.get_length() * frequency * channels * abs(sample_format) // 8)
+
+    def _get_cached(self, path, mtime):
+        with self._lock:
+            entry = self._cache.get(path)
+            if entry is not None and entry[0] == mtime:
+                self._cache.move_to_end(path)
+                return entry[1]
+        return None
+
+    def _load(self, path):
+        """Lấy Sound từ cache hoặc giải mã file; trả về None nếu file phải phát stream"""
+        mtime = os.path.getmtime(path)
+        sound = self._get_cached(path, mtime)
+        if sound is not None or self._stream_only.get(path) == mtime:
+            return sound
+
+        sound = pygame.mixer.Sound(path)
+        size = self._sound_bytes(sound)
+        if size > self.max_bytes:
+            self._stream_only[path] = mtime
+            return None
+
+        with self._lock:
+            old = self._cache.pop(path, None)
+            if old is not None:
+                self._total_bytes -= old[2]
+            self._cache[path] = (mtime, sound, size)
+            self._total_bytes += size
+            # Bỏ các file ít dùng nhất cho đến khi vừa giới hạn
+            while self._total_bytes > self.max_bytes:
+                _, (_, _, evicted_size) = self._cache.popitem(last=False)
+                self._total_bytes -= evicted_size
+        return sound
+
+    def preload(self, path, on_done=None):
+        """Giải mã file ở thread nền để sẵn sàng phát
+
+        on_done(error) được gọi trên thread nền khi xong, error là None nếu
+        file phát được (file quá lớn để cache cũng đã được giải mã thử).
+        """
+        if self._preload_thread is None:
+            self._preload_thread = threading.Thread(target=self._preload_worker, daemon=True)
+            self._preload_thread.start()
+        self._preload_queue.put((path, on_done))
+
+    def _preload_worker(self):
+        while True:
+            path, on_done = self._preload_queue.get()
+            error = None
+            try:
+                self._load(path)
+            except Exception as e:
+                error = e
+                if on_done is None:
+                    print(f"Không thể tải trước file nhạc {path}: {e}")
+            if on_done is not None:
+                on_done(error)
+
+    def play(self, key, path, loops=-1):
+        """Phát nhạc cho key (thường là alarm_id), từ bộ nhớ nếu đã giải mã trước
+
+        Ném exception nếu file không phát được. Nếu pool đã hết channel,
+        nhạc sẽ được phát khi có channel trống.
+        """
+        # Giải mã ngay để báo lỗi cho người gọi
+        self._load(path)
+        with self._play_lock:
+            if key in self._playing or key in self._waiting:
+                return
+            self._waiting[key] = (path, loops)
+            self._start_waiting()
+
+    def _start_waiting(self):
+        for key, (path, loops) in list(self._waiting.items()):
+            try:
+                sound = self._load(path)
+                if sound is None:
+                    if None in self._playing.values():
+                        continue  # mixer.music đang được báo thức khác dùng
+                    pygame.mixer.music.load(path)
+                    pygame.mixer.music.play(loops)
+                    self._playing[key] = None
+                elif self._free_channels:
+                    channel = self._free_channels.pop()
+                    channel.play(sound, loops)
+                    self._playing[key] = channel
+                else:
+                    continue  # Hết channel; file phát stream phía sau vẫn được thử
+            except Exception as e:
+                print(f"Không thể phát nhạc {path}: {e}")
+                if self.on_error:
+                    self.on_error(key, e)
+            del self._waiting[key]
+
+    def stop(self, key):
+        """Dừng nhạc của key và nhường channel cho báo thức đang chờ"""
+        with self._play_lock:
+            self._waiting.pop(key, None)
+            if key not in self._playing:
+                return
+            channel = self._playing.pop(key)
+            if channel is None:
+                pygame.mixer.music.stop()
+            else:
+                channel.stop()
+                self._free_channels.append(channel)
+            self._start_waiting()
+
+    def stop_all(self):
+        """Dừng toàn bộ nhạc báo thức"""
+        with self._play_lock:
+            self._waiting.clear()
+            for key in list(self._playing):
+                self.stop(key)
+
+    def play_voice(self, sound):
+        """Phát giọng nói trên channel riêng (ngắt câu đang đọc dở nếu có)"""
+        self._voice_channel.play(sound)
+
+def write_json_atomic(path, items):
+    """Ghi các cặp (key, value) thành object JSON ra file tạm rồi thay thế file cũ
+
+    Các cặp được ghi lần lượt nên không cần dựng cả dict trong bộ nhớ, và
+    không bao giờ để lại file ghi dở.
+    """
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        separator = "{\n  "
+        for key, value in items:
+            f.write(separator)
+            f.write(json.dumps(key, ensure_ascii=False))
+            f.write(": ")
+            f.write(json.dumps(value, ensure_ascii=False))
+            separator = ",\n  "
+        f.write("{}\n" if separator == "{\n  " else "\n}\n")
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+def alarm_records(snapshot):
+    """Sinh ra (alarm_id, bản ghi JSON) từ {alarm_id: Alarm}, mỗi lần một bản ghi"""
+    for alarm_id, alarm in snapshot.items():
+        yield alarm_id, alarm.to_json()
+
+def iter_json_object(path, chunk_size=64 * 1024):
+    """Đọc dần object JSON cấp cao nhất trong file: sinh ra từng (key, value)
+
+    File được đọc theo từng khối chunk_size nên bộ nhớ chỉ cần chứa một bản
+    ghi tại một thời điểm thay vì cả file. Không sinh ra gì nếu file không
+    tồn tại; lỗi định dạng gây ra json.JSONDecodeError như json.load.
+    """
+    if not os.path.exists(path):
+        return
+    decoder = json.JSONDecoder()
+    with open(path, 'r', encoding='utf-8') as f:
+        buf = ''
+        pos = 0
+        eof = False
+
+        def read_more():
+            nonlocal buf, pos, eof
+            chunk = f.read(chunk_size)
+            if not chunk:
+                eof = True
+                return False
+            # Bỏ phần đã xử lý để bộ đệm không lớn dần
+            buf = buf[pos:] + chunk
+            pos = 0
+            return True
+
+        def next_char():
+            # Ký tự khác khoảng trắng tiếp theo (không tiêu thụ), '' nếu hết file
+            nonlocal pos
+            while True:
+                while pos < len(buf) and buf[pos] in ' \t\n\r':
+                    pos += 1
+                if pos < len(buf):
+                    return buf[pos]
+                if not read_more():
+                    return ''
+
+        def expect(chars):
+            nonlocal pos
+            char = next_char()
+            if not char or char not in chars:
+                raise json.JSONDecodeError(f"Expecting one of {chars!r}", buf, pos)
+            pos += 1
+            return char
+
+        def decode_value():
+            nonlocal pos
+            next_char()
+            while True:
+                try:
+                    value, end = decoder.raw_decode(buf, pos)
+                except json.JSONDecodeError:
+                    # Giá trị bị cắt ở cuối khối, đọc thêm rồi thử lại
+                    if read_more():
+                        continue
+                    raise
+                if end == len(buf) and not eof and read_more():
+                    # Số có thể còn tiếp ở khối sau
+                    continue
+                pos = end
+                return value
+
+        expect('{')
+        if next_char() == '}':
+            pos += 1
+        else:
+            while True:
+                key = decode_value()
+                if not isinstance(key, str):
+                    raise json.JSONDecodeError("Expecting property name", buf, pos)
+                expect(':')
+                yield key, decode_value()
+                if expect(',}') == '}':
+                    break
+        if next_char():
+            raise json.JSONDecodeError("Extra data", buf, pos)
+
+class JsonAlarmStorage:
+    """Lưu toàn bộ báo thức vào một file JSON, ghi lại cả file mỗi lần thay đổi
+
+    Không giữ bản ghi nào trong bộ nhớ: file được đọc dần khi load và được
+    ghi lại từ snapshot của AlarmStore.
+    """
+    def __init__(self, path):
+        self.path = path
+
+    def load(self):
+        """Đọc dần các bản ghi, sinh ra từng (alarm_id, bản ghi)"""
+        return iter_json_object(self.path)
+
+    def apply(self, changes, snapshot):
+        """Ghi lại cả file từ snapshot {alarm_id: Alarm} (đã gồm các thay đổi changes)"""
+        write_json_atomic(self.path, alarm_records(snapshot))
+
+    def close(self):
+        pass
+
+class JournalAlarmStorage:
+    """Lưu báo thức bằng snapshot JSON + journal chỉ ghi thêm
+
+    Mỗi thay đổi chỉ ghi thêm một dòng vào journal. Khi journal vượt quá
+    compact_threshold dòng, snapshot mới được ghi ở thread nền (từ snapshot
+    của AlarmStore, không giữ bản sao bản ghi) và journal được làm trống.
+    Snapshot có cùng định dạng với alarms_data.json cũ.
+    """
+    def __init__(self, path, compact_threshold=500):
+        self.path = path
+        self.journal_path = f"{path}.journal"
+        # Journal đang được gộp vào snapshot
+        self.compacting_path = f"{path}.journal.old"
+        self.compact_threshold = compact_threshold
+        self._journal = None
+        self._journal_entries = 0
+        self._lock = threading.Lock()
+        self._compact_thread = None
+
+    def load(self):
+        """Đọc snapshot và journal, sinh ra từng (alarm_id, bản ghi)
+
+        Journal (tối đa vài compact_threshold dòng) được đọc trước, snapshot
+        được đọc dần và các bản ghi bị journal sửa/xóa được thay thế khi gặp.
+        Journal cũ còn sót lại từ lần gộp bị ngắt được gộp ở lần ghi tiếp theo.
+        """
+        changes = {}  # {alarm_id: bản ghi hoặc None nếu đã xóa}
+        self._journal_entries = sum(self._replay(journal_path, changes)
+                                    for journal_path in (self.compacting_path, self.journal_path))
+
+        for alarm_id, record in iter_json_object(self.path):
+            if alarm_id in changes:
+                record = changes.pop(alarm_id)
+                if record is None:
+                    continue
+            yield alarm_id, record
+        # Các báo thức được thêm sau lần gộp cuối
+        for alarm_id, record in changes.items():
+            if record is not None:
+                yield alarm_id, record
+
+    @staticmethod
+    def _replay(journal_path, changes):
+        """Đọc các thay đổi trong journal vào changes, trả về số dòng hợp lệ"""
+        if not os.path.exists(journal_path):
+            return 0
+        entries = 0
+        with open(journal_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    # Dòng cuối bị ghi dở khi ứng dụng bị tắt đột ngột
+                    print(f"Bỏ qua dòng lỗi trong {journal_path}")
+                    continue
+                if entry.get('op') == 'put':
+                    changes[entry['id']] = entry['alarm']
+                elif entry.get('op') == 'delete':
+                    changes[entry['id']] = None
+                entries += 1
+        return entries
+
+    def _open_journal(self):
+        """Mở journal để ghi thêm ở lần apply() đầu tiên"""
+        if self._journal is None:
+            self._journal = open(self.journal_path, 'a', encoding='utf-8')
+            if self._journal.tell() > 0 and not self._ends_with_newline(self.journal_path):
+                # Tách dòng ghi dở khỏi các dòng ghi thêm sau này
+                self._journal.write("\n")
+                self._journal.flush()
+        return self._journal
+
+    @staticmethod
+    def _ends_with_newline(path):
+        with open(path, 'rb') as f:
+            f.seek(-1, os.SEEK_END)
+            return f.read(1) == b"\n"
+
+    def apply(self, changes, snapshot):
+        """Ghi thêm nhiều thay đổi {alarm_id: bản ghi hoặc None để xóa} cùng lúc
+
+        snapshot là {alarm_id: Alarm} hiện tại (đã gồm changes), dùng khi gộp journal.
+        """
+        with self._lock:
+            if not changes:
+                return
+            self._open_journal().write("".join(
+                json.dumps({'op': 'delete', 'id': alarm_id} if record is None
+                           else {'op': 'put', 'id': alarm_id, 'alarm': record},
+                           ensure_ascii=False) + "\n"
+                for alarm_id, record in changes.items()
+            ))
+            self._journal.flush()
+            self._journal_entries += len(changes)
+            if self._journal_entries >= self.compact_threshold:
+                self._start_compaction(snapshot)
+
+    def _start_compaction(self, snapshot):
+        """Chuyển journal hiện tại sang file tạm và ghi snapshot ở thread nền
+
+        snapshot không bao giờ thay đổi (AlarmStore là copy-on-write) nên
+        thread nền đọc được mà không cần sao chép.
+        """
+        if self._compact_thread is not None and self._compact_thread.is_alive():
+            return
+        if os.path.exists(self.compacting_path):
+            # Lần gộp trước bị lỗi và journal cũ chưa vào snapshot: không được
+            # ghi đè nó, gộp cả hai journal ngay tại đây
+            try:
+                write_json_atomic(self.path, alarm_records(snapshot))
+                os.remove(self.compacting_path)
+            except Exception as e:
+                # Cả hai journal vẫn còn, sẽ thử lại ở lần ghi sau
+                print(f"Lỗi khi gộp journal: {e}")
+                return
+            self._journal.truncate(0)
+            self._journal_entries = 0
+            return
+        self._journal.close()
+        os.replace(self.journal_path, self.compacting_path)
+        self._journal = open(self.journal_path, 'a', encoding='utf-8')
+        self._journal_entries = 0
+
+        self._compact_thread = threading.Thread(
+            target=self._write_snapshot, args=(snapshot,), daemon=True
+        )
+        self._compact_thread.start()
+
+    def _write_snapshot(self, snapshot):
+        try:
+            write_json_atomic(self.path, alarm_records(snapshot))
+            os.remove(self.compacting_path)
+        except Exception as e:
+            # Journal cũ vẫn còn, sẽ được áp dụng lại ở lần load sau
+            print(f"Lỗi khi gộp journal: {e}")
+
+    def _wait_for_compaction(self):
+        if self._compact_thread is not None:
+            self._compact_thread.join()
+            self._compact_thread = None
+
+    def close(self):
+        self._wait_for_compaction()
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
+
+class SqliteAlarmStorage:
+    """Lưu báo thức trong SQLite, có index (enabled, alarm_time) để tìm báo thức kế tiếp
+
+    Database nằm cạnh file JSON (alarms_data.db). Lần đầu tạo database,
+    dữ liệu trong file JSON cũ được chuyển sang một lần.
+    """
+    # Các trường có cột riêng, những trường khác được lưu trong cột extra (JSON)
+    COLUMNS = ('name', 'file', 'alarm_time', 'enabled', 'math_count')
+    LOAD_BATCH_SIZE = 1000  # Số dòng đọc/ghi mỗi lần khi load và chuyển dữ liệu
+
+    def __init__(self, path):
+        self.json_path = path
+        self.path = os.path.splitext(path)[0] + ".db"
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        is_new = not os.path.exists(self.path)
+        # Writer có thể chạy ở thread khác, truy cập được bảo vệ bởi self._lock
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        with self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS alarms ("
+                " id TEXT PRIMARY KEY,"
+                " name TEXT,"
+                " hour INTEGER NOT NULL,"
+                " minute INTEGER NOT NULL,"
+                " file TEXT,"
+                " alarm_time TEXT,"
+                " enabled INTEGER NOT NULL DEFAULT 1,"
+                " math_count INTEGER NOT NULL DEFAULT 1,"
+                " extra TEXT)"
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_alarms_next_fire"
+                " ON alarms (enabled, alarm_time)"
+            )
+        if is_new:
+            self._migrate_from_json()
+
+    def _migrate_from_json(self):
+        """Chuyển dữ liệu từ alarms_data.json sang SQLite (chỉ chạy một lần)
+
+        Đọc qua JournalAlarmStorage để lấy cả các thay đổi còn nằm trong
+        journal (backend mặc định) chưa được gộp vào file JSON.
+        """
+        source = JournalAlarmStorage(self.json_path)
+        if not any(os.path.exists(path)
+                   for path in (source.path, source.journal_path, source.compacting_path)):
+            return
+        migrated = 0
+        rows = (self._to_row(alarm_id, record) for alarm_id, record in source.load())
+        try:
+            with self._conn:
+                for batch in iter(lambda: list(itertools.islice(rows, self.LOAD_BATCH_SIZE)), []):
+                    self._conn.executemany(
+                        "INSERT OR REPLACE INTO alarms VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", batch
+                    )
+                    migrated += len(batch)
+        finally:
+            source.close()
+        print(f"Đã chuyển {migrated} báo thức từ {self.json_path} sang {self.path}")
+
+    @classmethod
+    def _to_row(cls, alarm_id, record):
+        # 'time' trong JSON là list [giờ, phút]
+        hour, minute = record.get('time', (0, 0))
+        extra = {key: value for key, value in record.items()
+                 if key not in cls.COLUMNS and key != 'time'}
+        return (
+            alarm_id,
+            record.get('name'),
+            hour,
+            minute,
+            record.get('file'),
+            record.get('alarm_time'),
+            1 if record.get('enabled', True) else 0,
+            record.get('math_count', 1),
+            json.dumps(extra, ensure_ascii=False) if extra else None,
+        )
+
+    @staticmethod
+    def _from_row(row):
+        alarm_id, name, hour, minute, file, alarm_time, enabled, math_count, extra = row
+        record = json.loads(extra) if extra else {}
+        record.update({
+            'name': name,
+            'time': [hour, minute],
+            'file': file,
+            'alarm_time': alarm_time,
+            'enabled': bool(enabled),
+            'math_count': math_count,
+        })
+        return alarm_id, record
+
+    def _connection(self):
+        # Kết nối ở lần dùng đầu tiên (người gọi giữ self._lock)
+        if self._conn is None:
+            self._connect()
+        return self._conn
+
+    def load(self):
+        """Đọc dần các bản ghi theo từng lô, sinh ra từng (alarm_id, bản ghi)"""
+        with self._lock:
+            cursor = self._connection().execute("SELECT * FROM alarms")
+        while True:
+            with self._lock:
+                rows = cursor.fetchmany(self.LOAD_BATCH_SIZE)
+            if not rows:
+                return
+            for row in rows:
+                yield self._from_row(row)
+
+    def apply(self, changes, snapshot=None):
+        """Áp dụng nhiều thay đổi {alarm_id: bản ghi hoặc None để xóa} trong một transaction"""
+        with self._lock, self._connection() as conn:
+            conn.executemany(
+                "DELETE FROM alarms WHERE id = ?",
+                [(alarm_id,) for alarm_id, record in changes.items() if record is None]
+            )
+            conn.executemany(
+                "INSERT OR REPLACE INTO alarms VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [self._to_row(alarm_id, record)
+                 for alarm_id, record in changes.items() if record is not None]
+            )
+
+    def next_due(self, limit=1, after=None):
+        """limit báo thức đang bật sắp kêu nhất (alarm_time > after nếu có): [(alarm_id, bản ghi)]
+
+        Chỉ đọc index (enabled, alarm_time), không quét toàn bộ bảng. alarm_time
+        được lưu dạng chuỗi ISO nên so sánh chuỗi cũng là so sánh thời gian.
+        """
+        query = "SELECT * FROM alarms WHERE enabled = 1 AND alarm_time IS NOT NULL"
+        params = []
+        if after is not None:
+            query += " AND alarm_time > ?"
+            params.append(after.isoformat())
+        with self._lock:
+            rows = self._connection().execute(
+                query + " ORDER BY alarm_time LIMIT ?", (*params, limit)
+            ).fetchall()
+        return [self._from_row(row) for row in rows]
+
+    def due_before(self, when):
+        """Các báo thức đang bật có alarm_time <= when: [(alarm_id, bản ghi)]"""
+        with self._lock:
+            rows = self._connection().execute(
+                "SELECT * FROM alarms"
+                " WHERE enabled = 1 AND alarm_time IS NOT NULL AND alarm_time <= ?",
+                (when.isoformat(),)
+            ).fetchall()
+        return [self._from_row(row) for row in rows]
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+ALARM_STORAGE_BACKENDS = {
+    'json': JsonAlarmStorage,
+    'journal': JournalAlarmStorage,
+    'sqlite': SqliteAlarmStorage,
+}
+
+def create_alarm_storage(path, backend=None):
+    """Tạo storage theo tên backend (mặc định lấy từ biến môi trường ALARM_STORAGE)"""
+    backend = backend or os.environ.get('ALARM_STORAGE', 'journal')
+    if backend not in ALARM_STORAGE_BACKENDS:
+        raise ValueError(f"Không hỗ trợ kiểu lưu trữ: {backend}")
+    return ALARM_STORAGE_BACKENDS[backend](path)
+
+class AlarmWriter:
+    """Thread ghi dữ liệu báo thức nền
+
+    Các thay đổi được gộp lại trong cửa sổ debounce rồi ghi một lần, nên
+    Tk thread không bao giờ chờ I/O và mỗi cửa sổ có tối đa một lần ghi.
+    Ghi lỗi thì các thay đổi được giữ lại và thử lại sau RETRY_DELAY giây
+    (gấp đôi sau mỗi lần lỗi, tối đa MAX_RETRY_DELAY).
+    """
+    RETRY_DELAY = 0.5
+    MAX_RETRY_DELAY = 30.0
+    CLOSE_ATTEMPTS = 3  # Số lần thử ghi khi đóng trước khi bỏ cuộc
+
+    def __init__(self, storage, snapshot_fn, debounce=0.2, on_error=None):
+        self.storage = storage
+        self.snapshot_fn = snapshot_fn  # Trả về {alarm_id: Alarm} hiện tại
+        self.debounce = debounce
+        self.on_error = on_error
+        self._dirty = set()
+        self._closed = False
+        self._cond = threading.Condition()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def mark_dirty(self, alarm_id):
+        """Đánh dấu một báo thức cần được lưu (thêm/sửa/xóa)"""
+        with self._cond:
+            self._dirty.add(alarm_id)
+            self._cond.notify_all()
+
+    def close(self):
+        """Ghi nốt các thay đổi còn lại (kể cả các lần ghi lỗi đang chờ thử lại) và dừng thread"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join()
+
+    def _run(self):
+        failures = 0  # Số lần ghi lỗi liên tiếp
+        close_attempts = 0
+        while True:
+            with self._cond:
+                while not (self._dirty or self._closed):
+                    self._cond.wait()
+                if self._closed and not self._dirty:
+                    return
+
+                # Gom các thay đổi tiếp theo trong cửa sổ debounce, hoặc chờ
+                # đến lần thử lại nếu lần ghi trước bị lỗi (đóng thì ghi ngay)
+                if failures:
+                    delay = min(self.RETRY_DELAY * 2 ** (failures - 1), self.MAX_RETRY_DELAY)
+                else:
+                    delay = self.debounce
+                deadline = time.monotonic() + delay
+                while not self._closed:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+
+                dirty = self._dirty
+                self._dirty = set()
+                closed = self._closed
+
+            try:
+                self._write(dirty)
+            except Exception as e:
+                failures += 1
+                with self._cond:
+                    # Giữ lại để thử lại: journal và SQLite chỉ ghi các báo thức được đánh dấu
+                    self._dirty |= dirty
+                    pending = len(self._dirty)
+                print(f"Lỗi khi lưu dữ liệu: {e}")
+                # Chỉ báo lỗi một lần cho mỗi chuỗi lỗi liên tiếp
+                if failures == 1 and self.on_error:
+                    self.on_error(e)
+                if closed:
+                    close_attempts += 1
+                    if close_attempts >= self.CLOSE_ATTEMPTS:
+                        print(f"Bỏ qua {pending} thay đổi chưa lưu được")
+                        return
+            else:
+                failures = 0
+
+    def _write(self, dirty):
+        snapshot = self.snapshot_fn()
+        self.storage.apply({
+            alarm_id: snapshot[alarm_id].to_json() if alarm_id in snapshot else None
+            for alarm_id in dirty
+        }, snapshot)
+
+class AlarmEngine:
+    """Lõi báo thức: dữ liệu, lưu trữ, lập lịch và phát nhạc
+
+    Thread kiểm tra không gọi callback trực tiếp mà chuyển qua dispatch(fn,
+    *args) (giao diện Tk truyền root.after), nên các callback luôn chạy trên
+    thread của client. Các hàm thay đổi dữ liệu được gọi từ thread đó và gọi
+    callback ngay.
+
+    Callbacks:
+        on_warmup(alarm_id, alarm): báo thức sẽ kêu sau warmup_lead giây
+        on_fire(alarm_id, alarm): báo thức bắt đầu kêu
+        on_dismiss(alarm_id): báo thức đang kêu đã được tắt
+        on_change(alarm_id): dữ liệu hoặc lịch của báo thức thay đổi (kể cả khi bị xóa)
+        on_error(message): lỗi cần báo cho người dùng
+    """
+    SAVE_DEBOUNCE_SECONDS = 0.2  # Gộp các thay đổi trong khoảng này thành một lần ghi
+    AUDIO_PRELOAD_LEAD = 300  # Giải mã trước nhạc chuông bao nhiêu giây trước khi kêu
+
+    def __init__(self, data_file="alarms_data.json", backend=None, dispatch=None,
+                 on_fire=None, on_dismiss=None, on_change=None, on_error=None,
+                 on_warmup=None, warmup_lead=0):
+        self.data_file = data_file
+        self.dispatch = dispatch or (lambda fn, *args: fn(*args))
+        self.on_warmup = on_warmup
+        self.on_fire = on_fire
+        self.on_dismiss = on_dismiss
+        self.on_change = on_change
+        self.on_error = on_error
+
+        # Quản lý nhiều báo thức
+        self.alarms = AlarmStore()  # {alarm_id: Alarm}
+        self.active_alarms = OrderedDict()  # {alarm_id: Alarm} các báo thức đang kêu
+
+        self.storage = create_alarm_storage(data_file, backend)
+        self.writer = AlarmWriter(
+            self.storage,
+            snapshot_fn=self.alarms.snapshot,
+            debounce=self.SAVE_DEBOUNCE_SECONDS,
+            on_error=lambda e: self.report_error(f"Không thể lưu dữ liệu: {e}")
+        )
+
+        # Lập lịch báo thức (min-heap theo alarm_time)
+        # warmup_lead: gọi on_warmup bao nhiêu giây trước khi kêu (0 = không gọi)
+        self.scheduler = AlarmScheduler(lead_time=self.AUDIO_PRELOAD_LEAD,
+                                        warmup_time=warmup_lead if on_warmup else 0)
+        self._thread = None
+
+        # pygame mixer chỉ được khởi tạo khi cần (xem audio)
+        self._audio = None
+        self._audio_lock = threading.Lock()
+        # Một thread phát nhạc duy nhất nhận việc (fn, args) theo thứ tự từ hàng đợi
+        self._sound_jobs = queue.Queue()
+        self._sound_thread = None
+
+    @property
+    def audio(self):
+        """AudioEngine, khởi tạo pygame mixer ở lần dùng đầu tiên"""
+        if self._audio is None:
+            with self._audio_lock:
+                if self._audio is None:
+                    self._audio = AudioEngine(on_error=lambda key, e: self.report_error(
+                        f"Không thể phát nhạc: {e}"))
+        return self._audio
+
+    def report_error(self, message):
+        """Báo lỗi cho client (trên thread của client)"""
+        print(message)
+        if self.on_error:
+            self.dispatch(self.on_error, message)
+
+    def _notify(self, callback, *args):
+        if callback:
+            callback(*args)
+
+    def load(self):
+        """Load dữ liệu báo thức từ storage
+
+        Bản ghi được đọc dần từng cái, alarm_time chỉ được chuyển sang datetime
+        khi cần. Chỉ những báo thức có alarm_time bị dời tới mới được ghi lại.
+        """
+        try:
+            # Chuyển đổi bản ghi JSON thành Alarm
+            now = datetime.now()
+            loaded = {}
+            rolled_forward = []
+            for alarm_id, record in self.storage.load():
+                alarm = Alarm.from_json(record)
+                # Nếu alarm_time đã qua, tính lần kêu tiếp theo
+                if alarm.is_due(now):
+                    alarm = alarm.replace(alarm_time=alarm.next_fire(now))
+                    rolled_forward.append(alarm_id)
+
+                loaded[alarm_id] = alarm
+            self.alarms.replace_all(loaded)
+
+            # Chỉ lưu lại các báo thức có thay đổi alarm_time
+            for alarm_id in rolled_forward:
+                self.writer.mark_dirty(alarm_id)
+
+        except json.JSONDecodeError:
+            print(f"Lỗi: File {self.data_file} bị lỗi định dạng JSON")
+        except Exception as e:
+            print(f"Lỗi khi load dữ liệu: {e}")
+
+    def load_upcoming(self, count):
+        """Chỉ load các báo thức có thể nằm trong count lần kêu sắp tới
+
+        Dùng index của storage (SqliteAlarmStorage.next_due) nên không phải đọc
+        toàn bộ báo thức. Một báo thức không nằm trong count báo thức gần nhất
+        thì mọi lần lặp của nó cũng vậy; riêng báo thức đã quá hạn (sẽ được dời
+        tới) thì luôn được load. Không ghi lại gì. Trả về False nếu storage
+        không hỗ trợ, khi đó cần dùng load().
+        """
+        if not hasattr(self.storage, 'next_due'):
+            return False
+        now = datetime.now()
+        records = dict(self.storage.due_before(now))
+        records.update(self.storage.next_due(count, after=now))
+        loaded = {}
+        for alarm_id, record in records.items():
+            alarm = Alarm.from_json(record)
+            if alarm.is_due(now):
+                alarm = alarm.replace(alarm_time=alarm.next_fire(now))
+            loaded[alarm_id] = alarm
+        self.alarms.replace_all(loaded)
+        return True
+
+    def start(self):
+        """Lên lịch toàn bộ báo thức và bắt đầu thread kiểm tra"""
+        self.schedule_all()
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._check_alarms, daemon=True)
+            self._thread.start()
+
+    def schedule_all(self):
+        """Lên lịch lại toàn bộ báo thức đã load"""
+        # Chuỗi ISO được chuyển thẳng cho scheduler, chỉ parse khi gần đến lượt
+        self.scheduler.reset(
+            (alarm_id, alarm.raw_alarm_time)
+            for alarm_id, alarm in self.alarms.items()
+            if self.is_schedulable(alarm)
+        )
+
+    def close(self):
+        """Ghi nốt các thay đổi chưa lưu và đóng storage"""
+        if self._sound_thread is not None:
+            self._sound_jobs.put(None)
+            self._sound_thread.join(timeout=5)
+        if self._audio is not None:
+            self._audio.stop_all()
+        self.writer.close()
+        self.storage.close()
+
+    def add_alarm(self, alarm):
+        """Thêm báo thức mới, trả về alarm_id"""
+        alarm_id = str(uuid.uuid4())
+        self.alarms.put(alarm_id, alarm)
+        self._changed(alarm_id)
+        return alarm_id
+
+    def update_alarm(self, alarm_id, alarm):
+        """Thay báo thức bằng dữ liệu mới"""
+        if alarm_id in self.alarms:
+            self.alarms.put(alarm_id, alarm)
+            self._changed(alarm_id)
+
+    def delete_alarm(self, alarm_id):
+        """Xóa báo thức (dừng lại nếu đang kêu)"""
+        if alarm_id in self.alarms:
+            self.dismiss(alarm_id)
+            self.alarms.delete(alarm_id)
+            self._changed(alarm_id)
+
+    def toggle_enabled(self, alarm_id):
+        """Bật/tắt báo thức"""
+        if alarm_id in self.alarms:
+            self.alarms.update(alarm_id, enabled=not self.alarms[alarm_id].enabled)
+            self._changed(alarm_id)
+
+    def _changed(self, alarm_id):
+        # Đồng bộ lịch, lưu ở thread nền và báo cho client
+        self.sync_schedule(alarm_id)
+        self.writer.mark_dirty(alarm_id)
+        self._notify(self.on_change, alarm_id)
+
+    @staticmethod
+    def is_schedulable(alarm):
+        """Báo thức có cần được lên lịch không"""
+        return alarm.enabled and alarm.raw_alarm_time is not None
+
+    def sync_schedule(self, alarm_id):
+        """Đồng bộ lịch của một báo thức với dữ liệu hiện tại"""
+        alarm = self.alarms.get(alarm_id)
+        if alarm and self.is_schedulable(alarm):
+            self.scheduler.schedule(alarm_id, alarm.alarm_time)
+        else:
+            self.scheduler.cancel(alarm_id)
+
+    def upcoming(self, count):
+        """count lần kêu sắp tới của tất cả báo thức (kể cả lặp lại): [(datetime, alarm_id)]"""
+        def next_fn(alarm_id, when):
+            alarm = self.alarms.get(alarm_id)
+            if alarm is None:
+                return None
+            return alarm.recurrence.next_after(when, alarm.hour, alarm.minute, last=when)
+        return self.scheduler.upcoming(count, next_fn)
+
+    def _check_alarms(self):
+        """Chờ báo thức đến hạn tiếp theo và chuyển sang thread của client để kêu"""
+        while True:
+            kind, alarm_id = self.scheduler.wait_next()
+            if kind == AlarmScheduler.PREPARE:
+                # Giải mã trước nhạc chuông để phát ngay khi đến giờ
+                alarm = self.alarms.get(alarm_id)
+                if alarm and alarm.file:
+                    self.audio.preload(alarm.file)
+            elif kind == AlarmScheduler.WARMUP:
+                self.dispatch(self.warm_up, alarm_id)
+            else:
+                self.dispatch(self.fire, alarm_id)
+
+    def warm_up(self, alarm_id):
+        """Báo cho client chuẩn bị trước báo thức sắp kêu"""
+        alarm = self.alarms.get(alarm_id)
+        if alarm and alarm.enabled and alarm_id not in self.active_alarms:
+            self._notify(self.on_warmup, alarm_id, alarm)
+
+    def fire(self, alarm_id):
+        """Kêu báo thức đã đến hạn (nhiều báo thức có thể kêu cùng lúc)"""
+        alarm = self.alarms.get(alarm_id)
+        if not alarm or not alarm.enabled or alarm_id in self.active_alarms:
+            self._notify(self.on_change, alarm_id)
+            return
+
+        self.active_alarms[alarm_id] = alarm
+        self._submit_sound(self.play_sound, alarm_id, alarm.file)
+
+        self._notify(self.on_fire, alarm_id, alarm)
+        self._notify(self.on_change, alarm_id)
+
+    def _submit_sound(self, fn, *args):
+        """Giao việc cho thread phát nhạc (tạo thread ở lần đầu)"""
+        if self._sound_thread is None:
+            self._sound_thread = threading.Thread(target=self._sound_worker, daemon=True)
+            self._sound_thread.start()
+        self._sound_jobs.put((fn, args))
+
+    def _sound_worker(self):
+        # Các việc chạy lần lượt nên lệnh dừng không bao giờ chạy trước lệnh phát tương ứng
+        while True:
+            job = self._sound_jobs.get()
+            if job is None:
+                return
+            fn, args = job
+            fn(*args)
+
+    def play_sound(self, alarm_id, file_path):
+        """Phát nhạc báo thức trên một channel của pool (chạy trên thread phát nhạc)"""
+        try:
+            self.audio.play(alarm_id, file_path, loops=-1)  # -1 để loop vô hạn
+        except Exception as e:
+            self.report_error(f"Không thể phát nhạc: {e}")
+
+    def stop_sound(self, alarm_id):
+        """Dừng nhạc báo thức (chạy trên thread phát nhạc)"""
+        try:
+            self.audio.stop(alarm_id)
+        except Exception as e:
+            self.report_error(f"Không thể dừng nhạc: {e}")
+
+    def dismiss(self, alarm_id):
+        """Tắt báo thức đang kêu và lên lịch lần kêu tiếp theo
+
+        Trả về False nếu báo thức không đang kêu.
+        """
+        if self.active_alarms.pop(alarm_id, None) is None:
+            return False
+        self._submit_sound(self.stop_sound, alarm_id)
+
+        # Cập nhật lại thời gian báo thức cho lần sau
+        if alarm_id in self.alarms:
+            alarm_time = self.alarms[alarm_id].next_fire(datetime.now())
+            self.alarms.update(alarm_id, alarm_time=alarm_time)
+            self._changed(alarm_id)
+
+        self._notify(self.on_dismiss, alarm_id)
+        return True
+
+def main(argv=None):
+    """Chạy báo thức ở chế độ nền, không có giao diện"""
+    parser = argparse.ArgumentParser(description="Báo thức chạy nền (không giao diện)")
+    parser.add_argument('--data-file', default="alarms_data.json", help="File dữ liệu báo thức")
+    parser.add_argument('--storage', choices=sorted(ALARM_STORAGE_BACKENDS),
+                        help="Kiểu lưu trữ (mặc định: biến môi trường ALARM_STORAGE hoặc journal)")
+    parser.add_argument('--ring-seconds', type=float, default=60.0,
+                        help="Tự tắt báo thức sau bao nhiêu giây")
+    parser.add_argument('--upcoming', type=int, metavar='N',
+                        help="In N lần kêu sắp tới rồi thoát")
+    args = parser.parse_args(argv)
+    if args.upcoming is not None and args.upcoming < 0:
+        parser.error("--upcoming phải là số không âm")
+
+    # Mọi callback chạy trên thread chính, lần lượt theo hàng đợi
+    calls = queue.Queue()
+
+    def on_fire(alarm_id, alarm):
+        label = f" ({alarm.name})" if alarm.name else ""
+        print(f"⏰ {datetime.now():%H:%M:%S} Báo thức {alarm.hour:02d}:{alarm.minute:02d}{label}", flush=True)
+        timer = threading.Timer(args.ring_seconds, calls.put, args=((engine.dismiss, (alarm_id,)),))
+        timer.daemon = True
+        timer.start()
+
+    engine = AlarmEngine(
+        args.data_file,
+        backend=args.storage,
+        dispatch=lambda fn, *fn_args: calls.put((fn, fn_args)),
+        on_fire=on_fire,
+    )
+
+    if args.upcoming is not None:
+        # Với SQLite chỉ đọc những báo thức cần thiết qua index
+        if not engine.load_upcoming(args.upcoming):
+            engine.load()
+        engine.schedule_all()
+        for when, alarm_id in engine.upcoming(args.upcoming):
+            name = engine.alarms[alarm_id].name or alarm_id
+            print(f"{when:%H:%M - %d/%m/%Y}  {name}")
+        engine.close()
+        return
+
+    engine.load()
+    engine.start()
+    print(f"Đang chạy nền với {len(engine.alarms)} báo thức (Ctrl+C để thoát)", flush=True)
+    try:
+        while True:
+            try:
+                # Có timeout để Ctrl+C được xử lý trên mọi hệ điều hành
+                fn, fn_args = calls.get(timeout=1.0)
+            except queue.Empty:
+                continue
+            fn(*fn_args)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        engine.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,266 @@
+"""Đo thời gian khởi động (đến khung hình đầu tiên) của Báo Thức Python
+
+So sánh bản chạy từ source với các bản PyInstaller (one-file, one-file slim,
+one-dir). Mỗi lần chạy, ứng dụng được mở với ALARM_STARTUP_BENCH=1: nó in
+dòng "FIRST_FRAME" ngay khi cửa sổ hiện ra, in bảng thời gian từng giai đoạn
+rồi tự thoát. Thời gian được đo từ lúc tạo process nên bao gồm cả khởi động
+interpreter và giải nén của bootloader one-file.
+
+Kết quả được ghi thêm vào bench_results.jsonl để so sánh giữa các lần đo.
+
+Ví dụ:
+    python bench_startup.py
+    python bench_startup.py --importtime
+    python bench_startup.py --build --targets source onefile onefile-slim onedir
+
+Trên Linux không có màn hình (DISPLAY trống), Xvfb được tự động khởi chạy.
+"""
+import argparse
+import json
+import os
+import queue
+import re
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+EXE_SUFFIX = '.exe' if sys.platform == 'win32' else ''
+
+# Các bản cần đo: spec dùng để build và file chạy sau khi build
+TARGETS = {
+    'source': {'spec': None, 'exe': None},
+    'onefile': {'spec': 'alarm_clock.spec', 'exe': os.path.join('dist', 'alarm_clock')},
+    'onefile-slim': {'spec': 'alarm_clock_slim.spec', 'exe': os.path.join('dist', 'alarm_clock_slim')},
+    'onedir': {'spec': 'alarm_clock_onedir.spec',
+               'exe': os.path.join('dist', 'alarm_clock_onedir', 'alarm_clock_onedir')},
+}
+
+# Dòng trong bảng thời gian của StartupProfiler: "  tên   bắt đầu ms   thời lượng ms"
+PHASE_LINE = re.compile(r"^\s+(\S+)\s+([\d.]+)ms\s+([\d.]+)ms\s*$")
+# Dòng của -X importtime: "import time:   self [us] | cumulative | imported package"
+IMPORTTIME_LINE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)\s*$")
+
+
+def target_command(name, importtime=False):
+    """Lệnh chạy một bản, None nếu bản đó chưa được build"""
+    if name == 'source':
+        options = ['-X', 'importtime'] if importtime else []
+        return [sys.executable, *options, os.path.join(ROOT, 'alarm_clock.py')]
+    exe = os.path.join(ROOT, TARGETS[name]['exe'] + EXE_SUFFIX)
+    return [exe] if os.path.exists(exe) else None
+
+
+def build_target(name):
+    """Build một bản bằng PyInstaller theo spec tương ứng"""
+    spec = TARGETS[name]['spec']
+    if spec is None:
+        return
+    print(f"Đang build {name} ({spec})...")
+    subprocess.run([sys.executable, '-m', 'PyInstaller', '--noconfirm', spec],
+                   cwd=ROOT, check=True)
+
+
+def start_xvfb(display=':99', timeout=5.0):
+    """Chạy Xvfb cho môi trường không có màn hình, trả về process"""
+    xvfb = shutil.which('Xvfb')
+    if xvfb is None:
+        raise RuntimeError("Không có DISPLAY và không tìm thấy Xvfb (cài gói xvfb)")
+    process = subprocess.Popen([xvfb, display, '-screen', '0', '1024x768x24', '-nolisten', 'tcp'],
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    socket_path = f"/tmp/.X11-unix/X{display.lstrip(':')}"
+    deadline = time.monotonic() + timeout
+    while not os.path.exists(socket_path):
+        if process.poll() is not None or time.monotonic() > deadline:
+            process.kill()
+            raise RuntimeError(f"Không khởi động được Xvfb trên {display}")
+        time.sleep(0.05)
+    os.environ['DISPLAY'] = display
+    # Máy chạy headless thường không có thiết bị âm thanh
+    os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+    return process
+
+
+def read_lines(stream, lines):
+    # Đọc output ở thread riêng để có thể chờ với timeout
+    for line in stream:
+        lines.put(line)
+    lines.put(None)
+
+
+def measure_once(command, timeout):
+    """Chạy ứng dụng một lần, trả về thời gian đến khung hình đầu tiên và các giai đoạn"""
+    env = dict(os.environ, ALARM_STARTUP_BENCH='1')
+    # Thư mục tạm: không đụng đến alarms_data.json và cache của người dùng
+    with tempfile.TemporaryDirectory() as workdir:
+        started = time.perf_counter()
+        process = subprocess.Popen(command, cwd=workdir, env=env, text=True,
+                                   encoding='utf-8', errors='replace',
+                                   stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        lines = queue.Queue()
+        threading.Thread(target=read_lines, args=(process.stdout, lines), daemon=True).start()
+        stderr = []
+        stderr_thread = threading.Thread(target=lambda: stderr.extend(process.stderr), daemon=True)
+        stderr_thread.start()
+
+        first_frame = None
+        phases = {}
+        deadline = started + timeout
+        try:
+            while True:
+                line = lines.get(timeout=max(0.0, deadline - time.perf_counter()))
+                if line is None:
+                    break
+                if line.startswith('FIRST_FRAME') and first_frame is None:
+                    first_frame = (time.perf_counter() - started) * 1000
+                match = PHASE_LINE.match(line)
+                if match:
+                    phases[match.group(1)] = float(match.group(3))
+            process.wait(timeout=max(0.0, deadline - time.perf_counter()))
+        except (queue.Empty, subprocess.TimeoutExpired):
+            process.kill()
+            process.wait()
+            raise RuntimeError(f"Quá {timeout}s mà ứng dụng chưa thoát: {' '.join(command)}")
+        stderr_thread.join()
+
+    if first_frame is None:
+        raise RuntimeError(f"Ứng dụng không báo khung hình đầu tiên:\n{''.join(stderr[-20:])}")
+    return {'first_frame_ms': first_frame, 'phases': phases, 'stderr': ''.join(stderr)}
+
+
+def parse_importtime(text, top=15):
+    """Các module cấp cao nhất import lâu nhất: [(module, cumulative ms, self ms)]"""
+    modules = []
+    for line in text.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        # Module được import trực tiếp (không thụt lề) mới tính vào tổng
+        if match and len(match.group(3)) <= 1:
+            self_us, cumulative_us, _, module = match.groups()
+            modules.append((module, int(cumulative_us) / 1000, int(self_us) / 1000))
+    modules.sort(key=lambda module: module[1], reverse=True)
+    return modules[:top]
+
+
+def summarize(values):
+    return {
+        'min': round(min(values), 1),
+        'median': round(statistics.median(values), 1),
+        'max': round(max(values), 1),
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def load_previous(path):
+    """Kết quả gần nhất của mỗi bản trong file kết quả: {target: bản ghi}"""
+    previous = {}
+    if os.path.exists(path):
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                previous[record.get('target')] = record
+    return previous
+
+
+def bench_target(name, runs, timeout, importtime):
+    """Đo một bản runs lần, trả về bản ghi kết quả (None nếu chưa build)"""
+    command = target_command(name)
+    if command is None:
+        print(f"Bỏ qua {name}: chưa build (chạy với --build)")
+        return None
+
+    # Lần chạy đầu để làm nóng cache của hệ điều hành, không tính
+    measure_once(command, timeout)
+    samples = [measure_once(command, timeout) for _ in range(runs)]
+
+    phase_names = sorted({phase for sample in samples for phase in sample['phases']})
+    record = {
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'commit': git_commit(),
+        'platform': sys.platform,
+        'python': sys.version.split()[0],
+        'target': name,
+        'runs': runs,
+        'first_frame_ms': summarize([sample['first_frame_ms'] for sample in samples]),
+        'phases_ms': {
+            phase: round(statistics.median(sample['phases'][phase] for sample in samples
+                                           if phase in sample['phases']), 1)
+            for phase in phase_names
+        },
+    }
+
+    if importtime and name == 'source':
+        sample = measure_once(target_command(name, importtime=True), timeout)
+        record['importtime_ms'] = [
+            {'module': module, 'cumulative': round(cumulative, 1), 'self': round(self_ms, 1)}
+            for module, cumulative, self_ms in parse_importtime(sample['stderr'])
+        ]
+    return record
+
+
+def print_record(record, previous):
+    stats = record['first_frame_ms']
+    line = (f"{record['target']:<14} khung hình đầu tiên: median {stats['median']:8.1f}ms"
+            f"  (min {stats['min']:.1f}, max {stats['max']:.1f})")
+    if previous:
+        delta = stats['median'] - previous['first_frame_ms']['median']
+        line += f"  {delta:+.1f}ms so với {previous.get('commit') or previous['timestamp']}"
+    print(line)
+    for phase, duration in record['phases_ms'].items():
+        print(f"    {phase:<16} {duration:8.1f}ms")
+    for entry in record.get('importtime_ms', []):
+        print(f"    import {entry['module']:<24} {entry['cumulative']:8.1f}ms"
+              f" (self {entry['self']:.1f}ms)")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Đo thời gian khởi động của Báo Thức Python")
+    parser.add_argument('--targets', nargs='+', default=['source'], choices=sorted(TARGETS),
+                        help="Các bản cần đo (mặc định: source)")
+    parser.add_argument('--runs', type=int, default=5, help="Số lần đo mỗi bản")
+    parser.add_argument('--build', action='store_true', help="Build các bản PyInstaller trước khi đo")
+    parser.add_argument('--importtime', action='store_true',
+                        help="Phân tích -X importtime cho bản source")
+    parser.add_argument('--timeout', type=float, default=60.0, help="Thời gian tối đa mỗi lần chạy (giây)")
+    parser.add_argument('--output', default=os.path.join(ROOT, 'bench_results.jsonl'),
+                        help="File ghi thêm kết quả (JSON lines)")
+    args = parser.parse_args(argv)
+
+    xvfb = None
+    if sys.platform.startswith('linux') and not os.environ.get('DISPLAY'):
+        xvfb = start_xvfb()
+    try:
+        if args.build:
+            for name in args.targets:
+                build_target(name)
+
+        previous = load_previous(args.output)
+        for name in args.targets:
+            record = bench_target(name, args.runs, args.timeout, args.importtime)
+            if record is None:
+                continue
+            print_record(record, previous.get(name))
+            with open(args.output, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+    finally:
+        if xvfb is not None:
+            xvfb.terminate()
+            xvfb.wait()
+
+
+if __name__ == "__main__":
+    main()
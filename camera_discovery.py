@@ -0,0 +1,253 @@
+"""Tìm camera nhanh mà không phải thử mở lần lượt từng số camera
+
+Cách cũ mở cv2.VideoCapture(i) lần lượt cho i = 0..9 và đọc thử một frame;
+trên Linux mỗi số không có camera có thể mất vài giây, và việc dò dừng ở
+số đầu tiên bị thiếu. Ở đây:
+
+- Trên Linux, liệt kê /dev/video* và hỏi driver bằng VIDIOC_QUERYCAP (không
+  cần OpenCV, không bật camera) để bỏ qua các node không quay video được
+  (ví dụ node metadata của webcam UVC).
+- Các camera còn lại được thử mở song song, mỗi camera có timeout riêng nên
+  một camera bị treo không làm chậm cả lần dò.
+- Camera dùng được được cache theo danh tính thiết bị (driver, tên, bus) để
+  lần chạy sau không phải thử mở lại, kể cả khi số /dev/videoN thay đổi.
+
+Trên hệ điều hành khác, các số 0..max_index - 1 được thử song song.
+
+Thư mục /dev, /sys và hàm thử mở đều truyền vào được, nên có thể test với
+thư mục giả:
+
+    python camera_discovery.py
+    python camera_discovery.py --dev-dir /tmp/fake_dev --sysfs-dir /tmp/fake_sys --refresh
+"""
+import argparse
+import json
+import os
+import re
+import struct
+import sys
+import threading
+import time
+
+DEFAULT_DEV_DIR = '/dev'
+DEFAULT_SYSFS_DIR = '/sys/class/video4linux'
+DEFAULT_CACHE_PATH = 'camera_cache.json'
+
+# ioctl VIDIOC_QUERYCAP = _IOR('V', 0, struct v4l2_capability), struct dài 104 byte:
+# driver[16], card[32], bus_info[32], version, capabilities, device_caps, reserved[3]
+VIDIOC_QUERYCAP = 0x80685600
+V4L2_CAPABILITY = struct.Struct('<16s32s32sIII12x')
+V4L2_CAP_VIDEO_CAPTURE = 0x00000001
+V4L2_CAP_VIDEO_CAPTURE_MPLANE = 0x00001000
+V4L2_CAP_DEVICE_CAPS = 0x80000000
+
+VIDEO_NODE = re.compile(r'^video(\d+)$')
+
+class CameraInfo:
+    """Một camera (hoặc node video) tìm được"""
+    __slots__ = ('index', 'path', 'name', 'identity', 'capture', 'available', 'cached')
+
+    def __init__(self, index, path=None, name=None, identity=None, capture=None):
+        self.index = index  # Số dùng cho cv2.VideoCapture
+        self.path = path  # /dev/videoN (None nếu không dò qua /dev)
+        self.name = name
+        self.identity = identity  # Khóa cache, None nếu không xác định được
+        self.capture = capture  # Driver báo quay được video (None = không rõ)
+        self.available = False  # Mở và đọc được frame
+        self.cached = False  # available lấy từ cache, không thử mở
+
+    def __repr__(self):
+        return f"CameraInfo({self.index}, {self.name!r}, available={self.available})"
+
+def query_capability(path):
+    """Thông tin VIDIOC_QUERYCAP của node, None nếu không hỏi được (không phải thiết bị V4L2)"""
+    try:
+        import fcntl
+    except ImportError:
+        return None
+    try:
+        # O_NONBLOCK: chỉ hỏi thông tin, không chờ và không bật camera
+        fd = os.open(path, os.O_RDWR | os.O_NONBLOCK)
+    except OSError:
+        return None
+    try:
+        buffer = bytearray(V4L2_CAPABILITY.size)
+        fcntl.ioctl(fd, VIDIOC_QUERYCAP, buffer)
+    except OSError:
+        return None
+    finally:
+        os.close(fd)
+
+    driver, card, bus_info, version, capabilities, device_caps = V4L2_CAPABILITY.unpack(buffer)
+    # device_caps là khả năng của riêng node này (nếu driver có báo)
+    caps = device_caps if capabilities & V4L2_CAP_DEVICE_CAPS else capabilities
+    return {
+        'driver': driver.split(b'\0', 1)[0].decode('utf-8', 'replace'),
+        'card': card.split(b'\0', 1)[0].decode('utf-8', 'replace'),
+        'bus_info': bus_info.split(b'\0', 1)[0].decode('utf-8', 'replace'),
+        'capture': bool(caps & (V4L2_CAP_VIDEO_CAPTURE | V4L2_CAP_VIDEO_CAPTURE_MPLANE)),
+    }
+
+def read_sysfs(sysfs_dir, node, attribute):
+    """Đọc /sys/class/video4linux/<node>/<attribute>, None nếu không có"""
+    try:
+        with open(os.path.join(sysfs_dir, node, attribute), 'r', encoding='utf-8') as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+def list_video_nodes(dev_dir=DEFAULT_DEV_DIR, sysfs_dir=DEFAULT_SYSFS_DIR, query_caps=query_capability):
+    """Các node /dev/videoN kèm tên, danh tính và khả năng quay video (chưa thử mở)"""
+    try:
+        entries = os.listdir(dev_dir)
+    except OSError:
+        return []
+
+    cameras = []
+    for entry in entries:
+        match = VIDEO_NODE.match(entry)
+        if not match:
+            continue
+        path = os.path.join(dev_dir, entry)
+        # Số thứ tự của node trong thiết bị (0 là node chính, node metadata thường là 1)
+        node_index = read_sysfs(sysfs_dir, entry, 'index') or '0'
+        caps = query_caps(path)
+        if caps is not None:
+            name = caps['card']
+            identity = f"v4l2:{caps['driver']}:{caps['card']}:{caps['bus_info']}:{node_index}"
+            capture = caps['capture']
+        else:
+            # Không hỏi được driver: dựa vào sysfs
+            name = read_sysfs(sysfs_dir, entry, 'name')
+            identity = f"node:{entry}:{name}" if name else None
+            capture = False if node_index != '0' else None
+        cameras.append(CameraInfo(int(match.group(1)), path, name, identity, capture))
+    cameras.sort(key=lambda camera: camera.index)
+    return cameras
+
+def open_and_read(index):
+    """Mở camera bằng OpenCV và đọc thử một frame"""
+    import cv2
+    cap = cv2.VideoCapture(index)
+    try:
+        return cap.isOpened() and cap.read()[0]
+    finally:
+        cap.release()
+
+def probe_parallel(indices, probe=open_and_read, timeout=3.0):
+    """Thử mở các camera cùng lúc: {index: True/False}, camera quá timeout không có trong kết quả
+
+    Thread của camera bị treo là daemon và được để tự kết thúc, không chặn
+    việc thoát chương trình.
+    """
+    results = {}
+
+    def run(index):
+        try:
+            results[index] = bool(probe(index))
+        except Exception:
+            results[index] = False
+
+    threads = [threading.Thread(target=run, args=(index,), daemon=True) for index in indices]
+    for thread in threads:
+        thread.start()
+    deadline = time.monotonic() + timeout
+    for thread in threads:
+        thread.join(max(0.0, deadline - time.monotonic()))
+    return dict(results)
+
+def load_cache(path):
+    """{danh tính: thời điểm kiểm tra (epoch)} của các camera đã mở được"""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    return data if isinstance(data, dict) else {}
+
+def save_cache(path, cache):
+    # Ghi ra file tạm rồi đổi tên để không bao giờ để lại file ghi dở
+    temp_path = path + ".tmp"
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(cache, f, ensure_ascii=False, indent=2)
+    os.replace(temp_path, path)
+
+def discover_cameras(dev_dir=DEFAULT_DEV_DIR, sysfs_dir=DEFAULT_SYSFS_DIR, cache_path=DEFAULT_CACHE_PATH,
+                     probe=open_and_read, query_caps=query_capability, timeout=3.0,
+                     max_age=7 * 24 * 3600, refresh=False, max_index=10):
+    """Tìm camera: [CameraInfo] theo thứ tự số camera (cả những node không dùng được)
+
+    Args:
+        cache_path: File cache (None để không dùng cache)
+        probe: Hàm probe(index) -> bool thử mở camera
+        query_caps: Hàm query_caps(path) -> dict hoặc None hỏi khả năng của node
+        timeout: Thời gian tối đa thử mở mỗi camera (các camera được thử song song)
+        max_age: Tin kết quả trong cache trong bao nhiêu giây
+        refresh: Bỏ qua cache, thử mở lại mọi camera
+        max_index: Số camera thử khi không có /dev/video* (hệ điều hành khác Linux)
+    """
+    cameras = list_video_nodes(dev_dir, sysfs_dir, query_caps)
+    if not cameras:
+        if sys.platform.startswith('linux') and os.path.isdir(dev_dir):
+            return []  # Linux không có /dev/video* thì chắc chắn không có camera
+        cameras = [CameraInfo(index) for index in range(max_index)]
+
+    cache = load_cache(cache_path) if cache_path else {}
+    now = time.time()
+    to_probe = []
+    for camera in cameras:
+        if camera.capture is False:
+            continue  # Driver báo node này không quay video
+        checked = cache.get(camera.identity) if camera.identity else None
+        if not refresh and isinstance(checked, (int, float)) and now - checked < max_age:
+            camera.available = True
+            camera.cached = True
+        else:
+            to_probe.append(camera)
+
+    if to_probe:
+        results = probe_parallel([camera.index for camera in to_probe], probe, timeout)
+        changed = False
+        for camera in to_probe:
+            camera.available = results.get(camera.index, False)
+            if camera.identity is None:
+                continue
+            # Chỉ cache camera mở được: camera không mở được thường chỉ đang bận
+            if camera.available:
+                cache[camera.identity] = now
+                changed = True
+            elif camera.index in results and cache.pop(camera.identity, None) is not None:
+                changed = True
+        if changed and cache_path:
+            try:
+                save_cache(cache_path, cache)
+            except OSError as e:
+                print(f"Không thể lưu cache camera: {e}")
+    return cameras
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Tìm các camera có sẵn")
+    parser.add_argument('--dev-dir', default=DEFAULT_DEV_DIR, help="Thư mục chứa video* (mặc định: /dev)")
+    parser.add_argument('--sysfs-dir', default=DEFAULT_SYSFS_DIR, help="Thư mục video4linux trong sysfs")
+    parser.add_argument('--cache', default=DEFAULT_CACHE_PATH, help="File cache kết quả")
+    parser.add_argument('--refresh', action='store_true', help="Bỏ qua cache, thử mở lại mọi camera")
+    parser.add_argument('--timeout', type=float, default=3.0, help="Thời gian tối đa thử mở mỗi camera (giây)")
+    args = parser.parse_args(argv)
+
+    started = time.monotonic()
+    cameras = discover_cameras(args.dev_dir, args.sysfs_dir, args.cache,
+                               timeout=args.timeout, refresh=args.refresh)
+    for camera in cameras:
+        if camera.available:
+            status = "Có sẵn (cache)" if camera.cached else "Có sẵn"
+        elif camera.capture is False:
+            status = "Không quay video"
+        else:
+            status = "Không mở được"
+        name = f" ({camera.name})" if camera.name else ""
+        print(f"  Camera {camera.index}{name}: {status}")
+    print(f"Tìm thấy {sum(camera.available for camera in cameras)} camera "
+          f"trong {(time.monotonic() - started) * 1000:.0f}ms")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,628 @@
+"""Nhận diện tư thế ngồi thẳng trước camera bằng MediaPipe Pose
+
+Dùng cho chế độ tắt báo thức "ngồi thẳng N giây" (PoseHoldSession) và file
+test_pose_detection.py. opencv-python và mediapipe là dependency tùy chọn
+(requirements_test.txt) và import khá lâu nên chỉ được import khi tạo
+PoseDetector lần đầu (xem import_pose_modules).
+"""
+import importlib.util
+import threading
+import time
+
+POSE_AVAILABLE = (importlib.util.find_spec('cv2') is not None and
+                  importlib.util.find_spec('mediapipe') is not None)
+
+cv2 = None
+mp = None
+
+def import_pose_modules():
+    """Import cv2 và mediapipe ở lần dùng đầu tiên"""
+    global cv2, mp
+    if mp is None:
+        import cv2 as cv2_module
+        import mediapipe as mp_module
+        cv2 = cv2_module
+        mp = mp_module
+    return cv2, mp
+
+class PoseDetector:
+    def __init__(self):
+        import_pose_modules()
+        self.mp_pose = mp.solutions.pose
+        self.pose = self.mp_pose.Pose(
+            min_detection_confidence=0.5,
+            min_tracking_confidence=0.5
+        )
+        self.mp_drawing = mp.solutions.drawing_utils
+    
+    def close(self):
+        """Giải phóng graph MediaPipe"""
+        self.pose.close()
+        
+    def detect_sitting_straight(self, landmarks):
+        """
+        Kiểm tra xem người có đang ngồi thẳng không
+        Dựa vào góc giữa các điểm: vai, khuỷu tay, cổ tay
+        """
+        if not landmarks:
+            return False
+        
+        try:
+            # Lấy các điểm quan trọng
+            left_shoulder = landmarks.landmark[self.mp_pose.PoseLandmark.LEFT_SHOULDER]
+            right_shoulder = landmarks.landmark[self.mp_pose.PoseLandmark.RIGHT_SHOULDER]
+            left_elbow = landmarks.landmark[self.mp_pose.PoseLandmark.LEFT_ELBOW]
+            right_elbow = landmarks.landmark[self.mp_pose.PoseLandmark.RIGHT_ELBOW]
+            left_wrist = landmarks.landmark[self.mp_pose.PoseLandmark.LEFT_WRIST]
+            right_wrist = landmarks.landmark[self.mp_pose.PoseLandmark.RIGHT_WRIST]
+            nose = landmarks.landmark[self.mp_pose.PoseLandmark.NOSE]
+            
+            # Kiểm tra visibility (độ tin cậy)
+            if (left_shoulder.visibility < 0.5 or right_shoulder.visibility < 0.5 or
+                nose.visibility < 0.5):
+                return False
+            
+            # Tính toán góc giữa vai và mũi (để kiểm tra ngồi thẳng)
+            # Nếu mũi ở giữa hai vai và không quá thấp/quá cao -> ngồi thẳng
+            shoulder_mid_y = (left_shoulder.y + right_shoulder.y) / 2
+            shoulder_mid_x = (left_shoulder.x + right_shoulder.x) / 2
+            
+            # Kiểm tra mũi có ở giữa hai vai không (theo chiều ngang)
+            nose_x_diff = abs(nose.x - shoulder_mid_x)
+            
+            # Kiểm tra mũi có ở vị trí hợp lý so với vai (không quá thấp, không quá cao)
+            nose_y_diff = nose.y - shoulder_mid_y
+            
+            # Điều kiện ngồi thẳng:
+            # 1. Mũi ở giữa hai vai (sai lệch ngang < 0.15)
+            # 2. Mũi ở trên vai một khoảng hợp lý (0.05 < diff < 0.25)
+            # 3. Hai vai gần như ngang nhau (chênh lệch < 0.1)
+            shoulder_level_diff = abs(left_shoulder.y - right_shoulder.y)
+            
+            is_straight = (
+                nose_x_diff < 0.15 and  # Mũi ở giữa vai
+                0.05 < nose_y_diff < 0.25 and  # Mũi ở vị trí hợp lý so với vai
+                shoulder_level_diff < 0.1  # Hai vai ngang nhau
+            )
+            
+            return is_straight
+            
+        except Exception as e:
+            print(f"Lỗi khi kiểm tra tư thế: {e}")
+            return False
+
+class AdaptivePoseTracker:
+    """Giảm số lần chạy model khi tư thế ổn định
+
+    detect_sitting_straight chỉ cần mũi và hai vai, nên:
+    - Khi kết quả ổn định (cùng trạng thái, các điểm gần như không di chuyển)
+      qua stable_frames lần nhận diện, chỉ chạy model mỗi max_skip + 1 frame
+      và dùng lại kết quả trước cho các frame ở giữa (không quá
+      max_skip_interval giây).
+    - Giữa các lần nhận diện toàn frame (mỗi full_every lần), model chỉ chạy
+      trên vùng thân trên quanh mũi và vai của lần trước. Landmark được đổi về
+      tọa độ toàn frame nên detect_sitting_straight và việc vẽ không đổi.
+    - process(force=True) luôn chạy model, dùng để xác nhận trước khi báo
+      giữ tư thế đủ thời gian.
+
+    Vùng cắt dùng một PoseDetector riêng (roi_detector, hoặc tự tạo khi cần)
+    vì Pose tự theo dõi vị trí người giữa các frame liên tiếp, trộn frame đầy
+    đủ và frame cắt vào cùng một Pose sẽ làm nó mất dấu.
+    """
+    KEY_POINTS = ('NOSE', 'LEFT_SHOULDER', 'RIGHT_SHOULDER')
+    
+    def __init__(self, detector, max_skip=3, max_skip_interval=0.25, full_every=15,
+                 stable_frames=3, motion_threshold=0.02, max_roi_fraction=0.6,
+                 roi_detector=None):
+        self.detector = detector
+        self.max_skip = max_skip
+        self.max_skip_interval = max_skip_interval
+        self.full_every = full_every
+        self.stable_frames = stable_frames
+        self.motion_threshold = motion_threshold  # Theo tọa độ chuẩn hóa (0-1)
+        self.max_roi_fraction = max_roi_fraction  # Vùng cắt lớn hơn thì chạy toàn frame
+        self._key_indices = [detector.mp_pose.PoseLandmark[name] for name in self.KEY_POINTS]
+        self._roi_detector = roi_detector
+        self._owns_roi_detector = roi_detector is None  # Tự tạo thì tự đóng
+        self.reset()
+        # Thống kê
+        self.full_runs = 0
+        self.roi_runs = 0
+        self.skipped = 0
+    
+    def reset(self):
+        """Quên kết quả trước (ví dụ khi đổi camera)"""
+        self._landmarks = None
+        self._is_straight = False
+        self._key_points = None
+        self._roi = None
+        self._stable_count = 0
+        self._skipped_in_row = 0
+        self._last_run_time = None
+        self._runs_since_full = 0
+    
+    def close(self):
+        if self._owns_roi_detector and self._roi_detector is not None:
+            self._roi_detector.close()
+            self._roi_detector = None
+    
+    def process(self, frame, timestamp=None, force=False):
+        """Nhận diện tư thế trên frame BGR
+
+        Returns:
+            (landmarks, is_straight, fresh) với fresh=False nếu dùng lại kết quả trước
+        """
+        if timestamp is None:
+            timestamp = time.monotonic()
+        
+        if not force and self._should_skip(timestamp):
+            self._skipped_in_row += 1
+            self.skipped += 1
+            return self._landmarks, self._is_straight, False
+        
+        landmarks = None
+        if self._roi is not None and self._runs_since_full < self.full_every:
+            landmarks = self._run_roi(frame)
+        if landmarks is None:
+            landmarks = self._run_full(frame)
+        is_straight = self.detector.detect_sitting_straight(landmarks)
+        
+        self._update(landmarks, is_straight, frame.shape)
+        self._skipped_in_row = 0
+        self._last_run_time = timestamp
+        return landmarks, is_straight, True
+    
+    def near_deadline(self, elapsed, required_time):
+        """Frame có thể là frame hoàn thành việc giữ tư thế (cần chạy model để xác nhận)"""
+        return abs(elapsed - required_time) < self.max_skip_interval
+    
+    def _should_skip(self, timestamp):
+        return (self._last_run_time is not None and
+                self._stable_count >= self.stable_frames and
+                self._skipped_in_row < self.max_skip and
+                timestamp - self._last_run_time < self.max_skip_interval)
+    
+    def _run_full(self, frame):
+        rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+        self.full_runs += 1
+        self._runs_since_full = 0
+        return self.detector.pose.process(rgb_frame).pose_landmarks
+    
+    def _run_roi(self, frame):
+        """Chạy model trên vùng thân trên, None nếu không thấy người"""
+        x0, y0, x1, y1 = self._roi
+        if self._roi_detector is None:
+            self._roi_detector = PoseDetector()
+        rgb_crop = cv2.cvtColor(frame[y0:y1, x0:x1], cv2.COLOR_BGR2RGB)
+        landmarks = self._roi_detector.pose.process(rgb_crop).pose_landmarks
+        self.roi_runs += 1
+        self._runs_since_full += 1
+        # Người đã ra khỏi vùng cắt: để process() chạy lại trên toàn frame
+        if landmarks is None or any(landmarks.landmark[i].visibility < 0.5 for i in self._key_indices):
+            return None
+        
+        # Đổi tọa độ chuẩn hóa theo vùng cắt về theo toàn frame
+        height, width = frame.shape[:2]
+        crop_width, crop_height = x1 - x0, y1 - y0
+        for landmark in landmarks.landmark:
+            landmark.x = (x0 + landmark.x * crop_width) / width
+            landmark.y = (y0 + landmark.y * crop_height) / height
+            landmark.z = landmark.z * crop_width / width
+        return landmarks
+    
+    def _update(self, landmarks, is_straight, shape):
+        key_points = None
+        if landmarks is not None:
+            key_points = [(landmarks.landmark[i].x, landmarks.landmark[i].y) for i in self._key_indices]
+        
+        # Ổn định: cùng trạng thái và các điểm chính gần như không di chuyển
+        # (không thấy người liên tục cũng tính là ổn định)
+        if is_straight != self._is_straight or (key_points is None) != (self._key_points is None):
+            stable = False
+        elif key_points is None:
+            stable = True
+        else:
+            stable = all(abs(x - old_x) < self.motion_threshold and abs(y - old_y) < self.motion_threshold
+                         for (x, y), (old_x, old_y) in zip(key_points, self._key_points))
+        self._stable_count = self._stable_count + 1 if stable else 0
+        
+        self._landmarks = landmarks
+        self._is_straight = is_straight
+        self._key_points = key_points
+        self._roi = self._upper_body_roi(key_points, shape) if key_points else None
+    
+    def _upper_body_roi(self, key_points, shape):
+        """Vùng thân trên (x0, y0, x1, y1) theo pixel, None nếu gần bằng cả frame"""
+        height, width = shape[:2]
+        xs = [x * width for x, _ in key_points]
+        ys = [y * height for _, y in key_points]
+        # Chiều rộng vai làm thước đo: chừa chỗ cho đầu phía trên, ngực phía dưới
+        # và đủ rộng hai bên để người có thể nghiêng hoặc dịch chuyển
+        span = max(max(xs) - min(xs), max(ys) - min(ys), 0.1 * width)
+        x0 = max(0, int(min(xs) - span))
+        x1 = min(width, int(max(xs) + span))
+        y0 = max(0, int(min(ys) - span))
+        y1 = min(height, int(max(ys) + 1.5 * span))
+        if (x1 - x0) * (y1 - y0) > self.max_roi_fraction * width * height:
+            return None
+        return x0, y0, x1, y1
+
+class PoseResourcePool:
+    """Giữ sẵn Pose graph đã khởi tạo và camera đã mở để dùng lại
+
+    Tạo Pose (khởi tạo graph MediaPipe) và mở camera đều mất cỡ giây. Những
+    thứ được trả lại bằng release_detector()/release_camera() được giữ thêm
+    idle_timeout giây để lần dùng sau lấy ra ngay, sau đó mới bị đóng để giải
+    phóng bộ nhớ và camera (idle_timeout=0: đóng ngay khi trả lại).
+    prewarm() tạo sẵn ở thread nền trước khi cần.
+
+    Mỗi camera chỉ được một nơi dùng tại một thời điểm.
+    """
+    def __init__(self, idle_timeout=60.0, width=640, height=480):
+        self.idle_timeout = idle_timeout
+        self.width = width
+        self.height = height
+        self._cond = threading.Condition()
+        self._idle_detectors = []  # [(PoseDetector, hết hạn lúc)]
+        self._pending_detectors = 0  # Số detector prewarm() đang tạo
+        self._idle_cameras = {}  # {camera_id: (VideoCapture, hết hạn lúc)}
+        self._leased_cameras = set()  # camera_id đang được dùng
+        self._reaper = None
+        self._closed = False
+    
+    def acquire_detector(self):
+        """PoseDetector đã khởi tạo graph (lấy từ pool hoặc tạo mới)"""
+        with self._cond:
+            # prewarm() đang tạo thì chờ nó xong thay vì tạo thêm một cái nữa
+            self._cond.wait_for(lambda: self._idle_detectors or not self._pending_detectors)
+            if self._idle_detectors:
+                return self._idle_detectors.pop()[0]
+        return self._create_detector()
+    
+    def release_detector(self, detector):
+        """Trả PoseDetector về pool"""
+        self._keep(lambda expires: self._idle_detectors.append((detector, expires)), detector.close)
+    
+    def acquire_camera(self, camera_id):
+        """VideoCapture đã mở và đặt độ phân giải, None nếu không mở được hoặc đang được dùng"""
+        with self._cond:
+            if camera_id in self._leased_cameras:
+                return None
+            self._leased_cameras.add(camera_id)
+            idle = self._idle_cameras.pop(camera_id, None)
+        if idle is not None:
+            cap = idle[0]
+            # Bỏ frame cũ còn trong buffer; camera bị ngắt thì mở lại
+            if cap.isOpened() and cap.grab():
+                return cap
+            cap.release()
+        cap = self._open_camera(camera_id)
+        if cap is None:
+            with self._cond:
+                self._leased_cameras.discard(camera_id)
+        return cap
+    
+    def release_camera(self, camera_id, cap, keep=True):
+        """Trả camera về pool (camera vẫn mở thêm idle_timeout giây, keep=False: đóng ngay)"""
+        with self._cond:
+            self._leased_cameras.discard(camera_id)
+            duplicate = camera_id in self._idle_cameras  # Đã có một VideoCapture khác của camera này
+        if duplicate or not keep:
+            cap.release()
+            return
+        self._keep(lambda expires: self._idle_cameras.update({camera_id: (cap, expires)}), cap.release)
+    
+    def prewarm(self, camera_ids=(), detectors=1):
+        """Tạo sẵn detectors PoseDetector và mở sẵn các camera ở thread nền"""
+        with self._cond:
+            missing = max(0, detectors - len(self._idle_detectors))
+            self._pending_detectors += missing
+        
+        def run():
+            nonlocal missing
+            try:
+                while missing:
+                    detector = self._create_detector()
+                    self.release_detector(detector)
+                    with self._cond:
+                        missing -= 1
+                        self._pending_detectors -= 1
+                        self._cond.notify_all()
+                for camera_id in camera_ids:
+                    cap = self.acquire_camera(camera_id)
+                    if cap is not None:
+                        self.release_camera(camera_id, cap)
+            except Exception as e:
+                print(f"Lỗi khi chuẩn bị trước camera/model: {e}")
+            finally:
+                with self._cond:
+                    self._pending_detectors -= missing
+                    self._cond.notify_all()
+        thread = threading.Thread(target=run, daemon=True)
+        thread.start()
+        return thread
+    
+    def close(self):
+        """Đóng mọi thứ đang rảnh; những thứ trả lại sau đó bị đóng ngay"""
+        with self._cond:
+            self._closed = True
+            idle = ([detector.close for detector, _ in self._idle_detectors] +
+                    [cap.release for cap, _ in self._idle_cameras.values()])
+            self._idle_detectors = []
+            self._idle_cameras = {}
+            self._cond.notify_all()
+        for close in idle:
+            close()
+    
+    def _create_detector(self):
+        import numpy
+        detector = PoseDetector()
+        # Lần process đầu tiên khởi tạo graph nên chậm hơn hẳn: chạy trước trên ảnh đen
+        detector.pose.process(numpy.zeros((self.height, self.width, 3), dtype=numpy.uint8))
+        return detector
+    
+    def _open_camera(self, camera_id):
+        import_pose_modules()
+        cap = cv2.VideoCapture(camera_id)
+        if not cap.isOpened():
+            cap.release()
+            return None
+        # Thiết lập độ phân giải
+        cap.set(cv2.CAP_PROP_FRAME_WIDTH, self.width)
+        cap.set(cv2.CAP_PROP_FRAME_HEIGHT, self.height)
+        # Driver chỉ giữ frame mới nhất (nếu backend hỗ trợ) để không đọc phải frame cũ
+        cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+        return cap
+    
+    def _keep(self, store, close):
+        """Giữ lại một thứ vừa được trả (store(hết hạn lúc)) hoặc đóng ngay (close())"""
+        with self._cond:
+            if not self._closed and self.idle_timeout > 0:
+                store(time.monotonic() + self.idle_timeout)
+                if self._reaper is None:
+                    self._reaper = threading.Thread(target=self._reap, daemon=True)
+                    self._reaper.start()
+                self._cond.notify_all()
+                return
+        close()
+    
+    def _reap(self):
+        """Đóng những thứ rảnh quá idle_timeout (chạy ở thread riêng khi pool còn giữ gì đó)"""
+        while True:
+            with self._cond:
+                if self._closed:
+                    self._reaper = None
+                    return
+                now = time.monotonic()
+                expired = [detector.close for detector, expires in self._idle_detectors if expires <= now]
+                expired += [cap.release for cap, expires in self._idle_cameras.values() if expires <= now]
+                self._idle_detectors = [item for item in self._idle_detectors if item[1] > now]
+                self._idle_cameras = {camera_id: item for camera_id, item in self._idle_cameras.items()
+                                      if item[1] > now}
+                if not expired:
+                    deadlines = ([expires for _, expires in self._idle_detectors] +
+                                 [expires for _, expires in self._idle_cameras.values()])
+                    if not deadlines:
+                        self._reaper = None
+                        return
+                    self._cond.wait(min(deadlines) - now)
+                    continue
+            for close in expired:
+                close()
+
+class PoseHoldState:
+    """Trạng thái của PoseHoldSession gửi cho giao diện"""
+    WARMING = 'warming'  # Đang mở camera và tải model
+    READY = 'ready'  # Camera và model đã sẵn sàng, chưa đếm
+    TRACKING = 'tracking'  # Đang đếm thời gian giữ tư thế
+    DONE = 'done'  # Đã giữ đủ thời gian
+    ERROR = 'error'  # Không dùng được camera/model (message là lý do)
+    __slots__ = ('status', 'is_straight', 'elapsed', 'required', 'message')
+    
+    def __init__(self, status, is_straight=False, elapsed=0.0, required=0.0, message=None):
+        self.status = status
+        self.is_straight = is_straight
+        self.elapsed = elapsed
+        self.required = required
+        self.message = message
+
+class PoseHoldSession:
+    """Kiểm tra "ngồi thẳng N giây" trên thread riêng
+
+    Camera và model được mở ở warm_up() (trước giờ kêu) và giữ sẵn: thread
+    tiếp tục đọc frame ở tốc độ thấp để camera không bị đóng và tự chỉnh
+    sáng xong từ trước. start() chỉ bật việc đếm nên phản hồi ngay khi báo
+    thức kêu. Nếu không được start() trong idle_timeout giây (ví dụ báo thức
+    bị tắt), camera và model được giải phóng; stop() đóng camera ngay.
+
+    on_progress(PoseHoldState) được gọi từ thread của session (tối đa
+    PROGRESS_INTERVAL giây một lần, hoặc khi trạng thái thay đổi); giao diện
+    tự chuyển sang thread của nó (root.after). Sau DONE session quay lại chờ
+    nên có thể dùng tiếp cho báo thức khác.
+
+    Camera và PoseDetector được lấy từ pool và trả lại khi session dừng,
+    nên session sau dùng lại được ngay trong idle_timeout của pool. Không
+    truyền pool thì session dùng pool riêng, đóng mọi thứ ngay khi dừng.
+    """
+    PROGRESS_INTERVAL = 0.1  # Giây giữa hai lần báo tiến độ
+    IDLE_READ_INTERVAL = 0.2  # Giây giữa hai lần đọc frame khi chờ
+    MAX_FRAME_ERRORS = 10  # Số lần đọc lỗi liên tiếp trước khi báo lỗi
+    
+    def __init__(self, camera_id=0, on_progress=None, idle_timeout=120.0, pool=None):
+        self.camera_id = camera_id
+        self.on_progress = on_progress
+        self.idle_timeout = idle_timeout
+        self.pool = pool or PoseResourcePool(idle_timeout=0)
+        self._cond = threading.Condition()
+        self._thread = None
+        self._ready = threading.Event()
+        self._closed = False
+        self._stopping = False  # stop() được gọi: thread dừng và đóng camera ngay
+        self._hold_seconds = None  # None = chưa đếm
+        self._generation = 0  # Tăng mỗi lần start()/cancel() để bắt đầu đếm lại từ đầu
+        self._idle_deadline = 0.0
+    
+    @property
+    def alive(self):
+        """Thread còn chạy (camera đang mở hoặc đang mở)"""
+        return self._thread is not None and self._thread.is_alive()
+    
+    @property
+    def ready(self):
+        """Camera và model đã sẵn sàng (start() sẽ bắt đầu đếm ngay)"""
+        return self._ready.is_set()
+    
+    def warm_up(self):
+        """Mở camera và model ở nền (nếu chưa mở), gia hạn thời gian chờ"""
+        with self._cond:
+            self._idle_deadline = time.monotonic() + self.idle_timeout
+            self._stopping = False
+            if self._closed or self.alive:
+                return
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+    
+    def start(self, hold_seconds):
+        """Bắt đầu đếm: cần ngồi thẳng liên tục hold_seconds giây"""
+        self.warm_up()
+        with self._cond:
+            self._hold_seconds = hold_seconds
+            self._generation += 1
+            self._cond.notify_all()
+    
+    def cancel(self):
+        """Dừng đếm nhưng vẫn giữ camera và model"""
+        with self._cond:
+            self._hold_seconds = None
+            self._generation += 1
+            self._idle_deadline = time.monotonic() + self.idle_timeout
+    
+    def stop(self):
+        """Dừng đếm và thread, đóng camera ngay thay vì giữ trong pool (model vẫn được giữ)
+
+        Dùng khi báo thức đã tắt: camera không mở lâu hơn cần thiết. warm_up()
+        hoặc start() sau đó mở lại như bình thường.
+        """
+        with self._cond:
+            self._hold_seconds = None
+            self._generation += 1
+            self._idle_deadline = 0.0
+            self._stopping = True
+            self._cond.notify_all()
+    
+    def close(self):
+        """Dừng thread và giải phóng camera (không chờ thread kết thúc)"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+    
+    def _post(self, state):
+        if self.on_progress:
+            self.on_progress(state)
+    
+    def _run(self):
+        self._post(PoseHoldState(PoseHoldState.WARMING))
+        cap = None
+        detectors = []
+        failed = False
+        try:
+            # Một detector cho toàn frame, một cho vùng thân trên (xem AdaptivePoseTracker)
+            for _ in range(2):
+                detectors.append(self.pool.acquire_detector())
+            tracker = AdaptivePoseTracker(detectors[0], roi_detector=detectors[1])
+            cap = self.pool.acquire_camera(self.camera_id)
+            if cap is None:
+                raise RuntimeError(f"Không thể mở Camera {self.camera_id}")
+            ret, _ = cap.read()
+            if not ret:
+                raise RuntimeError(f"Không thể đọc frame từ Camera {self.camera_id}")
+            self._ready.set()
+            self._post(PoseHoldState(PoseHoldState.READY))
+            self._loop(cap, tracker)
+        except Exception as e:
+            failed = True
+            self._post(PoseHoldState(PoseHoldState.ERROR, message=str(e)))
+        finally:
+            self._ready.clear()
+            if cap is not None:
+                with self._cond:
+                    keep = not (self._stopping or self._closed)
+                self.pool.release_camera(self.camera_id, cap, keep=keep)
+            for detector in detectors:
+                self.pool.release_detector(detector)
+            # Chỉ coi thread là đã dừng sau khi camera được trả lại, để thread mới
+            # (warm_up()/start() gọi trong lúc này) lấy được camera
+            with self._cond:
+                self._thread = None
+                self._stopping = False
+                # warm_up()/start() được gọi trong lúc đang dừng: chạy lại
+                restart = not (failed or self._closed) and (
+                    self._hold_seconds is not None or time.monotonic() < self._idle_deadline)
+                if restart:
+                    self._thread = threading.Thread(target=self._run, daemon=True)
+                    self._thread.start()
+    
+    def _loop(self, cap, tracker):
+        hold_start = None
+        last_post = 0.0
+        last_straight = None
+        frame_error_count = 0
+        generation = None
+        
+        while True:
+            with self._cond:
+                if self._closed or self._stopping:
+                    return
+                if generation != self._generation:
+                    generation = self._generation
+                    hold_start = last_straight = None
+                required = self._hold_seconds
+                if required is None:
+                    if time.monotonic() > self._idle_deadline:
+                        # Không ai dùng: giải phóng camera và model
+                        return
+                    # Chờ start(), vẫn đọc frame để camera không bị đóng
+                    self._cond.wait(self.IDLE_READ_INTERVAL)
+                    required = self._hold_seconds
+            
+            ret, frame = cap.read()
+            if not ret:
+                frame_error_count += 1
+                if frame_error_count >= self.MAX_FRAME_ERRORS:
+                    raise RuntimeError(f"Không thể đọc frame từ Camera {self.camera_id} "
+                                       f"sau {self.MAX_FRAME_ERRORS} lần thử")
+                time.sleep(0.1)
+                continue
+            frame_error_count = 0
+            
+            if required is None:
+                continue
+            
+            now = time.monotonic()
+            force = hold_start is not None and tracker.near_deadline(now - hold_start, required)
+            _, is_straight, _ = tracker.process(frame, now, force=force)
+            if is_straight:
+                if hold_start is None:
+                    hold_start = now
+                elapsed = now - hold_start
+            else:
+                # Không ngồi thẳng, reset đếm
+                hold_start = None
+                elapsed = 0.0
+            
+            if elapsed >= required:
+                # Bỏ qua nếu start()/cancel() vừa được gọi lại trong lúc xử lý frame
+                with self._cond:
+                    finished = generation == self._generation
+                    if finished:
+                        self._hold_seconds = None
+                        self._generation += 1
+                        self._idle_deadline = time.monotonic() + self.idle_timeout
+                if finished:
+                    self._post(PoseHoldState(PoseHoldState.DONE, True, elapsed, required))
+                continue
+            
+            if is_straight != last_straight or now - last_post >= self.PROGRESS_INTERVAL:
+                last_straight = is_straight
+                last_post = now
+                self._post(PoseHoldState(PoseHoldState.TRACKING, is_straight, elapsed, required))
@@ -4,86 +4,22 @@ Sử dụng MediaPipe Pose để nhận diện tư thế
 """
 
 import cv2
-import mediapipe as mp
 import time
+import threading
+import argparse
 
-class PoseDetector:
-    def __init__(self):
-        self.mp_pose = mp.solutions.pose
-        self.pose = self.mp_pose.Pose(
-            min_detection_confidence=0.5,
-            min_tracking_confidence=0.5
-        )
-        self.mp_drawing = mp.solutions.drawing_utils
-        
-    def detect_sitting_straight(self, landmarks):
-        """
-        Kiểm tra xem người có đang ngồi thẳng không
-        Dựa vào góc giữa các điểm: vai, khuỷu tay, cổ tay
-        """
-        if not landmarks:
-            return False
-        
-        try:
-            # Lấy các điểm quan trọng
-            left_shoulder = landmarks.landmark[self.mp_pose.PoseLandmark.LEFT_SHOULDER]
-            right_shoulder = landmarks.landmark[self.mp_pose.PoseLandmark.RIGHT_SHOULDER]
-            left_elbow = landmarks.landmark[self.mp_pose.PoseLandmark.LEFT_ELBOW]
-            right_elbow = landmarks.landmark[self.mp_pose.PoseLandmark.RIGHT_ELBOW]
-            left_wrist = landmarks.landmark[self.mp_pose.PoseLandmark.LEFT_WRIST]
-            right_wrist = landmarks.landmark[self.mp_pose.PoseLandmark.RIGHT_WRIST]
-            nose = landmarks.landmark[self.mp_pose.PoseLandmark.NOSE]
-            
-            # Kiểm tra visibility (độ tin cậy)
-            if (left_shoulder.visibility < 0.5 or right_shoulder.visibility < 0.5 or
-                nose.visibility < 0.5):
-                return False
-            
-            # Tính toán góc giữa vai và mũi (để kiểm tra ngồi thẳng)
-            # Nếu mũi ở giữa hai vai và không quá thấp/quá cao -> ngồi thẳng
-            shoulder_mid_y = (left_shoulder.y + right_shoulder.y) / 2
-            shoulder_mid_x = (left_shoulder.x + right_shoulder.x) / 2
-            
-            # Kiểm tra mũi có ở giữa hai vai không (theo chiều ngang)
-            nose_x_diff = abs(nose.x - shoulder_mid_x)
-            
-            # Kiểm tra mũi có ở vị trí hợp lý so với vai (không quá thấp, không quá cao)
-            nose_y_diff = nose.y - shoulder_mid_y
-            
-            # Điều kiện ngồi thẳng:
-            # 1. Mũi ở giữa hai vai (sai lệch ngang < 0.15)
-            # 2. Mũi ở trên vai một khoảng hợp lý (0.05 < diff < 0.25)
-            # 3. Hai vai gần như ngang nhau (chênh lệch < 0.1)
-            shoulder_level_diff = abs(left_shoulder.y - right_shoulder.y)
-            
-            is_straight = (
-                nose_x_diff < 0.15 and  # Mũi ở giữa vai
-                0.05 < nose_y_diff < 0.25 and  # Mũi ở vị trí hợp lý so với vai
-                shoulder_level_diff < 0.1  # Hai vai ngang nhau
-            )
-            
-            return is_straight
-            
-        except Exception as e:
-            print(f"Lỗi khi kiểm tra tư thế: {e}")
-            return False
+from camera_discovery import discover_cameras
+from pose_detector import AdaptivePoseTracker, PoseResourcePool
 
 def list_available_cameras():
-    """Liệt kê các camera có sẵn"""
-    available_cameras = []
+    """Liệt kê các camera có sẵn (dò song song, có cache - xem camera_discovery.py)"""
     print("Đang kiểm tra các camera có sẵn...")
-    
-    # Thử mở các camera từ 0 đến 9
-    for i in range(10):
-        cap = cv2.VideoCapture(i)
-        if cap.isOpened():
-            ret, _ = cap.read()
-            if ret:
-                available_cameras.append(i)
-                print(f"  ✓ Camera {i}: Có sẵn")
-            cap.release()
-        else:
-            break
+    available_cameras = []
+    for camera in discover_cameras():
+        if camera.available:
+            available_cameras.append(camera.index)
+            name = f" ({camera.name})" if camera.name else ""
+            print(f"  ✓ Camera {camera.index}{name}: Có sẵn")
     
     return available_cameras
 
@@ -119,16 +55,387 @@ def select_camera():
         except KeyboardInterrupt:
             return None
 
-def test_pose_detection():
-    """Test chức năng nhận diện tư thế"""
+class LatestFrameSlot:
+    """Ô chứa đúng một phần tử mới nhất giữa hai thread
+
+    put() ghi đè phần tử cũ chưa được lấy (bỏ frame cũ) nên thread chậm hơn
+    luôn nhận được dữ liệu mới nhất và độ trễ không tăng dần.
+    """
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._item = None
+        self._closed = False
+        self.dropped = 0  # Số phần tử bị ghi đè trước khi được lấy
+    
+    def put(self, item, block=False):
+        """Đặt phần tử mới; block=True chờ phần tử cũ được lấy thay vì ghi đè"""
+        with self._cond:
+            if block:
+                self._cond.wait_for(lambda: self._item is None or self._closed)
+            if self._item is not None:
+                self.dropped += 1
+            self._item = item
+            self._cond.notify_all()
+    
+    def get(self, timeout=None):
+        """Lấy phần tử mới nhất, None nếu hết thời gian chờ hoặc đã đóng"""
+        with self._cond:
+            self._cond.wait_for(lambda: self._item is not None or self._closed, timeout)
+            item, self._item = self._item, None
+            self._cond.notify_all()
+            return item
+    
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+    
+    @property
+    def closed(self):
+        return self._closed
+
+class PoseResult:
+    """Kết quả nhận diện của một frame"""
+    __slots__ = ('frame', 'landmarks', 'is_straight', 'timestamp', 'captured_at', 'processed_at')
+    
+    def __init__(self, frame, landmarks, is_straight, timestamp, captured_at, processed_at):
+        self.frame = frame  # Frame BGR đã flip
+        self.landmarks = landmarks
+        self.is_straight = is_straight
+        self.timestamp = timestamp  # Thời điểm của frame (giây), dùng để đếm thời gian giữ tư thế
+        self.captured_at = captured_at  # time.monotonic() lúc đọc frame
+        self.processed_at = processed_at  # time.monotonic() lúc nhận diện xong
+
+class PosePipeline:
+    """Đọc camera/video, nhận diện và hiển thị song song
+
+    Thread đọc frame -> ô frame mới nhất -> thread nhận diện -> ô kết quả mới
+    nhất -> bước hiển thị (thread chính, vì cv2.imshow phải chạy ở đó). Mỗi
+    bước chỉ lấy dữ liệu mới nhất của bước trước nên FPS bằng bước chậm nhất
+    thay vì tổng các bước, và độ trễ luôn bị chặn.
+
+    source là số camera hoặc đường dẫn file video (để test không cần camera).
+    Camera và PoseDetector được lấy từ pool khi start() và trả lại khi stop().
+    Video được phát theo FPS gốc nếu realtime=True (bỏ frame như camera thật),
+    hoặc nhanh nhất có thể mà không bỏ frame nào. Với video, thời điểm của
+    frame lấy theo vị trí trong video nên kết quả không phụ thuộc tốc độ máy.
+    """
+    MAX_FRAME_ERRORS = 10  # Số lần đọc lỗi liên tiếp trước khi dừng
+    
+    def __init__(self, source, pool, realtime=True, adaptive=True, required_time=3.0):
+        self.source = source
+        self.pool = pool
+        self.adaptive = adaptive
+        self.detector = None
+        # Giảm số lần chạy model khi tư thế ổn định (None = chạy mọi frame)
+        self.tracker = None
+        self.required_time = required_time
+        self.hold_start = None  # Thời điểm bắt đầu ngồi thẳng, để biết khi nào cần xác nhận
+        self.is_video = isinstance(source, str)
+        self.realtime = realtime
+        self.frames = LatestFrameSlot()  # (frame, timestamp, captured_at)
+        self.results = LatestFrameSlot()  # PoseResult
+        self.error = None  # Lý do dừng (nếu không phải do người dùng)
+        self.captured = 0
+        self.processed = 0
+        self._cap = None
+        self._detectors = []
+        self._running = False
+        self._threads = []
+    
+    def start(self):
+        """Mở camera/video và chạy các thread; False nếu không mở được"""
+        if self.is_video:
+            self._cap = cv2.VideoCapture(self.source)
+            if not self._cap.isOpened():
+                self._cap.release()
+                self._cap = None
+                return False
+        else:
+            self._cap = self.pool.acquire_camera(self.source)
+            if self._cap is None:
+                return False
+        
+        self._detectors = [self.pool.acquire_detector()]
+        if self.adaptive:
+            # Detector thứ hai cho vùng thân trên
+            self._detectors.append(self.pool.acquire_detector())
+            self.tracker = AdaptivePoseTracker(self._detectors[0], roi_detector=self._detectors[1])
+        self.detector = self._detectors[0]
+        
+        self._running = True
+        self._threads = [
+            threading.Thread(target=self._capture_loop, daemon=True),
+            threading.Thread(target=self._inference_loop, daemon=True),
+        ]
+        for thread in self._threads:
+            thread.start()
+        return True
+    
+    def stop(self):
+        self._running = False
+        self.frames.close()
+        self.results.close()
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+        if self._cap is not None:
+            if self.is_video:
+                self._cap.release()
+            else:
+                self.pool.release_camera(self.source, self._cap)
+            self._cap = None
+        if self.tracker is not None:
+            self.tracker.close()
+        for detector in self._detectors:
+            self.pool.release_detector(detector)
+        self._detectors = []
+    
+    @property
+    def finished(self):
+        """Đã hết video hoặc camera lỗi và không còn kết quả nào"""
+        return self.results.closed
+    
+    def _capture_loop(self):
+        frame_interval = 0.0
+        if self.is_video and self.realtime:
+            fps = self._cap.get(cv2.CAP_PROP_FPS)
+            frame_interval = 1.0 / fps if fps and fps > 0 else 0.0
+        next_frame_time = time.monotonic()
+        frame_error_count = 0
+        
+        while self._running:
+            ret, frame = self._cap.read()
+            if not ret:
+                if self.is_video:
+                    break  # Hết video
+                frame_error_count += 1
+                if frame_error_count >= self.MAX_FRAME_ERRORS:
+                    self.error = (f"Không thể đọc frame từ Camera {self.source} "
+                                  f"sau {self.MAX_FRAME_ERRORS} lần thử!")
+                    break
+                time.sleep(0.1)
+                continue
+            frame_error_count = 0
+            
+            captured_at = time.monotonic()
+            timestamp = self._cap.get(cv2.CAP_PROP_POS_MSEC) / 1000.0 if self.is_video else captured_at
+            # Flip frame để mirror
+            self.frames.put((cv2.flip(frame, 1), timestamp, captured_at),
+                            block=self.is_video and not self.realtime)
+            self.captured += 1
+            
+            if frame_interval:
+                # Giữ tốc độ phát của video như camera thật
+                next_frame_time += frame_interval
+                delay = next_frame_time - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+                else:
+                    next_frame_time = time.monotonic()
+        self.frames.close()
+    
+    def _inference_loop(self):
+        while True:
+            item = self.frames.get()
+            if item is None:
+                break  # Thread đọc frame đã dừng
+            frame, timestamp, captured_at = item
+            try:
+                if self.tracker is not None:
+                    # Luôn chạy model ở frame có thể hoàn thành việc giữ tư thế
+                    hold_start = self.hold_start
+                    force = (hold_start is not None and
+                             self.tracker.near_deadline(timestamp - hold_start, self.required_time))
+                    landmarks, is_straight, _ = self.tracker.process(frame, timestamp, force=force)
+                else:
+                    rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+                    results = self.detector.pose.process(rgb_frame)
+                    landmarks = results.pose_landmarks
+                    is_straight = self.detector.detect_sitting_straight(landmarks)
+            except Exception as e:
+                print(f"Lỗi xử lý frame: {e}")
+                continue
+            # Tự theo dõi thời điểm bắt đầu ngồi thẳng vì ô kết quả có thể bỏ bớt kết quả
+            if is_straight:
+                if self.hold_start is None:
+                    self.hold_start = timestamp
+            else:
+                self.hold_start = None
+            self.processed += 1
+            self.results.put(PoseResult(frame, landmarks, is_straight, timestamp,
+                                        captured_at, time.monotonic()))
+        self.results.close()
+
+def draw_pose(detector, frame, landmarks):
+    """Vẽ skeleton lên frame"""
+    try:
+        detector.mp_drawing.draw_landmarks(
+            frame,
+            landmarks,
+            detector.mp_pose.POSE_CONNECTIONS,
+            detector.mp_drawing.DrawingSpec(color=(0, 255, 0), thickness=2, circle_radius=2),
+            detector.mp_drawing.DrawingSpec(color=(0, 0, 255), thickness=2)
+        )
+    except Exception as e:
+        print(f"Lỗi khi vẽ skeleton: {e}")
+
+def draw_hold_status(frame, is_straight, elapsed, required_time, source_text):
+    """Vẽ trạng thái giữ tư thế lên frame (elapsed = None nếu chưa ngồi thẳng)"""
+    if is_straight:
+        if elapsed >= required_time:
+            # Đã giữ đủ thời gian
+            cv2.putText(frame, "THANH CONG! Da tat bao thuc!", 
+                       (50, 50), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 0), 3)
+            cv2.putText(frame, f"Da giu tu the: {elapsed:.1f}s", 
+                       (50, 100), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 0), 2)
+        else:
+            # Đang đếm
+            remaining = required_time - elapsed
+            cv2.putText(frame, f"Dang giu tu the: {elapsed:.1f}s / {required_time:.1f}s", 
+                       (50, 50), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 255, 255), 2)
+            cv2.putText(frame, f"Con lai: {remaining:.1f}s", 
+                       (50, 100), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 255), 2)
+    else:
+        cv2.putText(frame, "Hay ngoi thang truoc camera!", 
+                   (50, 50), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 0, 255), 2)
+    
+    # Hiển thị trạng thái
+    status_color = (0, 255, 0) if is_straight else (0, 0, 255)
+    status_text = "NGOI THANG" if is_straight else "CHUA THANG"
+    cv2.putText(frame, f"Trang thai: {status_text}", 
+               (50, frame.shape[0] - 50), cv2.FONT_HERSHEY_SIMPLEX, 0.7, status_color, 2)
+    
+    # Hiển thị thông tin nguồn video
+    cv2.putText(frame, source_text, 
+               (50, frame.shape[0] - 20), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 1)
+
+def test_pose_detection_pipelined(source, show=True, realtime=True, required_time=3.0, adaptive=True,
+                                  pool=None):
+    """Test nhận diện tư thế ở chế độ pipeline (đọc / nhận diện / hiển thị song song)
+
+    Args:
+        source: Số camera hoặc đường dẫn file video
+        show: False để chạy không có cửa sổ (chỉ in thống kê, dùng để test)
+        realtime: Phát video theo FPS gốc thay vì nhanh nhất có thể
+        required_time: Số giây cần giữ tư thế
+        adaptive: Bỏ bớt lần chạy model và chỉ nhận diện vùng thân trên khi tư thế ổn định
+        pool: PoseResourcePool dùng chung (mặc định: tạo mới, đóng khi kết thúc)
+
+    Returns:
+        True nếu đã giữ tư thế đủ required_time giây
+    """
+    own_pool = pool is None
+    if own_pool:
+        pool = PoseResourcePool()
+    pipeline = PosePipeline(source, pool, realtime=realtime,
+                            adaptive=adaptive, required_time=required_time)
+    if not pipeline.start():
+        print(f"Lỗi: Không thể mở {source}!")
+        if own_pool:
+            pool.close()
+        return False
+    detector = pipeline.detector
+    
+    source_text = f"Video: {source}" if pipeline.is_video else f"Camera: {source}"
+    print(f"Đang chạy pipeline với {source_text}...")
+    
+    # Thời gian giữ tư thế tính theo thời điểm của frame, không phụ thuộc độ trễ xử lý
+    start_time = None
+    succeeded = False
+    latencies = []
+    started = time.monotonic()
+    
+    try:
+        while not pipeline.finished:
+            result = pipeline.results.get(timeout=0.1)
+            if result is None:
+                if show and cv2.waitKey(1) & 0xFF == ord('q'):
+                    break
+                continue
+            latencies.append(time.monotonic() - result.captured_at)
+            
+            elapsed = None
+            if result.is_straight:
+                if start_time is None:
+                    start_time = result.timestamp
+                elapsed = result.timestamp - start_time
+                if elapsed >= required_time:
+                    succeeded = True
+            else:
+                # Không ngồi thẳng, reset đếm
+                start_time = None
+            
+            if not show:
+                continue
+            frame = result.frame
+            if result.landmarks:
+                draw_pose(detector, frame, result.landmarks)
+            draw_hold_status(frame, result.is_straight, elapsed, required_time, source_text)
+            try:
+                cv2.imshow('Nhan dien tu the - Pipeline', frame)
+            except Exception as e:
+                print(f"Lỗi hiển thị frame: {e}")
+                break
+            
+            # Xử lý phím
+            key = cv2.waitKey(1) & 0xFF
+            if key == ord('q'):
+                print("\nĐang thoát...")
+                break
+            elif key == ord('r'):
+                start_time = None
+                print("Đã reset đếm")
+    except KeyboardInterrupt:
+        print("\n\nĐã dừng bởi người dùng (Ctrl+C)")
+    finally:
+        pipeline.stop()
+        if own_pool:
+            pool.close()
+        if show:
+            cv2.destroyAllWindows()
+    
+    if pipeline.error:
+        print(f"\nLỗi: {pipeline.error}")
+    duration = time.monotonic() - started
+    print(f"\nĐã đọc {pipeline.captured} frame, nhận diện {pipeline.processed} frame "
+          f"({pipeline.processed / duration:.1f} FPS), bỏ qua {pipeline.frames.dropped} frame")
+    if pipeline.tracker is not None:
+        print_tracker_stats(pipeline.tracker)
+    if latencies:
+        latencies.sort()
+        print(f"Độ trễ từ lúc đọc đến lúc hiển thị: trung vị {latencies[len(latencies) // 2] * 1000:.0f}ms, "
+              f"lớn nhất {latencies[-1] * 1000:.0f}ms")
+    print("Kết quả: " + ("ĐÃ GIỮ TƯ THẾ ĐỦ THỜI GIAN" if succeeded else "chưa giữ đủ thời gian"))
+    return succeeded
+
+def print_tracker_stats(tracker):
+    runs = tracker.full_runs + tracker.roi_runs
+    total = runs + tracker.skipped
+    if total:
+        print(f"Model chạy {runs}/{total} frame ({runs / total:.0%}): "
+              f"{tracker.full_runs} toàn frame, {tracker.roi_runs} vùng thân trên, "
+              f"dùng lại kết quả {tracker.skipped} frame")
+
+def test_pose_detection(adaptive=True, pool=None, camera_id=None):
+    """Test chức năng nhận diện tư thế (camera_id = None: hỏi người dùng)"""
     print("=" * 50)
     print("TEST NHẬN DIỆN TƯ THẾ NGỒI THẲNG")
     print("=" * 50)
     
+    # Model được tải ở nền trong lúc chọn camera
+    own_pool = pool is None
+    if own_pool:
+        pool = PoseResourcePool()
+        pool.prewarm(detectors=2 if adaptive else 1)
+    
     # Chọn camera
-    camera_id = select_camera()
+    if camera_id is None:
+        camera_id = select_camera()
     if camera_id is None:
         print("Đã hủy.")
+        if own_pool:
+            pool.close()
         return
     
     print(f"\nĐang khởi động Camera {camera_id}...")
@@ -141,16 +448,17 @@ def test_pose_detection():
     print("- Nhấn phím số (0-9) để chuyển sang camera tương ứng")
     print()
     
-    detector = PoseDetector()
-    cap = cv2.VideoCapture(camera_id)
-    
-    if not cap.isOpened():
+    # Camera được mở sẵn ở độ phân giải 640x480
+    cap = pool.acquire_camera(camera_id)
+    if cap is None:
         print(f"Lỗi: Không thể mở Camera {camera_id}!")
+        if own_pool:
+            pool.close()
         return
     
-    # Thiết lập độ phân giải
-    cap.set(cv2.CAP_PROP_FRAME_WIDTH, 640)
-    cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 480)
+    detectors = [pool.acquire_detector() for _ in range(2 if adaptive else 1)]
+    detector = detectors[0]
+    tracker = AdaptivePoseTracker(detector, roi_detector=detectors[1]) if adaptive else None
     
     # Biến đếm
     straight_count = 0
@@ -182,72 +490,42 @@ def test_pose_detection():
             # Flip frame để mirror
             frame = cv2.flip(frame, 1)
             
+            # Xử lý đếm thời gian
+            current_time = time.time()
+            
             try:
-                # Chuyển đổi BGR sang RGB
-                rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-                
-                # Nhận diện tư thế
-                results = detector.pose.process(rgb_frame)
+                if tracker is not None:
+                    # Luôn chạy model ở frame có thể hoàn thành việc giữ tư thế
+                    force = (start_time is not None and
+                             tracker.near_deadline(current_time - start_time, required_time))
+                    landmarks, is_straight, _ = tracker.process(frame, current_time, force=force)
+                else:
+                    # Chuyển đổi BGR sang RGB
+                    rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+                    
+                    # Nhận diện tư thế
+                    landmarks = detector.pose.process(rgb_frame).pose_landmarks
+                    # Kiểm tra tư thế ngồi thẳng
+                    is_straight = detector.detect_sitting_straight(landmarks)
             except Exception as e:
                 print(f"Lỗi xử lý frame: {e}")
                 continue
-        
-            is_straight = False
-            if results.pose_landmarks:
-                try:
-                    # Vẽ skeleton
-                    detector.mp_drawing.draw_landmarks(
-                        frame,
-                        results.pose_landmarks,
-                        detector.mp_pose.POSE_CONNECTIONS,
-                        detector.mp_drawing.DrawingSpec(color=(0, 255, 0), thickness=2, circle_radius=2),
-                        detector.mp_drawing.DrawingSpec(color=(0, 0, 255), thickness=2)
-                    )
-                    
-                    # Kiểm tra tư thế ngồi thẳng
-                    is_straight = detector.detect_sitting_straight(results.pose_landmarks)
-                except Exception as e:
-                    print(f"Lỗi khi vẽ skeleton: {e}")
             
-            # Xử lý đếm thời gian
-            current_time = time.time()
+            if landmarks:
+                # Vẽ skeleton
+                draw_pose(detector, frame, landmarks)
             
+            elapsed = None
             if is_straight:
                 if start_time is None:
                     start_time = current_time
-                
                 elapsed = current_time - start_time
-                
-                # Hiển thị thời gian đã giữ
-                if elapsed >= required_time:
-                    # Đã giữ đủ thời gian
-                    cv2.putText(frame, "THANH CONG! Da tat bao thuc!", 
-                               (50, 50), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 0), 3)
-                    cv2.putText(frame, f"Da giu tu the: {elapsed:.1f}s", 
-                               (50, 100), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 0), 2)
-                else:
-                    # Đang đếm
-                    remaining = required_time - elapsed
-                    cv2.putText(frame, f"Dang giu tu the: {elapsed:.1f}s / {required_time:.1f}s", 
-                               (50, 50), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 255, 255), 2)
-                    cv2.putText(frame, f"Con lai: {remaining:.1f}s", 
-                               (50, 100), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 255), 2)
             else:
                 # Không ngồi thẳng, reset đếm
-                if start_time is not None:
-                    start_time = None
-                cv2.putText(frame, "Hay ngoi thang truoc camera!", 
-                           (50, 50), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 0, 255), 2)
-            
-            # Hiển thị trạng thái
-            status_color = (0, 255, 0) if is_straight else (0, 0, 255)
-            status_text = "NGOI THANG" if is_straight else "CHUA THANG"
-            cv2.putText(frame, f"Trang thai: {status_text}", 
-                       (50, frame.shape[0] - 50), cv2.FONT_HERSHEY_SIMPLEX, 0.7, status_color, 2)
+                start_time = None
             
-            # Hiển thị thông tin camera
-            cv2.putText(frame, f"Camera: {camera_id} | Nhan 'c' de chuyen doi", 
-                       (50, frame.shape[0] - 20), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 1)
+            draw_hold_status(frame, is_straight, elapsed, required_time,
+                             f"Camera: {camera_id} | Nhan 'c' de chuyen doi")
             
             # Hiển thị frame
             try:
@@ -265,53 +543,47 @@ def test_pose_detection():
                 start_time = None
                 print("Đã reset đếm")
             elif key == ord('c'):
-                # Chuyển đổi camera
-                cap.release()
-                cameras = list_available_cameras()
-                if not cameras:
+                # Chuyển đổi camera; camera cũ được trả về pool và vẫn mở
+                # nên chuyển lại sẽ không phải chờ. Camera đang dùng có thể
+                # không mở được khi dò nên luôn được tính vào danh sách
+                cameras = sorted(set(list_available_cameras()) | {camera_id})
+                if len(cameras) < 2:
                     print("Không có camera nào khác!")
-                    break
+                    continue
                 
                 # Tìm camera tiếp theo
-                try:
-                    current_idx = cameras.index(camera_id)
-                    next_idx = (current_idx + 1) % len(cameras)
-                    camera_id = cameras[next_idx]
-                except ValueError:
-                    camera_id = cameras[0]
-                
-                print(f"Chuyển sang Camera {camera_id}...")
-                cap = cv2.VideoCapture(camera_id)
-                if not cap.isOpened():
+                next_camera_id = cameras[(cameras.index(camera_id) + 1) % len(cameras)]
+                print(f"Chuyển sang Camera {next_camera_id}...")
+                pool.release_camera(camera_id, cap)
+                camera_id = next_camera_id
+                cap = pool.acquire_camera(camera_id)
+                if cap is None:
                     print(f"Không thể mở Camera {camera_id}!")
                     break
-                cap.set(cv2.CAP_PROP_FRAME_WIDTH, 640)
-                cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 480)
                 start_time = None
                 frame_error_count = 0
+                if tracker is not None:
+                    tracker.reset()
             elif ord('0') <= key <= ord('9'):
                 # Chuyển sang camera theo số
                 new_camera_id = key - ord('0')
                 if new_camera_id != camera_id:
-                    cap.release()
                     print(f"Đang chuyển sang Camera {new_camera_id}...")
-                    cap = cv2.VideoCapture(new_camera_id)
-                    if cap.isOpened():
-                        ret, _ = cap.read()
-                        if ret:
-                            camera_id = new_camera_id
-                            cap.set(cv2.CAP_PROP_FRAME_WIDTH, 640)
-                            cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 480)
-                            start_time = None
-                            frame_error_count = 0
-                            print(f"Đã chuyển sang Camera {camera_id}")
-                        else:
-                            cap.release()
-                            cap = cv2.VideoCapture(camera_id)
-                            print(f"Camera {new_camera_id} không hoạt động, giữ nguyên Camera {camera_id}")
-                    else:
-                        cap = cv2.VideoCapture(camera_id)
+                    # Camera hiện tại vẫn giữ nguyên cho đến khi camera mới đọc được frame
+                    new_cap = pool.acquire_camera(new_camera_id)
+                    if new_cap is None:
                         print(f"Không thể mở Camera {new_camera_id}, giữ nguyên Camera {camera_id}")
+                    elif not new_cap.read()[0]:
+                        pool.release_camera(new_camera_id, new_cap)
+                        print(f"Camera {new_camera_id} không hoạt động, giữ nguyên Camera {camera_id}")
+                    else:
+                        pool.release_camera(camera_id, cap)
+                        camera_id, cap = new_camera_id, new_cap
+                        start_time = None
+                        frame_error_count = 0
+                        if tracker is not None:
+                            tracker.reset()
+                        print(f"Đã chuyển sang Camera {camera_id}")
     
     except KeyboardInterrupt:
         print("\n\nĐã dừng bởi người dùng (Ctrl+C)")
@@ -320,14 +592,45 @@ def test_pose_detection():
         import traceback
         traceback.print_exc()
     finally:
-        if cap.isOpened():
-            cap.release()
+        if cap is not None:
+            pool.release_camera(camera_id, cap)
         cv2.destroyAllWindows()
+        if tracker is not None:
+            tracker.close()
+            print_tracker_stats(tracker)
+        for detector in detectors:
+            pool.release_detector(detector)
+        if own_pool:
+            pool.close()
         print("Đã đóng camera và dọn dẹp tài nguyên")
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Test nhận diện tư thế ngồi thẳng")
+    parser.add_argument('--pipeline', action='store_true',
+                        help="Đọc camera, nhận diện và hiển thị ở các thread riêng")
+    parser.add_argument('--camera', type=int, help="Số camera (mặc định: hỏi người dùng)")
+    parser.add_argument('--video', help="Dùng file video thay cho camera (chạy ở chế độ pipeline)")
+    parser.add_argument('--fast', action='store_true',
+                        help="Xử lý video nhanh nhất có thể thay vì theo FPS gốc")
+    parser.add_argument('--no-display', action='store_true',
+                        help="Không mở cửa sổ, chỉ in thống kê (chế độ pipeline)")
+    parser.add_argument('--every-frame', action='store_true',
+                        help="Chạy model trên mọi frame đầy đủ (tắt bỏ frame và cắt vùng thân trên)")
+    args = parser.parse_args()
     try:
-        test_pose_detection()
+        if args.video or args.pipeline:
+            # Model được tải ở nền trong lúc chọn camera
+            pool = PoseResourcePool()
+            pool.prewarm(detectors=1 if args.every_frame else 2)
+            source = args.video if args.video else args.camera
+            if source is None:
+                source = select_camera()
+            if source is not None:
+                test_pose_detection_pipelined(source, show=not args.no_display, realtime=not args.fast,
+                                              adaptive=not args.every_frame, pool=pool)
+            pool.close()
+        else:
+            test_pose_detection(adaptive=not args.every_frame, camera_id=args.camera)
     except ImportError:
         print("Lỗi: Cần cài đặt các thư viện sau:")
         print("  pip install opencv-python mediapipe")
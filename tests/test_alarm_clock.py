@@ -0,0 +1,81 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+tk = pytest.importorskip('tkinter')
+
+import alarm_clock
+from alarm_clock import AlarmClock
+from alarm_engine import Alarm, AlarmEngine
+
+
+class FakeRoot:
+    """Cửa sổ giả: đủ cho AlarmClock.__init__ khi setup_ui được thay thế"""
+
+    def __init__(self):
+        self.jobs = []
+
+    def title(self, text):
+        pass
+
+    def geometry(self, size):
+        pass
+
+    def minsize(self, width, height):
+        pass
+
+    def resizable(self, width, height):
+        pass
+
+    def bind(self, sequence, callback, add=None):
+        pass
+
+    def protocol(self, name, callback):
+        pass
+
+    def state(self):
+        return 'withdrawn'
+
+    def after(self, delay, fn, *args):
+        self.jobs.append((fn, args))
+        return len(self.jobs)
+
+    def after_cancel(self, job):
+        pass
+
+    def destroy(self):
+        pass
+
+
+class FakeLabel:
+    def __init__(self):
+        self.text = None
+
+    def config(self, text):
+        self.text = text
+
+
+def test_first_next_alarm_label_shows_earliest_enabled_alarm(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.delenv('ALARM_STORAGE', raising=False)
+    now = datetime.now().replace(second=0, microsecond=0)
+    earliest = now + timedelta(hours=2)
+    engine = AlarmEngine("alarms_data.json")
+    engine.load()
+    engine.add_alarm(Alarm(earliest.hour, earliest.minute, name="Sớm nhất", alarm_time=earliest))
+    later = now + timedelta(hours=5)
+    engine.add_alarm(Alarm(later.hour, later.minute, name="Muộn", alarm_time=later))
+    disabled = now + timedelta(hours=1)
+    engine.add_alarm(Alarm(disabled.hour, disabled.minute, name="Tắt", alarm_time=disabled, enabled=False))
+    engine.close()
+
+    def setup_ui(self):
+        self.next_alarm_label = FakeLabel()
+
+    monkeypatch.setattr(AlarmClock, 'setup_ui', setup_ui)
+    app = AlarmClock(FakeRoot(), alarm_clock.StartupProfiler())
+    try:
+        assert app.next_alarm_label.text == (
+            f"Báo thức tiếp theo: {earliest.strftime('%H:%M - %d/%m/%Y')} (Sớm nhất)")
+    finally:
+        app.on_closing()
@@ -0,0 +1,115 @@
+import json
+import threading
+from datetime import datetime, timedelta
+
+import pytest
+
+from alarm_engine import Alarm, AlarmEngine, main
+
+
+class FakeAudio:
+    def __init__(self):
+        self.calls = []
+        self.threads = set()
+
+    def play(self, key, path, loops=-1):
+        self.threads.add(threading.current_thread())
+        self.calls.append(('play', key))
+
+    def stop(self, key):
+        self.calls.append(('stop', key))
+
+    def stop_all(self):
+        pass
+
+
+def make_engine(tmp_path, **callbacks):
+    engine = AlarmEngine(str(tmp_path / "alarms_data.json"), backend='json', **callbacks)
+    engine._audio = FakeAudio()
+    return engine
+
+
+def test_fire_and_dismiss_use_one_ordered_sound_thread(tmp_path):
+    engine = make_engine(tmp_path)
+    try:
+        ids = [engine.add_alarm(Alarm(7, 0, file="a.wav", alarm_time=datetime.now()))
+               for _ in range(50)]
+        before = threading.active_count()
+        for alarm_id in ids:
+            engine.fire(alarm_id)
+        for alarm_id in ids:
+            assert engine.dismiss(alarm_id)
+        assert threading.active_count() <= before + 1
+    finally:
+        engine.close()
+
+    audio = engine._audio
+    assert len(audio.threads) == 1
+    assert audio.calls == [('play', alarm_id) for alarm_id in ids] + [('stop', alarm_id) for alarm_id in ids]
+
+
+def test_dismiss_schedules_next_occurrence(tmp_path):
+    dismissed = []
+    engine = make_engine(tmp_path, on_dismiss=dismissed.append)
+    try:
+        now = datetime.now()
+        alarm_id = engine.add_alarm(Alarm(now.hour, now.minute, alarm_time=now - timedelta(seconds=1)))
+        engine.fire(alarm_id)
+        assert alarm_id in engine.active_alarms
+        assert engine.dismiss(alarm_id)
+        assert not engine.dismiss(alarm_id)
+        assert dismissed == [alarm_id]
+        assert engine.alarms[alarm_id].alarm_time > now
+    finally:
+        engine.close()
+
+
+def test_play_errors_are_reported(tmp_path):
+    errors = []
+    engine = make_engine(tmp_path, on_error=errors.append)
+
+    def fail(key, path, loops=-1):
+        raise OSError("no such file")
+
+    engine._audio.play = fail
+    try:
+        engine.fire(engine.add_alarm(Alarm(7, 0, alarm_time=datetime.now())))
+    finally:
+        engine.close()
+    assert errors == ["Không thể phát nhạc: no such file"]
+
+
+def test_load_and_start_keep_alarm_times_unparsed(tmp_path):
+    base = datetime.now().replace(microsecond=0) + timedelta(days=1)
+    data = {f'a{i}': Alarm(7, 0, alarm_time=(base + timedelta(minutes=i)).isoformat()).to_json()
+            for i in range(200)}
+    (tmp_path / "alarms_data.json").write_text(json.dumps(data), encoding='utf-8')
+
+    engine = make_engine(tmp_path)
+    try:
+        engine.load()
+        engine.start()
+        assert engine.upcoming(2) == [(base, 'a0'), (base + timedelta(minutes=1), 'a1')]
+        assert all(isinstance(alarm.raw_alarm_time, str) for alarm in engine.alarms.values())
+    finally:
+        engine.close()
+
+
+def test_main_upcoming_prints_requested_count_and_exits(tmp_path, capsys):
+    data_file = str(tmp_path / "alarms_data.json")
+    engine = AlarmEngine(data_file, backend='json')
+    engine.load()
+    now = datetime.now().replace(second=0, microsecond=0)
+    for hours in (1, 2):
+        when = now + timedelta(hours=hours)
+        engine.add_alarm(Alarm(when.hour, when.minute, name=f"A{hours}", alarm_time=when))
+    engine.close()
+
+    main(['--data-file', data_file, '--storage', 'json', '--upcoming', '0'])
+    assert capsys.readouterr().out == ""
+
+    main(['--data-file', data_file, '--storage', 'json', '--upcoming', '1'])
+    assert capsys.readouterr().out.split()[-1] == "A1"
+
+    with pytest.raises(SystemExit):
+        main(['--data-file', data_file, '--upcoming', '-1'])
@@ -0,0 +1,100 @@
+import time
+
+from alarm_engine import Alarm, AlarmStore, AlarmWriter
+
+
+class RecordingStorage:
+    def __init__(self):
+        self.calls = []
+
+    def apply(self, changes, snapshot):
+        self.calls.append(changes)
+        self.snapshot = snapshot
+
+
+def test_changes_in_debounce_window_are_written_once():
+    store = AlarmStore()
+    storage = RecordingStorage()
+    writer = AlarmWriter(storage, store.snapshot, debounce=0.2)
+    store.put('a', Alarm(7, 0))
+    writer.mark_dirty('a')
+    store.put('b', Alarm(8, 0))
+    writer.mark_dirty('b')
+    store.delete('a')
+    writer.mark_dirty('a')
+    writer.close()
+
+    assert storage.calls == [{'a': None, 'b': Alarm(8, 0).to_json()}]
+
+
+def test_close_writes_pending_changes_and_stops():
+    store = AlarmStore({'a': Alarm(7, 0)})
+    storage = RecordingStorage()
+    writer = AlarmWriter(storage, store.snapshot, debounce=60)
+    writer.mark_dirty('a')
+    writer.close()
+
+    assert storage.calls == [{'a': Alarm(7, 0).to_json()}]
+    assert not writer._thread.is_alive()
+
+
+def test_errors_are_reported():
+    class FailingStorage:
+        def apply(self, changes, snapshot):
+            raise OSError("disk full")
+
+    errors = []
+    store = AlarmStore({'a': Alarm(7, 0)})
+    writer = AlarmWriter(FailingStorage(), store.snapshot, debounce=0, on_error=errors.append)
+    writer.mark_dirty('a')
+    writer.close()
+
+    assert [str(e) for e in errors] == ["disk full"]
+
+
+class FlakyStorage(RecordingStorage):
+    """Lần apply đầu tiên bị lỗi"""
+
+    def __init__(self):
+        super().__init__()
+        self.attempts = 0
+
+    def apply(self, changes, snapshot):
+        self.attempts += 1
+        if self.attempts == 1:
+            raise OSError("disk full")
+        super().apply(changes, snapshot)
+
+
+def test_failed_write_is_retried():
+    errors = []
+    store = AlarmStore({'a': Alarm(7, 0)})
+    storage = FlakyStorage()
+    writer = AlarmWriter(storage, store.snapshot, debounce=0, on_error=errors.append)
+    writer.RETRY_DELAY = 0.01
+    writer.mark_dirty('a')
+    deadline = time.monotonic() + 5
+    while not storage.calls and time.monotonic() < deadline:
+        time.sleep(0.01)
+    writer.close()
+
+    assert storage.calls == [{'a': Alarm(7, 0).to_json()}]
+    assert [str(e) for e in errors] == ["disk full"]
+
+
+def test_close_retries_pending_failed_write():
+    store = AlarmStore({'a': Alarm(7, 0), 'b': Alarm(8, 0)})
+    storage = FlakyStorage()
+    writer = AlarmWriter(storage, store.snapshot, debounce=0)
+    writer.RETRY_DELAY = 60
+    writer.mark_dirty('a')
+    deadline = time.monotonic() + 5
+    while not storage.attempts and time.monotonic() < deadline:
+        time.sleep(0.01)
+    # Thay đổi mới được ghi cùng lần thử lại
+    writer.mark_dirty('b')
+    writer.close()
+
+    assert storage.attempts == 2
+    assert storage.calls == [{'a': Alarm(7, 0).to_json(), 'b': Alarm(8, 0).to_json()}]
+    assert not writer._thread.is_alive()
@@ -0,0 +1,83 @@
+import os
+import queue
+import struct
+import wave
+
+import pytest
+
+os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+pygame = pytest.importorskip('pygame')
+
+from alarm_engine import AudioEngine
+
+
+def write_wav(path, seconds=0.1, rate=22050):
+    with wave.open(str(path), 'wb') as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(rate)
+        f.writeframes(struct.pack('<h', 0) * int(rate * seconds))
+    return str(path)
+
+
+@pytest.fixture
+def audio():
+    try:
+        engine = AudioEngine(max_channels=2)
+    except pygame.error as e:
+        pytest.skip(f"Không khởi tạo được mixer: {e}")
+    yield engine
+    engine.stop_all()
+
+
+def test_preload_reports_result(audio, tmp_path):
+    results = queue.Queue()
+    good = write_wav(tmp_path / "good.wav")
+    bad = tmp_path / "bad.mp3"
+    bad.write_bytes(b"not audio")
+
+    audio.preload(good, on_done=results.put)
+    audio.preload(str(bad), on_done=results.put)
+
+    assert results.get(timeout=5) is None
+    assert results.get(timeout=5) is not None
+
+
+def test_streamed_file_plays_while_channels_are_busy(tmp_path):
+    try:
+        audio = AudioEngine(max_bytes=10_000, max_channels=1)
+    except pygame.error as e:
+        pytest.skip(f"Không khởi tạo được mixer: {e}")
+    try:
+        short = write_wav(tmp_path / "short.wav", seconds=0.01)
+        long = write_wav(tmp_path / "long.wav", seconds=2)  # Lớn hơn cache: phát stream
+        audio.play('a', short)
+        audio.play('b', short)  # Hết channel, phải chờ
+        audio.play('c', long)
+
+        assert set(audio._playing) == {'a', 'c'}
+        assert list(audio._waiting) == ['b']
+
+        audio.stop('a')
+        assert set(audio._playing) == {'b', 'c'}
+    finally:
+        audio.stop_all()
+
+
+def test_deferred_playback_errors_are_reported(tmp_path):
+    errors = []
+    try:
+        audio = AudioEngine(max_channels=1, on_error=lambda key, e: errors.append(key))
+    except pygame.error as e:
+        pytest.skip(f"Không khởi tạo được mixer: {e}")
+    try:
+        path = write_wav(tmp_path / "a.wav")
+        audio.play('a', path)
+        audio.play('b', path)
+        os.remove(path)  # Không giải mã lại được khi đến lượt 'b'
+        audio._cache.clear()
+        audio.stop('a')
+        assert errors == ['b']
+        assert not audio._waiting
+    finally:
+        audio.stop_all()
@@ -0,0 +1,173 @@
+import json
+import threading
+
+import camera_discovery
+from camera_discovery import discover_cameras, list_video_nodes, probe_parallel
+
+
+def make_devices(tmp_path, nodes):
+    """Thư mục /dev và sysfs giả: nodes = {số: (tên, index trong thiết bị)}"""
+    dev_dir = tmp_path / "dev"
+    sysfs_dir = tmp_path / "sys"
+    dev_dir.mkdir()
+    (dev_dir / "null").write_text("")
+    (dev_dir / "video_extra").write_text("")
+    for number, (name, node_index) in nodes.items():
+        (dev_dir / f"video{number}").write_text("")
+        node_dir = sysfs_dir / f"video{number}"
+        node_dir.mkdir(parents=True)
+        (node_dir / "name").write_text(name + "\n")
+        (node_dir / "index").write_text(f"{node_index}\n")
+    return str(dev_dir), str(sysfs_dir)
+
+
+def fake_caps(capture_by_node):
+    """query_caps giả theo tên file; node không có trong dict không phải thiết bị V4L2"""
+    def query_caps(path):
+        node = path.rsplit("/", 1)[-1]
+        if node not in capture_by_node:
+            return None
+        return {'driver': 'uvcvideo', 'card': f"Cam {node}", 'bus_info': f"usb-{node}",
+                'capture': capture_by_node[node]}
+    return query_caps
+
+
+class RecordingProbe:
+    def __init__(self, results):
+        self.results = results
+        self.calls = []
+
+    def __call__(self, index):
+        self.calls.append(index)
+        return self.results.get(index, False)
+
+
+def test_list_video_nodes_uses_driver_caps_then_sysfs(tmp_path):
+    dev_dir, sysfs_dir = make_devices(tmp_path, {10: ("Sysfs", 0), 2: ("Meta", 1), 0: ("Main", 0), 1: ("X", 0)})
+    query_caps = fake_caps({'video0': True, 'video1': False})
+
+    cameras = list_video_nodes(dev_dir, sysfs_dir, query_caps)
+
+    assert [camera.index for camera in cameras] == [0, 1, 2, 10]
+    main, metadata_caps, metadata, sysfs_only = cameras
+    assert main.name == "Cam video0"
+    assert main.identity == "v4l2:uvcvideo:Cam video0:usb-video0:0"
+    assert main.capture is True
+    assert metadata_caps.capture is False
+    # Không hỏi được driver: node phụ của thiết bị không quay video, node chính chưa rõ
+    assert (metadata.name, metadata.identity, metadata.capture) == ("Meta", "node:video2:Meta", False)
+    assert (sysfs_only.name, sysfs_only.capture) == ("Sysfs", None)
+
+
+def test_probe_parallel_does_not_wait_for_hung_camera():
+    release = threading.Event()
+
+    def probe(index):
+        if index == 1:
+            release.wait(5)
+        if index == 2:
+            raise RuntimeError("driver lỗi")
+        return index == 0
+
+    try:
+        results = probe_parallel([0, 1, 2], probe, timeout=0.2)
+    finally:
+        release.set()
+    assert results == {0: True, 2: False}
+
+
+def test_discover_caches_working_cameras_by_identity(tmp_path):
+    dev_dir, sysfs_dir = make_devices(tmp_path, {0: ("Main", 0), 1: ("Meta", 1), 2: ("Busy", 0)})
+    cache_path = str(tmp_path / "camera_cache.json")
+    query_caps = fake_caps({'video0': True, 'video1': False, 'video2': True})
+
+    probe = RecordingProbe({0: True, 2: False})
+    cameras = discover_cameras(dev_dir, sysfs_dir, cache_path, probe=probe, query_caps=query_caps)
+    # Node không quay video không bị thử mở
+    assert sorted(probe.calls) == [0, 2]
+    assert [camera.available for camera in cameras] == [True, False, False]
+    with open(cache_path, encoding='utf-8') as f:
+        assert list(json.load(f)) == [cameras[0].identity]
+
+    # Lần sau: camera trong cache không phải thử mở lại
+    probe = RecordingProbe({2: True})
+    cameras = discover_cameras(dev_dir, sysfs_dir, cache_path, probe=probe, query_caps=query_caps)
+    assert probe.calls == [2]
+    assert cameras[0].available and cameras[0].cached
+    assert cameras[2].available and not cameras[2].cached
+
+    # refresh thử lại tất cả; camera không mở được bị xóa khỏi cache
+    probe = RecordingProbe({2: True})
+    cameras = discover_cameras(dev_dir, sysfs_dir, cache_path, probe=probe, query_caps=query_caps,
+                               refresh=True)
+    assert sorted(probe.calls) == [0, 2]
+    assert not cameras[0].available
+    with open(cache_path, encoding='utf-8') as f:
+        assert list(json.load(f)) == [cameras[2].identity]
+
+
+def test_discover_ignores_expired_cache(tmp_path):
+    dev_dir, sysfs_dir = make_devices(tmp_path, {0: ("Main", 0)})
+    cache_path = tmp_path / "camera_cache.json"
+    query_caps = fake_caps({'video0': True})
+    identity = list_video_nodes(dev_dir, sysfs_dir, query_caps)[0].identity
+    cache_path.write_text(json.dumps({identity: 0}))
+
+    probe = RecordingProbe({0: True})
+    cameras = discover_cameras(dev_dir, sysfs_dir, str(cache_path), probe=probe, query_caps=query_caps)
+    assert probe.calls == [0]
+    assert cameras[0].available and not cameras[0].cached
+
+
+def test_discover_keeps_cache_for_camera_that_timed_out(tmp_path):
+    dev_dir, sysfs_dir = make_devices(tmp_path, {0: ("Main", 0)})
+    cache_path = str(tmp_path / "camera_cache.json")
+    query_caps = fake_caps({'video0': True})
+    discover_cameras(dev_dir, sysfs_dir, cache_path, probe=lambda index: True, query_caps=query_caps)
+
+    release = threading.Event()
+    try:
+        cameras = discover_cameras(dev_dir, sysfs_dir, cache_path, probe=lambda index: release.wait(5),
+                                   query_caps=query_caps, timeout=0.1, refresh=True)
+    finally:
+        release.set()
+    assert not cameras[0].available
+    with open(cache_path, encoding='utf-8') as f:
+        assert list(json.load(f)) == [cameras[0].identity]
+
+
+def test_discover_linux_without_video_nodes_finds_nothing(tmp_path, monkeypatch):
+    monkeypatch.setattr(camera_discovery.sys, 'platform', 'linux')
+    dev_dir, sysfs_dir = make_devices(tmp_path, {})
+    probe = RecordingProbe({})
+    assert discover_cameras(dev_dir, sysfs_dir, None, probe=probe) == []
+    assert probe.calls == []
+
+
+def test_discover_falls_back_to_indices_without_dev_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(camera_discovery.sys, 'platform', 'win32')
+    probe = RecordingProbe({1: True})
+    cameras = discover_cameras(str(tmp_path / "missing"), str(tmp_path / "sys"), None,
+                               probe=probe, max_index=4)
+    assert sorted(probe.calls) == [0, 1, 2, 3]
+    assert [camera.index for camera in cameras if camera.available] == [1]
+    assert all(camera.identity is None for camera in cameras)
+
+
+def test_main_lists_cameras_from_given_directories(tmp_path, monkeypatch, capsys):
+    dev_dir, sysfs_dir = make_devices(tmp_path, {0: ("Main", 0), 1: ("Meta", 1)})
+    cache_path = tmp_path / "camera_cache.json"
+    # Thiết bị giả là file thường: không hỏi được driver, dựa vào sysfs
+    probe = RecordingProbe({0: True})
+    monkeypatch.setattr(camera_discovery, 'discover_cameras',
+                        lambda *args, **kwargs: discover_cameras(*args, probe=probe, **kwargs))
+
+    camera_discovery.main(['--dev-dir', dev_dir, '--sysfs-dir', sysfs_dir, '--cache', str(cache_path),
+                           '--timeout', '1'])
+
+    output = capsys.readouterr().out
+    assert "Camera 0 (Main): Có sẵn" in output
+    assert "Camera 1 (Meta): Không quay video" in output
+    assert "Tìm thấy 1 camera" in output
+    assert probe.calls == [0]
+    assert cache_path.exists()
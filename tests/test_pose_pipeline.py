@@ -0,0 +1,275 @@
+import importlib
+import sys
+import threading
+import types
+
+import pytest
+
+import pose_detector
+from pose_detector import AdaptivePoseTracker
+
+KEY_POINTS = {'NOSE': 0, 'LEFT_SHOULDER': 1, 'RIGHT_SHOULDER': 2}
+
+
+class Frame:
+    """Frame giả: chỉ cần shape và cắt vùng"""
+
+    def __init__(self, index, shape=(480, 640, 3)):
+        self.index = index
+        self.shape = shape
+
+    def __getitem__(self, key):
+        rows, cols = key
+        return Frame(self.index, (rows.stop - rows.start, cols.stop - cols.start, 3))
+
+
+class FakeVideoCapture:
+    videos = {}  # Đường dẫn -> (số frame, fps) của các "video đã quay"
+
+    def __init__(self, source):
+        self.frames, self.fps = self.videos.get(source, (0, 0.0))
+        self.opened = source in self.videos
+        self.position = 0
+        self.released = False
+
+    def isOpened(self):
+        return self.opened
+
+    def read(self):
+        if self.position >= self.frames:
+            return False, None
+        self.position += 1
+        return True, Frame(self.position - 1)
+
+    def get(self, prop):
+        if prop == FakeCv2.CAP_PROP_FPS:
+            return self.fps
+        # Vị trí của frame vừa đọc (ms)
+        return (self.position - 1) * 1000.0 / self.fps
+
+    def release(self):
+        self.released = True
+
+
+class FakeCv2(types.ModuleType):
+    CAP_PROP_FPS = 5
+    CAP_PROP_POS_MSEC = 0
+    COLOR_BGR2RGB = 4
+    FONT_HERSHEY_SIMPLEX = 0
+    VideoCapture = FakeVideoCapture
+
+    def __init__(self, keys=()):
+        super().__init__('cv2')
+        self.keys = list(keys)
+        self.shown = 0
+
+    def flip(self, frame, axis):
+        return frame
+
+    def cvtColor(self, frame, code):
+        return frame
+
+    def putText(self, *args):
+        pass
+
+    def imshow(self, title, frame):
+        self.shown += 1
+
+    def waitKey(self, delay):
+        return self.keys.pop(0) if self.keys else ord('q')
+
+    def destroyAllWindows(self):
+        pass
+
+
+class Landmark:
+    def __init__(self, x, y, visibility=1.0):
+        self.x = x
+        self.y = y
+        self.z = 0.0
+        self.visibility = visibility
+
+
+class FakeDetector:
+    """Detector giả: luôn thấy mũi và hai vai ở cùng vị trí"""
+
+    def __init__(self, points=((0.5, 0.4), (0.4, 0.5), (0.6, 0.5)), straight=True):
+        self.points = points
+        self.straight = straight
+        self.runs = []  # Kích thước ảnh của mỗi lần chạy model
+        self.mp_pose = types.SimpleNamespace(PoseLandmark=KEY_POINTS)
+        self.pose = types.SimpleNamespace(process=self._process)
+        self.closed = False
+
+    def _process(self, rgb):
+        self.runs.append(rgb.shape[:2])
+        # Mỗi lần trả về landmark mới vì tracker sửa tọa độ tại chỗ
+        landmarks = [Landmark(x, y) for x, y in self.points]
+        return types.SimpleNamespace(pose_landmarks=types.SimpleNamespace(landmark=landmarks))
+
+    def detect_sitting_straight(self, landmarks):
+        return landmarks is not None and self.straight
+
+    def close(self):
+        self.closed = True
+
+
+class FakePool:
+    def __init__(self, cameras=None):
+        self.cameras = cameras or {}
+        self.acquired = []
+        self.released = []
+        self.detectors = []
+
+    def acquire_detector(self):
+        detector = FakeDetector()
+        self.detectors.append(detector)
+        return detector
+
+    def release_detector(self, detector):
+        self.released.append(detector)
+
+    def acquire_camera(self, camera_id):
+        self.acquired.append(camera_id)
+        return self.cameras.get(camera_id)
+
+    def release_camera(self, camera_id, cap, keep=True):
+        self.released.append((camera_id, cap))
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def fake_cv2(monkeypatch):
+    cv2 = FakeCv2()
+    monkeypatch.setitem(sys.modules, 'cv2', cv2)
+    monkeypatch.setattr(pose_detector, 'cv2', cv2)
+    monkeypatch.setattr(FakeVideoCapture, 'videos', {})
+    return cv2
+
+
+@pytest.fixture
+def pose_test(fake_cv2, monkeypatch):
+    """test_pose_detection.py dùng cv2 giả"""
+    module = importlib.import_module('test_pose_detection')
+    monkeypatch.setattr(module, 'cv2', fake_cv2)
+    return module
+
+
+def test_latest_frame_slot_keeps_newest_and_counts_dropped(pose_test):
+    slot = pose_test.LatestFrameSlot()
+    slot.put(1)
+    slot.put(2)
+    assert slot.get(timeout=0) == 2
+    assert slot.dropped == 1
+    assert slot.get(timeout=0) is None
+
+    # block=True chờ phần tử cũ được lấy thay vì ghi đè
+    slot.put(3)
+    writer = threading.Thread(target=slot.put, args=(4,), kwargs={'block': True})
+    writer.start()
+    assert slot.get(timeout=1) == 3
+    writer.join(1)
+    assert slot.get(timeout=1) == 4
+    assert slot.dropped == 1
+
+    slot.close()
+    assert slot.closed
+    assert slot.get() is None
+
+
+@pytest.mark.parametrize('adaptive', [False, True])
+def test_pipeline_processes_every_frame_of_video_when_not_realtime(pose_test, adaptive):
+    FakeVideoCapture.videos['sitting.mp4'] = (90, 30.0)
+    pool = FakePool()
+    pipeline = pose_test.PosePipeline('sitting.mp4', pool, realtime=False, adaptive=adaptive,
+                                      required_time=1.0)
+    assert pipeline.start()
+    cap = pipeline._cap
+    results = []
+    while True:
+        result = pipeline.results.get(timeout=5)
+        if result is None:
+            break
+        results.append(result)
+    pipeline.stop()
+
+    assert pipeline.captured == 90
+    assert pipeline.frames.dropped == 0
+    assert pipeline.processed == 90
+    assert pipeline.error is None
+    # Thời điểm lấy theo vị trí trong video, không theo tốc độ máy
+    assert results[-1].timestamp == pytest.approx(89 / 30.0)
+    assert pipeline.hold_start == 0.0
+    assert cap.released
+    assert pool.released == pool.detectors
+    assert len(pool.detectors) == (2 if adaptive else 1)
+
+
+def test_pipeline_reports_missing_video_and_camera(pose_test):
+    pool = FakePool()
+    assert not pose_test.PosePipeline('missing.mp4', pool).start()
+    assert not pose_test.PosePipeline(2, pool).start()
+    assert pool.acquired == [2]
+    assert pool.detectors == []
+
+
+def test_serial_mode_uses_given_camera(pose_test, monkeypatch):
+    def select_camera():
+        raise AssertionError("không được hỏi người dùng khi đã chọn camera")
+
+    monkeypatch.setattr(pose_test, 'select_camera', select_camera)
+    FakeVideoCapture.videos['camera3'] = (100, 30.0)
+    camera = FakeVideoCapture('camera3')
+    pool = FakePool({3: camera})
+
+    pose_test.test_pose_detection(adaptive=False, pool=pool, camera_id=3)
+
+    assert pool.acquired == [3]
+    assert (3, camera) in pool.released
+    assert pose_test.cv2.shown == 1
+
+
+def test_tracker_reuses_result_while_pose_is_stable(fake_cv2):
+    detector = FakeDetector()
+    # Vùng cắt luôn quá lớn: chỉ chạy toàn frame
+    tracker = AdaptivePoseTracker(detector, max_skip=3, max_skip_interval=0.25, stable_frames=3,
+                                  max_roi_fraction=0.0, roi_detector=FakeDetector())
+    fresh = [tracker.process(Frame(i), timestamp=i / 30.0)[2] for i in range(20)]
+
+    # 4 lần đầu để ổn định (lần đầu chưa có kết quả trước để so), sau đó chạy 1 bỏ 3
+    assert fresh[:8] == [True, True, True, True, False, False, False, True]
+    assert tracker.skipped == fresh.count(False) == 12
+    assert tracker.full_runs == len(detector.runs) == 8
+    assert tracker.roi_runs == 0
+
+    # force luôn chạy model
+    assert tracker.process(Frame(20), timestamp=20 / 30.0, force=True)[2]
+    assert tracker.full_runs == 9
+
+
+def test_tracker_skips_nothing_when_frames_are_far_apart(fake_cv2):
+    tracker = AdaptivePoseTracker(FakeDetector(), max_skip_interval=0.25, max_roi_fraction=0.0,
+                                  roi_detector=FakeDetector())
+    for i in range(10):
+        tracker.process(Frame(i), timestamp=float(i))
+    assert tracker.skipped == 0
+    assert tracker.full_runs == 10
+
+
+def test_tracker_maps_upper_body_crop_back_to_full_frame(fake_cv2):
+    detector = FakeDetector()
+    roi_detector = FakeDetector(points=((0.5, 0.5), (0.25, 0.5), (0.75, 0.5)))
+    tracker = AdaptivePoseTracker(detector, max_skip=0, roi_detector=roi_detector)
+
+    tracker.process(Frame(0), timestamp=0.0)
+    assert tracker._roi == (128, 64, 512, 432)
+    landmarks, is_straight, fresh = tracker.process(Frame(1), timestamp=1 / 30.0)
+
+    assert fresh and is_straight
+    assert roi_detector.runs == [(368, 384)]
+    assert (tracker.full_runs, tracker.roi_runs) == (1, 1)
+    nose = landmarks.landmark[0]
+    assert nose.x == pytest.approx((128 + 0.5 * 384) / 640)
+    assert nose.y == pytest.approx((64 + 0.5 * 368) / 480)
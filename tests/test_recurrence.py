@@ -0,0 +1,85 @@
+from datetime import datetime
+
+import pytest
+
+from alarm_engine import Recurrence
+
+# Chủ nhật
+NOW = datetime(2026, 10, 18, 8, 0, 30)
+
+
+def test_parse_and_to_rrule_round_trip():
+    recurrence = Recurrence.parse("RRULE:freq=weekly;interval=2;byday=fr,mo")
+    assert (recurrence.freq, recurrence.interval, recurrence.weekdays) == ('WEEKLY', 2, (0, 4))
+    assert recurrence.to_rrule() == "FREQ=WEEKLY;INTERVAL=2;BYDAY=MO,FR"
+    assert Recurrence.parse(recurrence.to_rrule()) == recurrence
+    assert Recurrence.parse("") == Recurrence()
+    assert Recurrence().to_rrule() == "FREQ=DAILY"
+
+
+def test_parse_daily_with_weekdays_means_weekly():
+    recurrence = Recurrence.parse("FREQ=DAILY;BYDAY=MO,TU,WE,TH,FR")
+    assert recurrence.to_rrule() == "FREQ=WEEKLY;BYDAY=MO,TU,WE,TH,FR"
+    assert recurrence.describe() == "T2, T3, T4, T5, T6"
+
+
+def test_parse_shares_one_object_per_rule():
+    assert Recurrence.parse("FREQ=HOURLY;INTERVAL=4") is Recurrence.parse("FREQ=HOURLY;INTERVAL=4")
+    assert len({Recurrence.parse("FREQ=DAILY"), Recurrence(), Recurrence('HOURLY')}) == 2
+
+
+@pytest.mark.parametrize('rule', [
+    "FREQ=MONTHLY",
+    "FREQ=DAILY;COUNT=3",
+    "FREQ=DAILY;INTERVAL=0",
+    "FREQ=DAILY;INTERVAL=x",
+    "FREQ=WEEKLY;BYDAY=XX",
+    "FREQ=WEEKLY",
+    "FREQ=HOURLY;BYDAY=MO",
+    "FREQ=DAILY;INTERVAL=2;BYDAY=MO",
+    "FREQ",
+])
+def test_parse_rejects_unsupported_rules(rule):
+    with pytest.raises(ValueError):
+        Recurrence.parse(rule)
+
+
+def test_describe():
+    assert Recurrence().describe() == "Hằng ngày"
+    assert Recurrence('DAILY', 3).describe() == "Mỗi 3 ngày"
+    assert Recurrence('HOURLY', 2).describe() == "Mỗi 2 giờ"
+    assert Recurrence('WEEKLY', 2, (6, 5)).describe() == "T7, CN (mỗi 2 tuần)"
+
+
+def test_daily_new_alarm_rings_today_or_tomorrow():
+    daily = Recurrence()
+    assert daily.next_after(NOW, 9, 15) == datetime(2026, 10, 18, 9, 15)
+    assert daily.next_after(NOW, 8, 0) == datetime(2026, 10, 19, 8, 0)
+
+
+def test_daily_interval_counts_from_last_occurrence():
+    every_two_days = Recurrence('DAILY', 2)
+    last = datetime(2026, 10, 10, 7, 0)
+    assert every_two_days.next_after(NOW, 7, 0, last=last) == datetime(2026, 10, 20, 7, 0)
+    # Lần kêu trước chưa qua thì giữ nguyên
+    assert every_two_days.next_after(NOW, 7, 0, last=datetime(2026, 10, 19, 7, 0)) == datetime(2026, 10, 19, 7, 0)
+
+
+def test_hourly_steps_from_alarm_time():
+    every_three_hours = Recurrence('HOURLY', 3)
+    assert every_three_hours.next_after(NOW, 7, 0) == datetime(2026, 10, 18, 10, 0)
+    assert every_three_hours.next_after(NOW, 8, 0, last=datetime(2026, 10, 18, 8, 0)) == datetime(2026, 10, 18, 11, 0)
+
+
+def test_weekly_picks_next_selected_weekday():
+    weekdays = Recurrence('WEEKLY', 1, (0, 2, 4))
+    assert weekdays.next_after(NOW, 7, 0) == datetime(2026, 10, 19, 7, 0)
+    assert weekdays.next_after(datetime(2026, 10, 19, 7, 0), 7, 0) == datetime(2026, 10, 21, 7, 0)
+    assert Recurrence('WEEKLY', 1, (6,)).next_after(NOW, 9, 0) == datetime(2026, 10, 18, 9, 0)
+
+
+def test_weekly_interval_skips_weeks_after_last_occurrence():
+    every_other_week = Recurrence.parse("FREQ=WEEKLY;INTERVAL=2;BYDAY=MO,WE")
+    last = datetime(2026, 10, 12, 7, 0)
+    assert every_other_week.next_after(last, 7, 0, last=last) == datetime(2026, 10, 14, 7, 0)
+    assert every_other_week.next_after(NOW, 7, 0, last=datetime(2026, 10, 14, 7, 0)) == datetime(2026, 10, 26, 7, 0)
@@ -0,0 +1,75 @@
+import random
+from datetime import datetime, timedelta
+
+from alarm_engine import AlarmScheduler
+
+
+def test_wait_next_returns_events_in_order():
+    scheduler = AlarmScheduler(lead_time=1)
+    past = datetime.now() - timedelta(seconds=10)
+    scheduler.schedule('b', past + timedelta(seconds=2))
+    scheduler.schedule('a', past)
+
+    events = [scheduler.wait_next() for _ in range(4)]
+    assert events == [('prepare', 'a'), ('fire', 'a'), ('prepare', 'b'), ('fire', 'b')]
+
+
+def test_cancel_and_reschedule_drop_stale_entries():
+    scheduler = AlarmScheduler()
+    past = datetime.now() - timedelta(seconds=10)
+    scheduler.schedule('a', past)
+    scheduler.schedule('b', past + timedelta(seconds=1))
+    scheduler.schedule('a', past + timedelta(seconds=2))
+    scheduler.cancel('b')
+
+    assert scheduler.wait_next() == ('fire', 'a')
+    assert scheduler.upcoming(5) == []
+
+
+def test_upcoming_includes_repeats():
+    scheduler = AlarmScheduler()
+    start = datetime(2030, 1, 1, 7, 0)
+    scheduler.schedule('daily', start)
+    scheduler.schedule('once', start + timedelta(hours=30))
+
+    results = scheduler.upcoming(
+        3, lambda alarm_id, when: when + timedelta(days=1) if alarm_id == 'daily' else None
+    )
+    assert results == [
+        (start, 'daily'),
+        (start + timedelta(days=1), 'daily'),
+        (start + timedelta(hours=30), 'once'),
+    ]
+
+
+def test_reset_parses_iso_strings_lazily():
+    scheduler = AlarmScheduler(lead_time=300)
+    base = datetime(2030, 1, 1)
+    times = {f'a{i}': base + timedelta(minutes=i) for i in range(1000)}
+    items = list(times.items())
+    random.Random(1).shuffle(items)
+    scheduler.reset((alarm_id, when.isoformat()) for alarm_id, when in items)
+
+    assert scheduler._heap == []
+    expected = sorted((when, alarm_id) for alarm_id, when in times.items())[:5]
+    assert scheduler.upcoming(5) == expected
+    # upcoming chỉ đọc, không chuyển mục nào sang heap
+    assert len(scheduler._pending) == 1000
+
+
+def test_pending_alarms_fire_in_order_with_mixed_formats():
+    scheduler = AlarmScheduler()
+    past = datetime.now().replace(microsecond=0) - timedelta(seconds=30)
+    scheduler.reset([
+        ('late', (past + timedelta(seconds=2)).isoformat()),
+        ('micro', (past + timedelta(seconds=1, microseconds=5)).isoformat()),
+        ('early', past.isoformat()),
+        ('datetime', past + timedelta(seconds=1)),
+    ])
+    scheduler.cancel('late')
+
+    assert [scheduler.wait_next() for _ in range(3)] == [
+        ('fire', 'early'), ('fire', 'datetime'), ('fire', 'micro'),
+    ]
+    assert scheduler.upcoming(5) == []
+    assert scheduler._pending == []
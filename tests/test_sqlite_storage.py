@@ -0,0 +1,121 @@
+import json
+from datetime import datetime, timedelta
+
+import pytest
+
+from alarm_engine import Alarm, AlarmEngine, SqliteAlarmStorage
+
+
+def record(hour, minute, alarm_time, enabled=True, name=None):
+    return Alarm(hour, minute, name=name, alarm_time=alarm_time.isoformat(),
+                 enabled=enabled).to_json()
+
+
+@pytest.fixture
+def storage(tmp_path):
+    storage = SqliteAlarmStorage(str(tmp_path / "alarms_data.json"))
+    yield storage
+    storage.close()
+
+
+def test_next_due_connects_lazily(storage):
+    # Chưa gọi load() vẫn truy vấn được
+    assert storage.next_due(3) == []
+    assert storage.due_before(datetime.now()) == []
+
+
+def test_next_due_uses_alarm_time_order(storage):
+    base = datetime(2030, 1, 1, 7, 0)
+    storage.apply({
+        'late': record(9, 0, base + timedelta(hours=2)),
+        'early': record(7, 0, base),
+        'off': record(6, 0, base - timedelta(hours=1), enabled=False),
+        'mid': record(8, 0, base + timedelta(hours=1)),
+    })
+
+    assert [alarm_id for alarm_id, _ in storage.next_due(2)] == ['early', 'mid']
+    assert [alarm_id for alarm_id, _ in storage.next_due(5, after=base)] == ['mid', 'late']
+    assert [alarm_id for alarm_id, _ in storage.due_before(base)] == ['early']
+
+    alarm_id, data = storage.next_due(1)[0]
+    assert Alarm.from_json(data).alarm_time == base
+
+
+def test_round_trip_keeps_extra_fields(storage):
+    alarm = Alarm(6, 30, name="Dậy", alarm_time=datetime(2030, 1, 1, 6, 30),
+                  math_count=3, dismiss_mode=Alarm.DISMISS_POSE, pose_seconds=5)
+    storage.apply({'a': alarm.to_json()})
+    assert dict(storage.load()) == {'a': alarm.to_json()}
+
+
+def test_migrates_json_file_once(tmp_path):
+    path = tmp_path / "alarms_data.json"
+    data = {'a': Alarm(7, 0, alarm_time=datetime(2030, 1, 1, 7, 0)).to_json()}
+    path.write_text(json.dumps(data), encoding='utf-8')
+
+    storage = SqliteAlarmStorage(str(path))
+    assert dict(storage.load()) == data
+    storage.close()
+    assert (tmp_path / "alarms_data.db").exists()
+
+
+def test_migration_replays_journal_over_json_snapshot(tmp_path):
+    path = tmp_path / "alarms_data.json"
+    base = datetime(2030, 1, 1, 7, 0)
+    path.write_text(json.dumps({'a': record(7, 0, base), 'b': record(8, 0, base)}), encoding='utf-8')
+    # Lần gộp bị ngắt để lại journal cũ, các thay đổi sau đó nằm trong journal mới
+    (tmp_path / "alarms_data.json.journal.old").write_text(
+        json.dumps({'op': 'delete', 'id': 'a'}) + "\n", encoding='utf-8')
+    (tmp_path / "alarms_data.json.journal").write_text(
+        json.dumps({'op': 'put', 'id': 'b', 'alarm': record(8, 30, base, name="sửa")}) + "\n" +
+        json.dumps({'op': 'put', 'id': 'c', 'alarm': record(9, 0, base)}) + "\n", encoding='utf-8')
+
+    storage = SqliteAlarmStorage(str(path))
+    try:
+        assert dict(storage.load()) == {'b': record(8, 30, base, name="sửa"), 'c': record(9, 0, base)}
+    finally:
+        storage.close()
+
+
+def test_migrates_journal_without_snapshot(tmp_path):
+    path = tmp_path / "alarms_data.json"
+    base = datetime(2030, 1, 1, 7, 0)
+    (tmp_path / "alarms_data.json.journal").write_text(
+        json.dumps({'op': 'put', 'id': 'a', 'alarm': record(7, 0, base)}) + "\n", encoding='utf-8')
+
+    storage = SqliteAlarmStorage(str(path))
+    try:
+        assert dict(storage.load()) == {'a': record(7, 0, base)}
+    finally:
+        storage.close()
+
+
+def test_load_upcoming_only_reads_needed_alarms(tmp_path):
+    path = str(tmp_path / "alarms_data.json")
+    now = datetime.now().replace(second=0, microsecond=0)
+    storage = SqliteAlarmStorage(path)
+    storage.apply({
+        f'future{i}': record(0, 0, now + timedelta(days=i + 1)) for i in range(20)
+    })
+    # Báo thức quá hạn luôn được load (và dời tới) dù không nằm trong N gần nhất
+    overdue = now - timedelta(days=3, hours=1)
+    storage.apply({'overdue': record(overdue.hour, overdue.minute, overdue)})
+    storage.close()
+
+    engine = AlarmEngine(path, backend='sqlite')
+    try:
+        assert engine.load_upcoming(2)
+        assert set(engine.alarms) == {'overdue', 'future0', 'future1'}
+        assert engine.alarms['overdue'].alarm_time > now
+        engine.schedule_all()
+        assert [alarm_id for _, alarm_id in engine.upcoming(2)][0] == 'overdue'
+    finally:
+        engine.close()
+
+
+def test_load_upcoming_unsupported_backend(tmp_path):
+    engine = AlarmEngine(str(tmp_path / "alarms_data.json"), backend='json')
+    try:
+        assert not engine.load_upcoming(1)
+    finally:
+        engine.close()
@@ -0,0 +1,134 @@
+import json
+from datetime import datetime
+
+import pytest
+
+import alarm_engine
+from alarm_engine import Alarm, JournalAlarmStorage, JsonAlarmStorage, iter_json_object
+
+
+def alarms(*ids):
+    return {alarm_id: Alarm(7, i, name=alarm_id, alarm_time=datetime(2030, 1, 1, 7, i))
+            for i, alarm_id in enumerate(ids)}
+
+
+def records(snapshot):
+    return {alarm_id: alarm.to_json() for alarm_id, alarm in snapshot.items()}
+
+
+@pytest.mark.parametrize('chunk_size', [1, 7, 64 * 1024])
+def test_iter_json_object_matches_json_load(tmp_path, chunk_size):
+    data = {'a': {'time': [7, 0], 'name': 'Dậy "sớm"', 'n': 12345.5e3},
+            'b': [1, 2, {'c': None}], 'd': 10, 'e': True}
+    path = tmp_path / "data.json"
+    path.write_text(json.dumps(data, ensure_ascii=False, indent=2), encoding='utf-8')
+
+    assert dict(iter_json_object(str(path), chunk_size=chunk_size)) == data
+
+
+def test_iter_json_object_empty_missing_and_invalid(tmp_path):
+    assert list(iter_json_object(str(tmp_path / "missing.json"))) == []
+    empty = tmp_path / "empty.json"
+    empty.write_text(" { } ", encoding='utf-8')
+    assert list(iter_json_object(str(empty))) == []
+    bad = tmp_path / "bad.json"
+    bad.write_text('{"a": 1} x', encoding='utf-8')
+    with pytest.raises(json.JSONDecodeError):
+        list(iter_json_object(str(bad)))
+
+
+def test_json_storage_writes_snapshot(tmp_path):
+    path = str(tmp_path / "alarms_data.json")
+    storage = JsonAlarmStorage(path)
+    snapshot = alarms('a', 'b')
+    storage.apply({'a': snapshot['a'].to_json(), 'b': snapshot['b'].to_json()}, snapshot)
+    del snapshot['a']
+    storage.apply({'a': None}, snapshot)
+
+    assert json.loads(open(path, encoding='utf-8').read()) == records(snapshot)
+    assert dict(JsonAlarmStorage(path).load()) == records(snapshot)
+    storage.apply({'b': None}, {})
+    assert dict(JsonAlarmStorage(path).load()) == {}
+
+
+def test_journal_replays_changes_over_snapshot(tmp_path):
+    path = str(tmp_path / "alarms_data.json")
+    storage = JournalAlarmStorage(path)
+    list(storage.load())
+    snapshot = alarms('a', 'b', 'c')
+    storage.apply(records(snapshot), snapshot)
+    changed = snapshot['b'].replace(name='mới')
+    snapshot['b'] = changed
+    del snapshot['a']
+    storage.apply({'b': changed.to_json(), 'a': None}, snapshot)
+    storage.close()
+
+    reopened = JournalAlarmStorage(path)
+    assert dict(reopened.load()) == records(snapshot)
+    assert reopened._journal_entries == 5
+    reopened.close()
+
+
+def test_journal_can_apply_and_close_without_load(tmp_path):
+    path = str(tmp_path / "alarms_data.json")
+    JournalAlarmStorage(path).close()
+    (tmp_path / "alarms_data.json.journal").write_text('{"op": "delete", "id": "x"}\n{"op": "pu',
+                                                      encoding='utf-8')
+
+    storage = JournalAlarmStorage(path)
+    snapshot = alarms('a')
+    storage.apply(records(snapshot), snapshot)
+    storage.close()
+
+    # Dòng ghi dở vẫn được tách khỏi các dòng ghi thêm
+    reopened = JournalAlarmStorage(path)
+    assert dict(reopened.load()) == records(snapshot)
+    assert reopened._journal_entries == 2
+    reopened.close()
+
+
+def test_journal_compaction_writes_snapshot_and_empties_journal(tmp_path):
+    path = str(tmp_path / "alarms_data.json")
+    storage = JournalAlarmStorage(path, compact_threshold=3)
+    list(storage.load())
+    snapshot = {}
+    for alarm_id, alarm in alarms('a', 'b', 'c', 'd').items():
+        snapshot = {**snapshot, alarm_id: alarm}
+        storage.apply({alarm_id: alarm.to_json()}, snapshot)
+    storage.close()
+
+    assert dict(iter_json_object(path)) == records(alarms('a', 'b', 'c'))
+    reopened = JournalAlarmStorage(path, compact_threshold=3)
+    assert dict(reopened.load()) == records(snapshot)
+    assert reopened._journal_entries == 1
+    reopened.close()
+
+
+def test_journal_keeps_old_journal_when_compaction_fails(tmp_path, monkeypatch):
+    path = str(tmp_path / "alarms_data.json")
+    storage = JournalAlarmStorage(path, compact_threshold=2)
+    list(storage.load())
+    write = alarm_engine.write_json_atomic
+
+    def failing_write(*args):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(alarm_engine, 'write_json_atomic', failing_write)
+    snapshot = {}
+    for alarm_id, alarm in alarms('a', 'b', 'c', 'd').items():
+        snapshot = {**snapshot, alarm_id: alarm}
+        storage.apply({alarm_id: alarm.to_json()}, snapshot)
+        storage._wait_for_compaction()
+
+    # Lần gộp thứ hai không được ghi đè journal cũ chưa gộp
+    reopened = JournalAlarmStorage(path)
+    assert dict(reopened.load()) == records(snapshot)
+    assert reopened._journal_entries == 4
+    reopened.close()
+
+    monkeypatch.setattr(alarm_engine, 'write_json_atomic', write)
+    snapshot = {**snapshot, **alarms('e')}
+    storage.apply({'e': snapshot['e'].to_json()}, snapshot)
+    storage.close()
+    assert dict(iter_json_object(path)) == records(snapshot)
+    assert not (tmp_path / "alarms_data.json.journal.old").exists()